@@ -7,6 +7,7 @@ Replaces words with phoneme tags for correct pronunciation
 import csv
 import re
 import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
 import argparse
 
 def load_pronunciation_dictionary(dict_path):
@@ -100,6 +101,23 @@ def process_ssml_element(element, pronunciations, phoneme_format='ipa'):
         if child.tail:
             child.tail = apply_pronunciations_to_text(child.tail, pronunciations, phoneme_format)
 
+def unescape_pronunciation_tags(content):
+    """Turn escaped phoneme and sub tags (inserted as text) back into markup"""
+    content = content.replace('&lt;phoneme', '<phoneme')
+    content = content.replace('&gt;', '>')  # Fix all escaped > in tags
+    content = content.replace('&lt;/phoneme>', '</phoneme>')
+    content = content.replace('&lt;sub', '<sub')
+    content = content.replace('&lt;/sub>', '</sub>')
+    return content
+
+def apply_pronunciations_to_string(ssml_content, dict_path, phoneme_format='ipa'):
+    """Apply pronunciation dictionary to SSML content (without <speak>) in memory"""
+    pronunciations = load_pronunciation_dictionary(dict_path)
+    root = ET.fromstring(f"<root>{ssml_content}</root>")
+    process_ssml_element(root, pronunciations, phoneme_format)
+    content = escape(root.text or "") + "".join(ET.tostring(child, encoding='unicode') for child in root)
+    return unescape_pronunciation_tags(content)
+
 def apply_pronunciations_to_ssml(input_file, output_file, dict_path, phoneme_format='ipa'):
     """Apply pronunciation dictionary to an SSML file"""
     # Load pronunciation dictionary
@@ -120,11 +138,7 @@ def apply_pronunciations_to_ssml(input_file, output_file, dict_path, phoneme_for
         content = f.read()
     
     # Fix all escaped entities in phoneme and sub tags
-    content = content.replace('&lt;phoneme', '<phoneme')
-    content = content.replace('&gt;', '>')  # Fix all escaped > in tags
-    content = content.replace('&lt;/phoneme>', '</phoneme>')
-    content = content.replace('&lt;sub', '<sub')
-    content = content.replace('&lt;/sub>', '</sub>')
+    content = unescape_pronunciation_tags(content)
     
     # Pretty print adjustments
     content = content.replace('><', '>\n<')
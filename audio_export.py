@@ -0,0 +1,228 @@
+"""
+Parallel segmented export to MP3, Opus and AAC (M4B)
+
+The stitched PCM is cut into one segment per core, at the quietest moment
+near each ideal cut, and every segment is encoded by its own ffmpeg process.
+Each process reads its segment once and writes it in every requested
+format, so MP3, Opus and M4B come from a single pass over the samples.
+The segments of each format are then joined by stream copy (no re-encode).
+
+Encoders delay their output by a priming period and pad the end of a
+stream to a whole frame, so segments encoded on their own would each add
+up to a frame at every seam. Instead, each segment after the first starts
+WARMUP_MS early, on the format's frame grid, and the frames before its seam
+are dropped again, as are the frames after the next seam: the joined
+frames are timed exactly as one encoder would have timed them, and the
+file keeps the duration of the PCM.
+"""
+
+import os
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from pcm_buffer import CHANNELS, find_ffmpeg
+
+# Segments shorter than this are not worth a process of their own
+MIN_SEGMENT_SECONDS = 60
+
+# A cut is placed in the quietest window this long...
+SEAM_WINDOW_MS = 100
+
+# ...within this distance of the ideal cut
+SEAM_SEARCH_SECONDS = 10
+
+# Audio encoded before a seam and dropped, so the encoder is past its
+# priming and up to speed where the segment's kept frames start
+WARMUP_MS = 250
+
+# Output formats by file extension: ffmpeg encoder options, the muxer of
+# the final file, the extension and muxer of its segments, extra encoder
+# options for segments and for those after the first, bitstream filters for
+# joining them, the samples per codec frame (at codec_rate if the codec has
+# a fixed rate), and the encoder's priming in frames where the segments
+# don't record it. A segment's first frames are dropped, so MP3 segments are
+# encoded without the bit reservoir, which would let a kept frame borrow
+# bytes from a dropped one; only the first keeps the LAME header that
+# records the priming
+FORMATS = {
+    "mp3": {"codec": ["-c:a", "libmp3lame"], "muxer": "mp3", "segment": ("mp3", "mp3"),
+            "segment_options": ["-reservoir", "0"], "later_segment_options": ["-write_xing", "0"], "join": [],
+            "frame_samples": 1152, "codec_rate": None, "priming_frames": 0},
+    "opus": {"codec": ["-c:a", "libopus", "-b:a", "32k", "-application", "voip"], "muxer": "ogg",
+             "segment": ("opus", "ogg"), "segment_options": [], "later_segment_options": [], "join": [],
+             "frame_samples": 960, "codec_rate": 48000, "priming_frames": 0},
+    "m4b": {"codec": ["-c:a", "aac", "-b:a", "64k"], "muxer": "mp4", "segment": ("aac", "adts"),
+            "segment_options": [], "later_segment_options": [], "join": ["aac_adtstoasc"],
+            "frame_samples": 1024, "codec_rate": None, "priming_frames": 1},
+}
+FORMATS["ogg"] = FORMATS["opus"]
+FORMATS["m4a"] = FORMATS["aac"] = FORMATS["m4b"]
+
+# Samples written to ffmpeg per pipe write
+FEED_SAMPLES = 1 << 16
+
+def output_format(path):
+    """The FORMATS key for an output path (MP3 for unknown extensions)"""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return extension if extension in FORMATS else "mp3"
+
+def frame_samples(name, sample_rate):
+    """Samples per codec frame of a format, at sample_rate"""
+    spec = FORMATS[name]
+    if spec["muxer"] == "mp3" and sample_rate < 32000:
+        # MPEG-2 and 2.5 Layer III frames are half as long
+        return spec["frame_samples"] // 2
+    if spec["codec_rate"] is None:
+        return spec["frame_samples"]
+    return spec["frame_samples"] * sample_rate // spec["codec_rate"]
+
+def seam_points(samples, sample_rate, segments):
+    """
+    Sample indices to cut a memory-mapped int16 array at, one fewer than
+    segments: for each ideal cut, the start of the quietest SEAM_WINDOW_MS
+    window nearby.
+    """
+    import numpy as np
+
+    window = max(1, sample_rate * SEAM_WINDOW_MS // 1000)
+    search = sample_rate * SEAM_SEARCH_SECONDS
+    cuts = []
+    for index in range(1, segments):
+        ideal = len(samples) * index // segments
+        start = max(ideal - search, cuts[-1] + window if cuts else 0)
+        end = min(ideal + search, len(samples) - window)
+        if end <= start:
+            continue
+        region = np.abs(samples[start:end + window].astype(np.int32))
+        # Sum of |x| over every window, from a running total
+        totals = np.concatenate(([0], np.cumsum(region, dtype=np.int64)))
+        energy = totals[window:] - totals[:-window]
+        cuts.append(start + int(np.argmin(energy)))
+    return cuts
+
+def _encode_segment(pcm, start, end, outputs, segment: bool = True):
+    """
+    One ffmpeg process: feeds samples [start, end) of the buffer through a
+    pipe and writes each output, as a segment to be joined or
+    (segment=False) as the final file. Outputs are (path, format) or, for
+    segments, (path, format, skip, first, stop): the format's encoder
+    starts `skip` samples into the feed, and only its frames from index
+    first up to stop (None for all) are written.
+    """
+    samples = pcm.memmap()
+    command = [
+        find_ffmpeg(), "-y", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(pcm.sample_rate), "-ac", str(CHANNELS), "-i", "pipe:0",
+    ]
+    for path, name, *frames in outputs:
+        spec = FORMATS[name]
+        if not segment:
+            command += spec["codec"] + ["-f", spec["muxer"], path]
+            continue
+        skip, first, stop = frames
+        if skip:
+            command += ["-af", f"atrim=start_sample={skip},asetpts=N/SR/TB"]
+        drop = ([rf"lt(n\,{first})"] if first else []) + ([rf"gte(n\,{stop})"] if stop is not None else [])
+        if drop:
+            command += ["-bsf:a", "noise=drop=" + "+".join(drop)]
+        options = spec["segment_options"] + (spec["later_segment_options"] if first else [])
+        command += spec["codec"] + options + ["-f", spec["segment"][1], path]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        for position in range(start, end, FEED_SAMPLES):
+            process.stdin.write(samples[position:min(position + FEED_SAMPLES, end)].tobytes())
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    error = process.stderr.read().decode("utf-8", "replace")
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed to encode samples {start}-{end}: {error.strip()}")
+
+def _join(segment_paths, output_path, name, list_path, sample_rate):
+    """
+    Joins encoded segments by stream copy. Every frame is restamped from
+    its place in the sequence, since segment files without headers only
+    have estimated durations; priming the segments don't record is moved
+    before the start, where the container skips it.
+    """
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            f.write("file '{}'\n".format(os.path.abspath(path).replace("'", r"'\''")))
+    frame_seconds = frame_samples(name, sample_rate) / sample_rate
+    frames = f"(N-{FORMATS[name]['priming_frames']})"
+    filters = FORMATS[name]["join"] + [f"setts=ts=STARTPTS+{frames}*{frame_seconds!r}/TB"]
+    command = [
+        find_ffmpeg(), "-y", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy",
+        "-bsf:a", ",".join(filters), "-f", FORMATS[name]["muxer"], output_path,
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to join '{output_path}': {result.stderr.strip()}")
+
+def segment_jobs(seams, outputs, sample_rate, num_samples):
+    """
+    The ffmpeg jobs of a segmented export: (start, end, [(format index,
+    skip, first, stop)]) for each segment between consecutive seams. In
+    every format, a seam is moved back onto the format's frame grid, and a
+    segment's encoder starts whole frames before it, so its frames line up
+    with those of the segment before.
+    """
+    warmup = sample_rate * WARMUP_MS // 1000
+    jobs = []
+    for index, (seam, next_seam) in enumerate(zip(seams, seams[1:])):
+        last = index == len(seams) - 2
+        parts = []
+        for number, (_, name) in enumerate(outputs):
+            frame = frame_samples(name, sample_rate)
+            first = 0 if index == 0 else -(-warmup // frame)
+            encoder_start = seam - seam % frame - first * frame
+            stop = None if last else (next_seam - next_seam % frame - encoder_start) // frame
+            parts.append((number, encoder_start, first, stop))
+        start = min(encoder_start for _, encoder_start, _, _ in parts)
+        end = num_samples if last else min(num_samples, next_seam + warmup)
+        jobs.append((start, end, [(number, encoder_start - start, first, stop)
+                                  for number, encoder_start, first, stop in parts]))
+    return jobs
+
+def export(pcm, output_paths, workers: int = None):
+    """
+    Encodes a PcmBuffer to every path in output_paths (format by extension)
+    with up to `workers` ffmpeg processes (default: one per core). Returns
+    the number of segments used.
+    """
+    output_paths = list(output_paths)
+    outputs = [(path, output_format(path)) for path in output_paths]
+    workers = workers or os.cpu_count() or 1
+    pcm.flush()
+    segments = max(1, min(workers, pcm.num_samples // (MIN_SEGMENT_SECONDS * pcm.sample_rate)))
+    if segments == 1:
+        # One process writes every format directly, with normal gapless headers
+        _encode_segment(pcm, 0, pcm.num_samples, outputs, segment=False)
+        return 1
+
+    seams = [0] + seam_points(pcm.memmap(), pcm.sample_rate, segments) + [pcm.num_samples]
+    jobs = segment_jobs(seams, outputs, pcm.sample_rate, pcm.num_samples)
+    directory = tempfile.mkdtemp(prefix="export-", dir=os.path.dirname(os.path.abspath(output_paths[0])))
+    try:
+        segment_paths = {
+            path: [os.path.join(directory, f"{index:03d}-{number}.{FORMATS[name]['segment'][0]}")
+                   for index in range(len(jobs))]
+            for number, (path, name) in enumerate(outputs)
+        }
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_encode_segment, pcm, start, end,
+                                [(segment_paths[outputs[number][0]][index], outputs[number][1], skip, first, stop)
+                                 for number, skip, first, stop in parts])
+                for index, (start, end, parts) in enumerate(jobs)
+            ]
+            for future in futures:
+                future.result()
+        for number, (path, name) in enumerate(outputs):
+            _join(segment_paths[path], path, name, os.path.join(directory, f"{number}.txt"), pcm.sample_rate)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return len(jobs)
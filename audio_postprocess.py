@@ -0,0 +1,247 @@
+"""
+Vectorized post-processing of stitched PCM at chunk joins
+
+As chunks are appended, excess silence at their edges is trimmed, joins get
+a short crossfade, and each chunk's loudness is measured (ITU-R BS.1770
+K-weighting, gated). When everything is on disk, one block-wise pass over the
+memory-mapped buffer applies per-voice or global gain to reach a LUFS target.
+Gain is capped so the loudest sample of a group stays below MAX_PEAK_DBFS,
+rather than clipping it.
+"""
+
+import numpy as np
+
+DEFAULT_LUFS_TARGET = -18.0
+
+# Silence kept at each edge of a chunk; more than this is trimmed
+MAX_EDGE_SILENCE_MS = 250
+# Anything quieter than this counts as silence when trimming
+SILENCE_THRESHOLD_DBFS = -50.0
+SILENCE_FRAME_MS = 10
+
+CROSSFADE_MS = 15
+# Gain changes between voices are ramped over this long, so they never click
+GAIN_RAMP_MS = 20
+# Gain never lifts a group's loudest sample above this
+MAX_PEAK_DBFS = -1.0
+
+# BS.1770 gating blocks and thresholds
+LOUDNESS_BLOCK_MS = 400
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# Samples processed per block in the final gain pass
+GAIN_PASS_BLOCK = 1 << 20
+
+FULL_SCALE = 32768.0
+
+def _biquad_response(b, a, frequencies, sample_rate):
+    """Squared magnitude response of a biquad at the given frequencies"""
+    z = np.exp(-1j * 2 * np.pi * frequencies / sample_rate)
+    numerator = b[0] + b[1] * z + b[2] * z ** 2
+    denominator = a[0] + a[1] * z + a[2] * z ** 2
+    return np.abs(numerator / denominator) ** 2
+
+def _k_weighting(block_length, sample_rate):
+    """Squared magnitude response of the BS.1770 K-weighting filter at rfft bins"""
+    frequencies = np.fft.rfftfreq(block_length, 1.0 / sample_rate)
+
+    # Stage 1: +4 dB high shelf around 1.5 kHz (head effects)
+    A = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / sample_rate
+    alpha = np.sin(w0) / (2 * (1 / np.sqrt(2)))
+    cos_w0 = np.cos(w0)
+    shelf = _biquad_response(
+        (A * ((A + 1) + (A - 1) * cos_w0 + 2 * np.sqrt(A) * alpha),
+         -2 * A * ((A - 1) + (A + 1) * cos_w0),
+         A * ((A + 1) + (A - 1) * cos_w0 - 2 * np.sqrt(A) * alpha)),
+        ((A + 1) - (A - 1) * cos_w0 + 2 * np.sqrt(A) * alpha,
+         2 * ((A - 1) - (A + 1) * cos_w0),
+         (A + 1) - (A - 1) * cos_w0 - 2 * np.sqrt(A) * alpha),
+        frequencies, sample_rate,
+    )
+
+    # Stage 2: high pass at 38 Hz (RLB weighting)
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    cos_w0 = np.cos(w0)
+    high_pass = _biquad_response(
+        ((1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2),
+        (1 + alpha, -2 * cos_w0, 1 - alpha),
+        frequencies, sample_rate,
+    )
+    return shelf * high_pass
+
+def block_energies(samples, sample_rate):
+    """K-weighted mean square of each full 400 ms block of float samples"""
+    block_length = int(sample_rate * LOUDNESS_BLOCK_MS / 1000)
+    count = len(samples) // block_length
+    if count == 0:
+        return np.zeros(0)
+    blocks = samples[:count * block_length].reshape(count, block_length)
+    spectrum = np.abs(np.fft.rfft(blocks, axis=1)) ** 2
+    weights = _k_weighting(block_length, sample_rate)
+    # Parseval: time-domain energy from the one-sided spectrum
+    energy = (spectrum * weights).sum(axis=1) * 2 - spectrum[:, 0] * weights[0]
+    return energy / (block_length * block_length)
+
+def integrated_loudness(energies):
+    """Gated integrated loudness (LUFS) of a set of block energies, or None"""
+    energies = np.asarray(energies, dtype=float)
+    if energies.size == 0:
+        return None
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(energies)
+    gated = energies[loudness > ABSOLUTE_GATE_LUFS]
+    if gated.size == 0:
+        return None
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    with np.errstate(divide="ignore"):
+        gated = gated[-0.691 + 10 * np.log10(gated) > relative_gate]
+    if gated.size == 0:
+        return None
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+def edge_bounds(samples, sample_rate, max_edge_ms=MAX_EDGE_SILENCE_MS):
+    """(start, end) of a chunk with the silence at both ends trimmed down to max_edge_ms"""
+    frame = max(1, int(sample_rate * SILENCE_FRAME_MS / 1000))
+    count = len(samples) // frame
+    if count == 0:
+        return 0, len(samples)
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    loud = np.flatnonzero(rms > 10 ** (SILENCE_THRESHOLD_DBFS / 20))
+    keep = int(sample_rate * max_edge_ms / 1000)
+    if loud.size == 0:
+        return 0, min(len(samples), keep)
+    start = max(0, loud[0] * frame - keep)
+    end = min(len(samples), (loud[-1] + 1) * frame + keep)
+    return start, end
+
+class JoinProcessor:
+    """
+    Appends chunks to a PcmBuffer with edge trimming and crossfades, and
+    records where each chunk landed and how loud it was.
+    """
+
+    def __init__(self, pcm, trim=True, crossfade_ms=CROSSFADE_MS):
+        self.pcm = pcm
+        self.sample_rate = pcm.sample_rate
+        self.trim = trim
+        self.crossfade = int(self.sample_rate * crossfade_ms / 1000)
+        self.fade_in = np.linspace(0.0, 1.0, self.crossfade, endpoint=False) if self.crossfade else None
+        self.held = np.zeros(0)  # Tail of the previous chunk, not yet written
+        self.segments = []       # {"start", "end", "voice", "energies", "peak"}
+        self.trimmed_samples = 0
+
+    @property
+    def position(self):
+        """Sample index where the next audio will start"""
+        return self.pcm.num_samples + len(self.held)
+
+    def _write(self, samples):
+        clipped = np.clip(np.round(samples), -FULL_SCALE, FULL_SCALE - 1).astype("<i2")
+        self.pcm.append(clipped.tobytes())
+
+    def add_chunk(self, pcm_bytes, voice=None):
+        """
+        Append one synthesized chunk; voice is the loudness group it belongs
+        to. Returns the output sample index of the chunk's first sample
+        before trimming, to place its timepoints.
+        """
+        samples = np.frombuffer(pcm_bytes, dtype="<i2").astype(np.float64)
+        trim_start = 0
+        if self.trim:
+            trim_start, trim_end = edge_bounds(samples, self.sample_rate)
+            self.trimmed_samples += len(samples) - (trim_end - trim_start)
+            samples = samples[trim_start:trim_end]
+
+        energies = block_energies(samples / FULL_SCALE, self.sample_rate)
+        peak = float(np.abs(samples).max()) if len(samples) else 0.0
+
+        overlap = min(len(self.held), len(samples), self.crossfade)
+        if overlap:
+            fade_in = self.fade_in[:overlap] if overlap == self.crossfade else np.linspace(0.0, 1.0, overlap, endpoint=False)
+            held_tail = self.held[len(self.held) - overlap:]
+            self._write(self.held[:len(self.held) - overlap])
+            samples = samples.copy()
+            samples[:overlap] = held_tail * (1.0 - fade_in) + samples[:overlap] * fade_in
+            start = self.pcm.num_samples
+        else:
+            self._write(self.held)
+            start = self.pcm.num_samples
+
+        hold = min(self.crossfade, len(samples))
+        self._write(samples[:len(samples) - hold])
+        self.held = samples[len(samples) - hold:]
+        self.segments.append({"start": start, "end": self.position, "voice": voice, "energies": energies,
+                              "peak": peak})
+        return start - trim_start
+
+    def add_silence(self, milliseconds):
+        """Append exact silence, fading out the previous chunk's held tail"""
+        if len(self.held):
+            self._write(self.held * np.linspace(1.0, 0.0, len(self.held)))
+            self.held = np.zeros(0)
+        self.pcm.append_silence(milliseconds)
+
+    def finish(self):
+        """Write out the held tail"""
+        self._write(self.held)
+        self.held = np.zeros(0)
+        self.pcm.flush()
+
+def loudness_gains(segments, target_lufs=DEFAULT_LUFS_TARGET, per_voice=True):
+    """
+    Gain (linear) for each segment, and per group the measured loudness and
+    the loudness reached, which is below the target where the gain was
+    capped at the group's peak headroom.
+    """
+    groups = {}
+    for segment in segments:
+        key = segment["voice"] if per_voice else "all"
+        groups.setdefault(key, []).append(segment)
+
+    ceiling = FULL_SCALE * 10 ** (MAX_PEAK_DBFS / 20)
+    measured = {}
+    gains = {}
+    for key, group in groups.items():
+        loudness = integrated_loudness(np.concatenate([segment["energies"] for segment in group]))
+        if loudness is None:
+            gains[key] = 1.0
+            continue
+        gain = 10 ** ((target_lufs - loudness) / 20)
+        peak = max(segment["peak"] for segment in group)
+        if peak:
+            gain = min(gain, ceiling / peak)
+        gains[key] = gain
+        measured[key] = (loudness, loudness + 20 * float(np.log10(gain)))
+
+    return [gains[segment["voice"] if per_voice else "all"] for segment in segments], measured
+
+def apply_gains(pcm, segments, gains, ramp_ms=GAIN_RAMP_MS):
+    """
+    Applies per-segment gains in place, in one block-wise pass over the
+    memory-mapped buffer. Gain changes are ramped linearly across joins;
+    only a ramp into a louder group can reach the clip below.
+    """
+    if not segments:
+        return
+    ramp = int(pcm.sample_rate * ramp_ms / 1000)
+    points = []
+    values = []
+    for segment, gain in zip(segments, gains):
+        half = min(ramp // 2, (segment["end"] - segment["start"]) // 2)
+        points += [segment["start"] + half, max(segment["start"] + half, segment["end"] - half)]
+        values += [gain, gain]
+    points = np.asarray(points, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    samples = pcm.memmap(mode="r+")
+    for block_start in range(0, len(samples), GAIN_PASS_BLOCK):
+        block = samples[block_start:block_start + GAIN_PASS_BLOCK]
+        positions = np.arange(block_start, block_start + len(block), dtype=np.float64)
+        gain = np.interp(positions, points, values)
+        block[:] = np.clip(np.round(block * gain), -FULL_SCALE, FULL_SCALE - 1).astype("<i2")
+    samples.flush()
+    del samples
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold-start time of the command line tools
+
+Runs each command in a fresh interpreter several times and reports the
+wall-clock start-up cost, plus the slowest imports seen with -X importtime.
+Use it to check that --help and pronunciation-only work never pay for
+google-cloud, grpc, protobuf or pydub imports.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+SAMPLE_SSML = "lantern_path_best_voices.ssml"
+
+# name -> argument list passed to the interpreter
+COMMANDS = {
+    "python (baseline)": ["-c", "pass"],
+    "import texttospeech (reference)": ["-c", "from google.cloud import texttospeech"],
+    "import pydub (reference)": ["-c", "import pydub"],
+    "tts_converter --help": ["tts_converter.py", "--help"],
+    "apply_pronunciations --help": ["apply_pronunciations.py", "--help"],
+    "apply_pronunciations (run)": ["apply_pronunciations.py", SAMPLE_SSML, "-o", "{tmp}/pronounced.ssml"],
+    "tts_long_audio_converter import": ["-c", "import tts_long_audio_converter"],
+    "tts_ssml_long_audio_converter import": ["-c", "import tts_ssml_long_audio_converter"],
+    "generate_voice_grid --help": ["generate_voice_grid.py", "--help"],
+    "tts_client --help": ["tts_client.py", "--help"],
+}
+
+def run_once(arguments, importtime=False):
+    """Run one command in a fresh interpreter, return (seconds, stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += arguments
+    start = time.perf_counter()
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    return elapsed, result.returncode, result.stderr
+
+def slowest_imports(importtime_output, top):
+    """Parse -X importtime output into the top cumulative imports"""
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # Format: "import time:  self_us | cumulative_us | [indent]module"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        # Only top-level imports are interesting - nested ones are included in them
+        if not name[1:].startswith(" "):
+            imports.append((int(cumulative_us), name.strip()))
+    imports.sort(reverse=True)
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in imports[:top]]
+
+def benchmark(commands, runs, top):
+    """Benchmark every command and return a list of result dicts"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, arguments in commands.items():
+            arguments = [argument.replace("{tmp}", tmp) for argument in arguments]
+            timings = []
+            returncode = 0
+            for _ in range(runs):
+                elapsed, returncode, _ = run_once(arguments)
+                timings.append(elapsed)
+            _, _, importtime_output = run_once(arguments, importtime=True)
+            results.append({
+                "command": name,
+                "returncode": returncode,
+                "min_ms": round(min(timings) * 1000, 1),
+                "median_ms": round(statistics.median(timings) * 1000, 1),
+                "slowest_imports": slowest_imports(importtime_output, top),
+            })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start time of the command line tools")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="Runs per command (default: 5)")
+    parser.add_argument("--top", type=int, default=3, help="Slowest imports to show per command (default: 3)")
+    parser.add_argument("--json", help="Also write results to this JSON file")
+    parser.add_argument("--only", nargs="+", help="Only benchmark commands containing these words")
+    args = parser.parse_args()
+
+    # Commands use paths relative to the project directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    commands = COMMANDS
+    if args.only:
+        commands = {name: argv for name, argv in COMMANDS.items() if any(word in name for word in args.only)}
+
+    print(f"⏱️  Cold-start benchmark ({args.runs} runs per command)")
+    print("=" * 70)
+    results = benchmark(commands, args.runs, args.top)
+
+    for result in results:
+        status = "✅" if result["returncode"] == 0 else "❌"
+        print(f"{status} {result['command']:40} min {result['min_ms']:7.1f} ms   median {result['median_ms']:7.1f} ms")
+        for entry in result["slowest_imports"]:
+            print(f"     {entry['module']:38} {entry['cumulative_ms']:7.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📝 Results saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
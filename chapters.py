@@ -0,0 +1,154 @@
+"""
+Chapter detection and chapter manifests for SSML audiobooks
+
+A chapter starts at a top-level element whose first sentence is a chapter
+heading ("Chapter One: ...", "Final Chapter: ...") or that carries a
+<mark name="chapter..."/>. Anything before the first heading becomes an
+opening chapter of its own, so no content is ever dropped.
+"""
+
+import os
+import re
+import json
+import hashlib
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+
+from pcm_buffer import find_ffmpeg
+
+# Sentences that open a new chapter
+CHAPTER_HEADING = re.compile(
+    r'^\s*(?:(?:Chapter|Part|Book)\s+[\w-]+|Final Chapter|Prologue|Epilogue)\b',
+    re.IGNORECASE
+)
+
+# <mark name="chapter-3"/> (or any name starting with "chapter") also opens a chapter
+CHAPTER_MARK_PREFIX = "chapter"
+
+MANIFEST_FILE = "chapters.json"
+
+def _first_sentence(element):
+    """Text of the first sentence-like piece of an element"""
+    text = " ".join(" ".join(element.itertext()).split())
+    match = re.match(r'(.+?[.!?])(\s|$)', text)
+    return match.group(1) if match else text[:80]
+
+def _chapter_mark(element):
+    """Name of a chapter <mark> at or near the start of an element, if any"""
+    candidates = [element] if element.tag == 'mark' else element.iter('mark')
+    for mark in candidates:
+        name = mark.get('name', '')
+        if name.lower().startswith(CHAPTER_MARK_PREFIX):
+            return name
+        break  # Only the first mark counts - later ones are inside the chapter
+    return None
+
+def chapter_title(element):
+    """Title if this top-level element opens a chapter, else None"""
+    mark = _chapter_mark(element)
+    sentence = _first_sentence(element)
+    if CHAPTER_HEADING.match(sentence):
+        return sentence.rstrip('.')
+    if mark:
+        return sentence.rstrip('.') or mark
+    return None
+
+def slugify(title):
+    """Filesystem-friendly version of a chapter title"""
+    slug = re.sub(r'[^a-z0-9]+', '-', title.lower()).strip('-')
+    return slug[:50] or "chapter"
+
+def group_chapters(root):
+    """Groups the top-level elements of a parsed document into [{"title", "elements"}]"""
+    chapters = []
+    current = None
+    for element in root:
+        title = chapter_title(element)
+        if title or current is None:
+            current = {"title": title or "Opening", "elements": []}
+            chapters.append(current)
+        current["elements"].append(element)
+    return chapters
+
+def split_chapters(ssml_content: str):
+    """
+    Splits SSML content (without the <speak> wrapper) into chapters.
+
+    Returns a list of dicts with index, title, slug and the chapter's ssml.
+    """
+    result = []
+    for index, chapter in enumerate(group_chapters(ET.fromstring(f"<root>{ssml_content}</root>"))):
+        ssml = "".join(ET.tostring(element, encoding='unicode') for element in chapter["elements"])
+        result.append({
+            "index": index,
+            "title": chapter["title"],
+            "slug": f"{index:02d}-{slugify(chapter['title'])}",
+            "ssml": ssml,
+        })
+    return result
+
+def chapter_hash(chapter, settings):
+    """Hash of a chapter's SSML and the render settings that shape its audio"""
+    key = json.dumps({"ssml": chapter["ssml"], "settings": settings}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def load_manifest(output_dir):
+    """Load the chapter manifest of a previous render, keyed by chapter slug"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {entry["slug"]: entry for entry in json.load(f)["chapters"]}
+
+def write_manifest(output_dir, source, entries):
+    """Write the chapter manifest with start offsets of each chapter"""
+    start = 0.0
+    chapters = []
+    for entry in sorted(entries, key=lambda item: item["index"]):
+        entry = dict(entry, start_seconds=round(start, 3))
+        start += entry.get("duration_seconds", 0.0)
+        chapters.append(entry)
+    manifest = {"source": source, "total_seconds": round(start, 3), "chapters": chapters}
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return path, manifest
+
+def _ffmetadata(manifest):
+    """FFMETADATA chapter list for a manifest"""
+    lines = [";FFMETADATA1"]
+    for chapter in manifest["chapters"]:
+        start_ms = int(round(chapter["start_seconds"] * 1000))
+        end_ms = start_ms + int(round(chapter["duration_seconds"] * 1000))
+        title = re.sub(r'([=;#\\\n])', r'\\\1', chapter["title"])
+        lines += ["[CHAPTER]", "TIMEBASE=1/1000", f"START={start_ms}", f"END={end_ms}", f"title={title}"]
+    return "\n".join(lines) + "\n"
+
+def write_combined(output_dir, manifest, output_path):
+    """Join chapter files into one file carrying chapter markers"""
+    extension = os.path.splitext(output_path)[1].lower()
+    with tempfile.TemporaryDirectory() as tmp:
+        list_path = os.path.join(tmp, "chapters.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for chapter in manifest["chapters"]:
+                path = os.path.abspath(os.path.join(output_dir, chapter["file"])).replace("'", r"'\''")
+                f.write(f"file '{path}'\n")
+        metadata_path = os.path.join(tmp, "metadata.txt")
+        with open(metadata_path, "w", encoding="utf-8") as f:
+            f.write(_ffmetadata(manifest))
+
+        command = [
+            find_ffmpeg(), "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-i", metadata_path, "-map", "0:a", "-map_metadata", "1", "-map_chapters", "1",
+        ]
+        if extension in (".m4b", ".m4a", ".mp4"):
+            command += ["-c:a", "aac", "-b:a", "64k", "-f", "mp4"]
+        else:
+            # MP3 frames can be joined as-is; chapters are written as ID3 CHAP frames
+            command += ["-c", "copy", "-id3v2_version", "3"]
+        command.append(output_path)
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to write '{output_path}': {result.stderr.strip()}")
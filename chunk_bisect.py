@@ -0,0 +1,201 @@
+"""
+Bisection of chunks the API rejects
+
+A chunk that fails with INVALID_ARGUMENT (too long, or an unsupported
+construct somewhere inside it) is split in two at the safe boundary nearest
+its middle, and each half is retried, recursively. The fragments that still
+fail on their own are left out of the audio and reported exactly, and the
+rest of the render goes on.
+"""
+
+import re
+import json
+import threading
+import xml.etree.ElementTree as ET
+
+from pcm_buffer import SAMPLE_RATE, SAMPLE_WIDTH
+
+# Halve a chunk at most this many times (2^8 = 256 fragments)
+DEFAULT_MAX_DEPTH = 8
+
+# A chunk can always be split after these, as after a sentence
+BOUNDARY_TAGS = {'p', 'paragraph', 's', 'sentence', 'voice', 'break', 'mark'}
+
+# Content shorter than this is kept whole once it is down to one sentence;
+# longer single sentences (which the API may reject as too long) are split
+# between words
+WORD_SPLIT_MIN_CHARACTERS = 300
+
+# Sentence ends and, failing those, word gaps in text
+SENTENCE_END = re.compile(r'[.!?…;:]+["\'’”)\]]*\s+')
+WORD_GAP = re.compile(r'\s+')
+
+def is_rejection(error):
+    """True for errors that mean the request itself is bad (INVALID_ARGUMENT)"""
+    from google.api_core import exceptions
+    return isinstance(error, exceptions.InvalidArgument)
+
+def _pieces(element):
+    """The content of an element as [text or child element, ...] in order"""
+    pieces = [element.text] if element.text else []
+    for child in element:
+        pieces.append(child)
+        if child.tail:
+            pieces.append(child.tail)
+    return pieces
+
+def _size(piece):
+    if isinstance(piece, str):
+        return len(piece)
+    return len(ET.tostring(piece, encoding='unicode')) - len(piece.tail or "")
+
+def _split_pieces(pieces):
+    """
+    (left, right) pieces split at the boundary nearest the middle: after a
+    block element or a sentence if there is one, else (for long content)
+    at a word gap. Returns None when the content cannot be split.
+    """
+    total = sum(_size(piece) for piece in pieces)
+    patterns = (SENTENCE_END, WORD_GAP) if total >= WORD_SPLIT_MIN_CHARACTERS else (SENTENCE_END,)
+    candidates = []  # (rank, distance from the middle, piece index, offset in the piece)
+    position = 0
+    for index, piece in enumerate(pieces):
+        if isinstance(piece, str):
+            for rank, pattern in enumerate(patterns):
+                for match in pattern.finditer(piece):
+                    if position + match.end() < total and (index or match.start()):
+                        candidates.append((rank, abs(position + match.end() - total / 2), index, match.end()))
+            position += len(piece)
+        else:
+            position += _size(piece)
+            if position < total and (piece.tag in BOUNDARY_TAGS or len(patterns) > 1):
+                rank = 0 if piece.tag in BOUNDARY_TAGS else 1
+                candidates.append((rank, abs(position - total / 2), index + 1, 0))
+    if not candidates:
+        return None
+    _, _, index, offset = min(candidates)
+    left, right = list(pieces[:index]), list(pieces[index:])
+    if offset:
+        piece = pieces[index]
+        left.append(piece[:offset])
+        right = [piece[offset:]] + list(pieces[index + 1:])
+    if not "".join(p if isinstance(p, str) else "x" for p in left).strip():
+        return None
+    if not "".join(p if isinstance(p, str) else "x" for p in right).strip():
+        return None
+    return left, right
+
+def _build(chain, pieces):
+    """SSML of pieces placed inside copies of the wrapper elements in chain"""
+    root = ET.Element(chain[0].tag, chain[0].attrib)
+    parent = root
+    for wrapper in chain[1:]:
+        parent = ET.SubElement(parent, wrapper.tag, wrapper.attrib)
+    parent.text = None
+    last = None
+    for piece in pieces:
+        if isinstance(piece, str):
+            if last is None:
+                parent.text = (parent.text or "") + piece
+            else:
+                last.tail = (last.tail or "") + piece
+        else:
+            last = ET.Element(piece.tag, piece.attrib)
+            last.text = piece.text
+            last.extend(list(piece))
+            parent.append(last)
+    return ET.tostring(root, encoding='unicode')
+
+def split_item(item):
+    """
+    Splits a plan item ({"ssml": ...} or {"text": ...}) into two items with
+    the same voice, or returns None if it cannot be split any further. SSML
+    keeps its <speak>/<voice>/<prosody> context in both halves.
+    """
+    if "text" in item:
+        halves = _split_pieces([item["text"]])
+        if halves is None:
+            return None
+        return [dict(item, text="".join(half).strip()) for half in halves]
+
+    root = ET.fromstring(item["ssml"])
+    chain = [root]
+    node = root
+    # Go down through wrappers that hold a single element and no text
+    while (len(node) == 1 and not (node.text or "").strip() and not (node[0].tail or "").strip()
+           and node[0].tag not in ('say-as', 'sub', 'phoneme', 'audio')):
+        node = node[0]
+        chain.append(node)
+    halves = _split_pieces(_pieces(node))
+    if halves is None:
+        return None
+    return [dict(item, ssml=_build(chain, half)) for half in halves]
+
+class RejectionPolicy:
+    """
+    Failure policy for rejected chunks: bisect them up to max_depth times
+    and collect the fragments that fail on their own. Shared by the threads
+    of a render.
+    """
+
+    def __init__(self, max_depth: int = DEFAULT_MAX_DEPTH):
+        self.max_depth = max_depth
+        self.failures = []
+        self.bisected = 0
+        self._lock = threading.Lock()
+
+    def synthesize(self, item, synthesize, chunk_number=None, sample_rate=SAMPLE_RATE, depth=0):
+        """
+        Runs synthesize(item) -> (pcm, marks), bisecting the item when it is
+        rejected. Returns (pcm, marks, complete), where complete is False if
+        some fragment was left out. Marks are in seconds at sample_rate.
+        """
+        try:
+            pcm, marks = synthesize(item)
+            return pcm, marks, True
+        except Exception as e:
+            if not is_rejection(e):
+                raise
+            halves = split_item(item) if depth < self.max_depth else None
+            if halves is None:
+                with self._lock:
+                    self.failures.append({
+                        "chunk": chunk_number,
+                        "voice": item.get("voice"),
+                        "fragment": item.get("ssml", item.get("text")),
+                        "error": str(e).splitlines()[0] if str(e) else type(e).__name__,
+                    })
+                return b"", None, False
+            if depth == 0:
+                with self._lock:
+                    self.bisected += 1
+
+        left_pcm, left_marks, left_complete = self.synthesize(halves[0], synthesize, chunk_number, sample_rate,
+                                                              depth + 1)
+        right_pcm, right_marks, right_complete = self.synthesize(halves[1], synthesize, chunk_number, sample_rate,
+                                                                 depth + 1)
+        marks = None
+        if left_marks is not None or right_marks is not None:
+            shift = len(left_pcm) / SAMPLE_WIDTH / sample_rate
+            marks = list(left_marks or []) + [(name, seconds + shift) for name, seconds in right_marks or []]
+        return left_pcm + right_pcm, marks, left_complete and right_complete
+
+    def report(self):
+        with self._lock:
+            return {"bisected_chunks": self.bisected, "failed_fragments": list(self.failures)}
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+def print_report(report):
+    """Prints bisected chunks and the fragments left out of the audio"""
+    failures = report["failed_fragments"]
+    if not report["bisected_chunks"] and not failures:
+        return
+    print(f"✂️  {report['bisected_chunks']} rejected chunks were split and retried; "
+          f"{len(failures)} fragments still failed and were left out" + (":" if failures else "."))
+    for failure in failures:
+        fragment = " ".join(failure["fragment"].split())
+        print(f"   chunk {failure['chunk']}: {fragment[:160]}{'…' if len(fragment) > 160 else ''}")
+        print(f"      {failure['error']}")
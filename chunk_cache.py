@@ -0,0 +1,107 @@
+"""
+On-disk cache of synthesized chunks
+
+Each chunk's decoded PCM is stored under a hash of everything that shapes
+its audio: the request's SSML or text, the voice it is sent with and the
+audio settings. A chunk rendered once (by a --range preview, say) is reused
+by any later render that sends the same request.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+CACHE_DIR = ".tts_cache"
+
+def _message_dict(message):
+    """A proto-plus message (VoiceSelectionParams, AudioConfig) as a plain dict"""
+    return type(message).to_dict(message)
+
+class ChunkCache:
+    """
+    PCM of synthesized chunks, one file per chunk. With write=False the
+    cache is only read from.
+    """
+
+    def __init__(self, directory=CACHE_DIR, write=True):
+        self.directory = directory
+        self.write = write
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+        if write:
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, item, voice, audio_config):
+        """Cache key of a plan item sent with the given voice and audio settings"""
+        payload = {
+            "ssml": item.get("ssml"),
+            "text": item.get("text"),
+            "voice": _message_dict(voice),
+            "audio_config": _message_dict(audio_config),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _path(self, key, extension=".pcm"):
+        return os.path.join(self.directory, key[:2], f"{key}{extension}")
+
+    def get(self, key):
+        """Cached PCM for a key, or None"""
+        try:
+            with open(self._path(key), "rb") as f:
+                pcm = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pcm
+
+    def get_marks(self, key):
+        """Cached <mark> timepoints [(name, seconds)] for a key, or None"""
+        try:
+            with open(self._path(key, ".marks.json"), "r", encoding="utf-8") as f:
+                return [tuple(mark) for mark in json.load(f)]
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path, data):
+        # Atomically, so a crash never leaves half a chunk
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, key, pcm, marks=None):
+        """Store PCM, and the chunk's timepoints if there are any, for a key"""
+        if not self.write:
+            return
+        if marks is not None:
+            self._write(self._path(key, ".marks.json"), json.dumps(marks).encode("utf-8"))
+        self._write(self._path(key), pcm)
+        with self._lock:
+            self.stored += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "stored": self.stored}
+
+def open_cache(directory=None, write=False):
+    """
+    The chunk cache for a render: directory (or CACHE_DIR) if it exists or
+    write is set, else None.
+    """
+    directory = directory or CACHE_DIR
+    if not write and not os.path.isdir(directory):
+        return None
+    return ChunkCache(directory, write)
+
+def print_stats(stats):
+    """Prints cache hits and misses"""
+    print(f"💾 Chunk cache: {stats['hits']} reused, {stats['misses']} synthesized"
+          + (f", {stats['stored']} stored" if stats["stored"] else ""))
@@ -0,0 +1,159 @@
+"""
+Checks for silent and truncated chunks
+
+Now and then the API returns a chunk that is near-silence or stops partway
+through the text, with no error. Every decoded chunk gets a cheap check:
+an RMS envelope over short frames gives the seconds of actual speech, which
+is compared with the seconds the chunk's characters should take at the
+voice's speaking speed. A suspect chunk is requested again, and one that is
+still suspect after the retries is kept (the best attempt) and reported.
+
+The speed of each voice is learned from its chunks that passed during the
+render, starting from the planner's SPOKEN_CHARACTERS_PER_SECOND.
+"""
+
+import json
+import statistics
+import threading
+
+from pcm_buffer import SAMPLE_RATE
+from render_planner import SPOKEN_CHARACTERS_PER_SECOND, request_voice
+
+# Request a suspect chunk again at most this many times
+DEFAULT_MAX_RETRIES = 2
+
+# RMS envelope frame, and the level below which a frame counts as silence
+FRAME_MS = 20
+SILENCE_DBFS = -40.0
+
+# A chunk with less speech than this is silent
+MIN_VOICED_SECONDS = 0.2
+
+# A chunk is truncated if its speech is shorter than this share of the
+# expected time; chunks expected to be shorter than MIN_EXPECTED_SECONDS
+# are too short to judge
+MIN_DURATION_RATIO = 0.4
+MIN_EXPECTED_SECONDS = 3.0
+
+# Passed chunks of a voice needed before its own speed replaces the default
+MIN_SPEED_SAMPLES = 5
+
+FULL_SCALE = 32768.0
+
+def analyze(pcm, sample_rate=SAMPLE_RATE):
+    """Seconds, seconds of speech and loudest frame (dBFS) of LINEAR16 PCM bytes"""
+    import numpy as np
+
+    samples = np.frombuffer(pcm, dtype="<i2")
+    frame = max(1, sample_rate * FRAME_MS // 1000)
+    frames = len(samples) // frame
+    if not frames:
+        return {"seconds": len(samples) / sample_rate, "voiced_seconds": 0.0, "peak_dbfs": None}
+    blocks = samples[:frames * frame].reshape(frames, frame).astype(np.float32) / FULL_SCALE
+    power = np.einsum("ij,ij->i", blocks, blocks) / frame
+    threshold = 10 ** (SILENCE_DBFS / 10)
+    peak = float(power.max())
+    return {
+        "seconds": len(samples) / sample_rate,
+        "voiced_seconds": int(np.count_nonzero(power > threshold)) * frame / sample_rate,
+        "peak_dbfs": round(10 * np.log10(peak), 1) if peak > 0 else None,
+    }
+
+class ChunkCheck:
+    """
+    Failure policy for silent and truncated chunks: request them again up
+    to max_retries times and collect the ones that stay suspect. Shared by
+    the threads of a render.
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.max_retries = max_retries
+        self.suspects = []
+        self.retried = 0
+        self._speeds = {}
+        self._lock = threading.Lock()
+
+    def expected_seconds(self, request):
+        """Seconds of speech expected for a request description (see render_planner)"""
+        voice = request_voice(request)
+        with self._lock:
+            speeds = self._speeds.get(voice, ())
+            speed = statistics.median(speeds) if len(speeds) >= MIN_SPEED_SAMPLES else SPOKEN_CHARACTERS_PER_SECOND
+        return request["spoken_characters"] / speed
+
+    def problem(self, analysis, request):
+        """'silent', 'truncated' or None for an analysis of a chunk's audio"""
+        # Break- and mark-only fragments (e.g. from bisection) are meant to be silent
+        if not request["spoken_characters"]:
+            return None
+        if analysis["voiced_seconds"] < MIN_VOICED_SECONDS:
+            return "silent"
+        expected = self.expected_seconds(request)
+        if expected >= MIN_EXPECTED_SECONDS and analysis["voiced_seconds"] < MIN_DURATION_RATIO * expected:
+            return "truncated"
+        return None
+
+    def _learn(self, analysis, request):
+        if analysis["voiced_seconds"] and request["spoken_characters"]:
+            with self._lock:
+                speeds = self._speeds.setdefault(request_voice(request), [])
+                speeds.append(request["spoken_characters"] / analysis["voiced_seconds"])
+                del speeds[:-50]
+
+    def synthesize(self, synthesize, request, chunk_number=None, sample_rate=SAMPLE_RATE):
+        """
+        Runs synthesize() -> (pcm, marks), requesting it again while the
+        audio looks silent or truncated. Returns (pcm, marks, ok), where ok
+        is False if every attempt was suspect; the attempt with the most
+        speech is returned then.
+        """
+        best = None
+        for attempt in range(self.max_retries + 1):
+            pcm, marks = synthesize()
+            analysis = analyze(pcm, sample_rate)
+            problem = self.problem(analysis, request)
+            if problem is None:
+                self._learn(analysis, request)
+                return pcm, marks, True
+            if attempt == 0:
+                with self._lock:
+                    self.retried += 1
+            if best is None or analysis["voiced_seconds"] > best[2]["voiced_seconds"]:
+                best = (pcm, marks, analysis, problem)
+
+        pcm, marks, analysis, problem = best
+        expected = self.expected_seconds(request)
+        with self._lock:
+            self.suspects.append({
+                "chunk": chunk_number,
+                "voice": request_voice(request),
+                "problem": problem,
+                "seconds": round(analysis["seconds"], 2),
+                "voiced_seconds": round(analysis["voiced_seconds"], 2),
+                "expected_seconds": round(expected, 2),
+                "peak_dbfs": analysis["peak_dbfs"],
+                "attempts": self.max_retries + 1,
+            })
+        return pcm, marks, False
+
+    def report(self):
+        with self._lock:
+            return {"retried_chunks": self.retried,
+                    "suspect_chunks": sorted(self.suspects, key=lambda suspect: suspect["chunk"] or 0)}
+
+def write_report(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+def print_report(report):
+    """Prints the chunks that were requested again and the ones still suspect"""
+    suspects = report["suspect_chunks"]
+    if not report["retried_chunks"] and not suspects:
+        return
+    print(f"🔁 {report['retried_chunks']} silent or truncated chunks were requested again; "
+          f"{len(suspects)} still look wrong" + (" - listen to them before publishing:" if suspects else "."))
+    for suspect in suspects:
+        peak = f"{suspect['peak_dbfs']} dBFS" if suspect["peak_dbfs"] is not None else "no signal"
+        print(f"   chunk {suspect['chunk']} ({suspect['voice']}): {suspect['problem']}, "
+              f"{suspect['voiced_seconds']}s of speech where ~{suspect['expected_seconds']:.0f}s was expected, "
+              f"peak {peak}")
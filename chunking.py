@@ -0,0 +1,435 @@
+"""
+Render plans: splitting SSML and plain text into requests
+
+A render plan is a list of {"ssml": chunk} (or {"text": chunk}) requests,
+optionally with the "voice" they are sent with, and {"silence_ms": n} gaps
+rendered locally. SSML is split at top-level elements, text at paragraph,
+sentence and word boundaries, so every request stays under the API's byte
+limit. The converters and the synthesis engine plan documents here.
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from apply_pronunciations import apply_pronunciations_to_string
+from draft_voices import draft_ssml
+from phrase_dedup import split_repeated_phrases
+from ssml_minify import coalesce_voices, minify_ssml
+
+# Google's limit is 5000 bytes, so 4500 is a safe number.
+DEFAULT_CHUNK_SIZE = 4500
+API_BYTE_LIMIT = 5000
+
+def plan_requests(plan):
+    """The request items of a plan."""
+    return [item for item in plan if "silence_ms" not in item]
+
+def text_plan(chunks, voice_name=None):
+    """A render plan of plain-text requests, one per chunk, produced as the chunks are"""
+    return (dict(text=chunk, voice=voice_name) if voice_name else {"text": chunk} for chunk in chunks)
+
+# How much of the input file to read at a time
+READ_BLOCK_SIZE = 1 << 16
+
+# Preferred break points, best first. A chunk only breaks at a paragraph or
+# sentence boundary if that keeps it at least half full. CJK sentences end
+# without a following space.
+PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n\s*')
+SENTENCE_BREAK = re.compile(r'[.!?…]+[\'"’”)\]]*\s+|[。！？]+[」』）”’)\]]*\s*')
+WORD_BREAK = re.compile(r'\s+')
+
+def _utf8_limit(text, start, max_bytes):
+    """Index of the end of the longest slice text[start:end] that fits in max_bytes of UTF-8"""
+    window = text[start:start + max_bytes]
+    encoded = window.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return start + len(window)
+    # Drop any partial multi-byte character left at the cut
+    return start + len(encoded[:max_bytes].decode('utf-8', 'ignore'))
+
+def _last_match_end(pattern, text, start, end):
+    """End index of the last match of pattern inside text[start:end], or -1"""
+    last = -1
+    for match in pattern.finditer(text, start, end):
+        last = match.end()
+    return last
+
+def _find_break(text, start, limit, chunk_size):
+    """Pick where to end the chunk starting at start, never past limit"""
+    # Half the chunk's bytes, as a character index like limit
+    min_end = _utf8_limit(text, start, chunk_size // 2)
+    for pattern in (PARAGRAPH_BREAK, SENTENCE_BREAK):
+        end = _last_match_end(pattern, text, min_end, limit)
+        if end > start:
+            return end
+    end = _last_match_end(WORD_BREAK, text, start + 1, limit)
+    if end > start:
+        return end
+    return limit  # No whitespace at all, forced to break a word
+
+def iter_text_chunks(blocks, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Splits a stream of text blocks into chunks of at most chunk_size UTF-8 bytes.
+
+    Chunks end at paragraph breaks, then sentence ends, then spaces, in that
+    order of preference. Work is proportional to the length of the input, and
+    only about one chunk plus one block of text is held in memory at a time.
+    """
+    chunk_size = min(chunk_size, API_BYTE_LIMIT)
+    blocks = iter(blocks)
+    buffer = ""
+    pos = 0
+    exhausted = False
+
+    while True:
+        # Make sure a full chunk's worth of characters is buffered - a chunk of
+        # chunk_size bytes never holds more than chunk_size characters
+        while not exhausted and len(buffer) - pos < chunk_size + 1:
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                buffer = buffer[pos:] + block
+                pos = 0
+
+        # Skip whitespace between chunks
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        if pos >= len(buffer):
+            if exhausted:
+                return
+            continue
+
+        limit = _utf8_limit(buffer, pos, chunk_size)
+        if limit == len(buffer) and exhausted:
+            end = limit
+        else:
+            end = _find_break(buffer, pos, limit, chunk_size)
+
+        chunk = buffer[pos:end].rstrip()
+        if chunk:
+            yield chunk
+        pos = end
+
+def iter_file_chunks(text_file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Reads a text file incrementally and yields chunks of it."""
+    with open(text_file_path, "r", encoding="utf-8") as f:
+        yield from iter_text_chunks(iter(lambda: f.read(READ_BLOCK_SIZE), ""), chunk_size)
+
+def text_to_chunks(text, chunk_size):
+    """Splits text into chunks of a specified size without breaking words."""
+    return iter_text_chunks([text], chunk_size)
+
+# A full chunk is closed at its last top-level break if it is at least this full there
+BREAK_SPLIT_FILL = 0.95
+
+# Sentence <mark>s (see timepoints) don't count towards the chunk size, so
+# captions don't add requests; a chunk with its marks still stays this far
+# under the API limit, leaving room for the <speak> and <voice> wrappers
+MARKED_CHUNK_LIMIT = API_BYTE_LIMIT - 100
+
+# Phrase deduplication may add a request only if it saves this share of a
+# chunk in characters for every request it adds: requests are not billed,
+# but each one costs latency and request quota
+DEDUPE_REQUEST_FILL = 0.1
+
+# <break time="..."> values, e.g. "2s", "500ms", "1.5s"
+BREAK_TIME = re.compile(r'\s*(\d+(?:\.\d+)?)\s*(ms|s)\s*')
+
+def parse_break_ms(value):
+    """
+    Returns a <break time="..."> value in milliseconds, or None if it has none.
+    """
+    match = BREAK_TIME.fullmatch(value or "")
+    if not match:
+        return None
+    amount, unit = match.groups()
+    return int(round(float(amount) * (1000 if unit == "s" else 1)))
+
+def _wrap_chunk(elements, voice_name, merge_voices=False):
+    """
+    Serializes chunk elements into a <speak> block, keeping voice context.
+    With merge_voices, same-voice blocks in the chunk are merged across the
+    breaks between them (see ssml_minify.coalesce_voices).
+    """
+    new_root = ET.Element('speak')
+    if voice_name and elements[0].tag != 'voice':
+        voice_wrapper = ET.Element('voice', name=voice_name)
+        voice_wrapper.extend(elements)
+        new_root.append(voice_wrapper)
+    else:
+        new_root.extend(elements)
+        if merge_voices:
+            coalesce_voices(new_root, across_breaks=True)
+    return ET.tostring(new_root, encoding='unicode')
+
+def _mark_chars(element):
+    """Characters of the <mark> tags inside a top-level element"""
+    return sum(len(ET.tostring(ET.Element('mark', mark.attrib), encoding='unicode')) for mark in element.iter('mark'))
+
+def _add_silence(plan, milliseconds):
+    """Appends silence to a plan, merging it with silence right before it."""
+    if plan and "silence_ms" in plan[-1]:
+        plan[-1]["silence_ms"] += milliseconds
+    else:
+        plan.append({"silence_ms": milliseconds})
+
+def plan_ssml_chunks(ssml_string: str, chunk_size: int, merge_voices: bool = False, local_breaks: bool = True):
+    """
+    Splits SSML into a render plan: {"ssml": chunk} requests and
+    {"silence_ms": n} gaps that are rendered locally. Loose text before the
+    first element is read as its own <s>, as split_voice_runs reads it.
+
+    Timed top-level <break> elements that fall at the start or end of a chunk
+    are taken out of the request and become exactly timed local silence, so
+    they are not billed (unless text follows them).
+
+    When a chunk fills up, it is closed at its last top-level break if that
+    keeps it mostly full; breaks in the middle of a chunk stay inline so
+    they never cost an extra request; with merge_voices, same-voice blocks
+    on both sides of them are merged into one. Without local_breaks, every
+    break is sent to the API. <mark>s are left out of the chunk size, up to
+    MARKED_CHUNK_LIMIT.
+    """
+    try:
+        root = ET.fromstring(f"<root>{ssml_string}</root>")
+    except ET.ParseError:
+        root = ET.fromstring(ssml_string)
+    if root.text and root.text.strip():
+        leading = ET.Element('s')
+        leading.text, root.text = root.text, None
+        root.insert(0, leading)
+
+    plan = []
+    elements = []
+    char_count = 0       # Without <mark>s
+    marked_count = 0     # With them
+    chunk_voice = None  # Voice context in effect where the chunk starts
+    last_voice = None
+    pending_breaks = []  # (element, milliseconds) not yet placed
+    last_break = None    # (index in elements, break count, char count before, milliseconds)
+
+    def close(chunk_elements, voice_name):
+        if chunk_elements:
+            plan.append({"ssml": _wrap_chunk(chunk_elements, voice_name, merge_voices)})
+
+    def size(chunk_elements):
+        return sum(len(ET.tostring(e, encoding='unicode')) - _mark_chars(e) for e in chunk_elements)
+
+    def marked_size(chunk_elements):
+        return sum(len(ET.tostring(e, encoding='unicode')) for e in chunk_elements)
+
+    def overflows(element_string, marks):
+        return (char_count + len(element_string) - marks > chunk_size
+                or marked_count + len(element_string) > max(chunk_size, MARKED_CHUNK_LIMIT))
+
+    for element in root:
+        milliseconds = parse_break_ms(element.get('time')) if element.tag == 'break' else None
+        if local_breaks and milliseconds is not None and not (element.tail or "").strip():
+            pending_breaks.append((element, milliseconds))
+            continue
+
+        element_string = ET.tostring(element, encoding='unicode')
+        marks = _mark_chars(element)
+
+        if pending_breaks:
+            if not elements:
+                # Leading breaks
+                for _, ms in pending_breaks:
+                    _add_silence(plan, ms)
+            else:
+                # Inline for now - may become the chunk's end later
+                last_break = (len(elements), len(pending_breaks), char_count,
+                              [ms for _, ms in pending_breaks])
+                elements.extend(b for b, _ in pending_breaks)
+                char_count += size([b for b, _ in pending_breaks])
+                marked_count += size([b for b, _ in pending_breaks])
+            pending_breaks = []
+
+        if elements and overflows(element_string, marks):
+            index, count, count_before, break_ms = last_break or (None, 0, 0, [])
+            at_end = index is not None and index + count == len(elements)
+            if index is not None and (at_end or count_before >= chunk_size * BREAK_SPLIT_FILL):
+                # Close the chunk at its last break and carry the rest over
+                head, tail = elements[:index], elements[index + count:]
+                close(head, chunk_voice)
+                for ms in break_ms:
+                    _add_silence(plan, ms)
+                for previous in head:
+                    if previous.tag == 'voice':
+                        chunk_voice = previous.get('name')
+                elements, char_count, marked_count = tail, size(tail), marked_size(tail)
+            if elements and overflows(element_string, marks):
+                close(elements, chunk_voice)
+                elements, char_count, marked_count = [], 0, 0
+            last_break = None
+
+        if not elements:
+            chunk_voice = last_voice
+        elements.append(element)
+        char_count += len(element_string) - marks
+        marked_count += len(element_string)
+        if element.tag == 'voice':
+            last_voice = element.get('name')
+
+    close(elements, chunk_voice)
+    # Trailing breaks
+    for _, ms in pending_breaks:
+        _add_silence(plan, ms)
+    return plan
+
+def split_voice_runs(ssml_string: str):
+    """
+    Splits SSML into runs of the same voice: [(voice_name, content)] with
+    the <voice> wrappers removed. Content outside any <voice> has voice None
+    and is read by the fallback voice; top-level breaks stay in the run
+    they follow.
+    """
+    root = ET.fromstring(f"<root>{ssml_string}</root>")
+    runs = []
+
+    def add(voice_name, content):
+        if not content.strip():
+            if runs:
+                runs[-1][1].append(content)
+            return
+        if runs and runs[-1][0] == voice_name:
+            runs[-1][1].append(content)
+        else:
+            runs.append((voice_name, [content]))
+
+    if root.text and root.text.strip():
+        add(None, escape(root.text))
+    for element in root:
+        tail, element.tail = element.tail, None
+        if element.tag == 'voice':
+            inner = escape(element.text or "") + "".join(ET.tostring(child, encoding='unicode') for child in element)
+            add(element.get('name'), inner)
+        elif element.tag == 'break':
+            if runs:
+                runs[-1][1].append(ET.tostring(element, encoding='unicode'))
+            else:
+                add(None, ET.tostring(element, encoding='unicode'))
+        else:
+            add(None, ET.tostring(element, encoding='unicode'))
+        if tail and tail.strip():
+            add(None, escape(tail))
+
+    return [(voice_name, "".join(parts)) for voice_name, parts in runs]
+
+def plan_voice_segments(ssml_content: str, chunk_size: int, dedupe_phrases: bool = False):
+    """
+    Plans a document as runs of the same voice. Each request carries its
+    voice as {"ssml": chunk, "voice": name} and has no <voice> tags, for
+    voices such as Chirp HD that can only be chosen in VoiceSelectionParams.
+    """
+    plan = []
+    for voice_name, content in split_voice_runs(ssml_content):
+        run_plan, _ = build_plan(content, chunk_size, dedupe_phrases)
+        for item in run_plan:
+            if "silence_ms" in item:
+                _add_silence(plan, item["silence_ms"])
+            else:
+                plan.append(dict(item, voice=voice_name) if voice_name else item)
+    return plan
+
+def build_plan(ssml_content: str, chunk_size: int, dedupe_phrases: bool = False, voice_segments: bool = False,
+               minify: bool = False):
+    """
+    Splits SSML content into a render plan (see plan_ssml_chunks).
+
+    With dedupe_phrases, sentences repeated in the same voice and prosody are
+    cut out into requests of their own where a chunk ends anyway, so
+    identical requests can be synthesized once. Returns (plan, report) where
+    report compares billed characters and requests against plain chunking;
+    the plain chunks are kept if deduplication does not pay for the
+    requests it adds (see DEDUPE_REQUEST_FILL).
+
+    With voice_segments, the plan is built per run of the same voice (see
+    plan_voice_segments) and no report is returned. With minify, the content
+    is minified first (see ssml_minify), and same-voice blocks are merged
+    across the breaks left inside a chunk.
+    """
+    if minify:
+        ssml_content, _ = minify_ssml(ssml_content, chunk_size)
+    if voice_segments:
+        return plan_voice_segments(ssml_content, chunk_size, dedupe_phrases), None
+
+    baseline = plan_ssml_chunks(ssml_content, chunk_size, minify)
+    if not dedupe_phrases:
+        return baseline, None
+
+    pieces, phrases = split_repeated_phrases(ssml_content, chunk_size=chunk_size)
+
+    plan = []
+    for kind, piece in pieces:
+        if kind == "phrase":
+            plan.append({"ssml": f"<speak>{piece}</speak>"})
+        else:
+            for item in plan_ssml_chunks(piece, chunk_size, minify):
+                if "silence_ms" in item:
+                    _add_silence(plan, item["silence_ms"])
+                else:
+                    plan.append(item)
+
+    # Identical chunks are synthesized once either way (see iter_plan_audio),
+    # so both sides count unique requests and only phrase cuts make a difference
+    baseline_chunks = {item["ssml"] for item in plan_requests(baseline)}
+    unique_chunks = {item["ssml"] for item in plan_requests(plan)}
+    report = {
+        "repeated_phrases": len(phrases),
+        "phrase_occurrences": sum(phrases.values()),
+        "baseline_requests": len(baseline_chunks),
+        "requests": len(unique_chunks),
+        "baseline_characters": sum(len(chunk) for chunk in baseline_chunks),
+        "characters": sum(len(chunk) for chunk in unique_chunks),
+    }
+    report["requests_saved"] = report["baseline_requests"] - report["requests"]
+    report["characters_saved"] = report["baseline_characters"] - report["characters"]
+
+    # Cutting phrases out repeats their voice/prosody wrappers and can split
+    # chunks - if that costs more than it saves, keep the plain chunks
+    added_requests = max(0, -report["requests_saved"])
+    report["applied"] = bool(phrases) and (
+        report["characters_saved"] > added_requests * chunk_size * DEDUPE_REQUEST_FILL)
+    if not report["applied"]:
+        return baseline, report
+    return plan, report
+
+def break_report(ssml_content: str, plan, chunk_size: int):
+    """
+    Compares a plan against chunking with every break sent to the API.
+    """
+    inline_chunks = plan_requests(plan_ssml_chunks(ssml_content, chunk_size, local_breaks=False))
+    requests = plan_requests(plan)
+    return {
+        "inline_requests": len(inline_chunks),
+        "requests": len(requests),
+        "local_breaks": sum(1 for item in plan if "silence_ms" in item),
+        "local_silence_ms": sum(item.get("silence_ms", 0) for item in plan),
+        "inline_characters": sum(len(item["ssml"]) for item in inline_chunks),
+        "characters": sum(len(item["ssml"]) for item in requests),
+    }
+
+
+def read_ssml_content(ssml_file_path: str, pronunciations: str = None, pronunciation_format: str = "ipa",
+                      draft: bool = False):
+    """
+    Reads an SSML file and returns the content inside its <speak> tags,
+    with the pronunciation dictionary applied if one is given. With draft,
+    every voice is replaced by a Standard voice (see draft_voices).
+    """
+    with open(ssml_file_path, "r", encoding="utf-8") as f:
+        full_ssml = f.read()
+    if full_ssml.strip().startswith("<speak>"):
+        content_start = full_ssml.find('>') + 1
+        content_end = full_ssml.rfind('</speak>')
+        content = full_ssml[content_start:content_end].strip()
+    else:
+        content = full_ssml.strip()
+    if pronunciations:
+        content = apply_pronunciations_to_string(content, pronunciations, pronunciation_format)
+    if draft:
+        content, _ = draft_ssml(content)
+    return content
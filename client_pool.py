@@ -0,0 +1,231 @@
+"""
+Pool of Text-to-Speech clients, one per credential
+
+Each service-account file usually belongs to its own project, with its own
+quota. A ClientPool keeps one client per credential and stands in for a
+single client: every synthesize_speech call goes to the least-loaded
+healthy client. A credential whose quota runs out (RESOURCE_EXHAUSTED), or
+that stops authenticating, is taken out of rotation and is tried again
+after a cool-down that doubles each time it fails in a row. When every
+credential keeps running out, a request gives up after a few rounds or
+MAX_WAIT_SECONDS and raises the last quota error.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+# Seconds out of rotation after the first quota error (doubles up to MAX_COOLDOWN_SECONDS)
+DEFAULT_COOLDOWN_SECONDS = 15.0
+MAX_COOLDOWN_SECONDS = 300.0
+
+# A request is tried on every credential at most this many times, and for
+# at most this long, before the last quota error is raised
+MAX_QUOTA_ROUNDS = 3
+MAX_WAIT_SECONDS = 600.0
+
+# Quota windows are per minute
+QUOTA_WINDOW_SECONDS = 60.0
+
+def _is_quota_error(error):
+    from google.api_core import exceptions
+    return isinstance(error, (exceptions.ResourceExhausted, exceptions.TooManyRequests))
+
+def _is_credential_error(error):
+    from google.api_core import exceptions
+    return isinstance(error, (exceptions.PermissionDenied, exceptions.Unauthenticated))
+
+def _request_characters(kwargs):
+    request = kwargs.get("request")
+    synthesis_input = request.input if request is not None else kwargs.get("input")
+    if synthesis_input is None:
+        return 0
+    return len(synthesis_input.ssml or synthesis_input.text)
+
+class _Slot:
+    """One credential: its client, load, recent requests and health"""
+
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+        self.in_flight = 0
+        self.requests = 0
+        self.characters = 0
+        self.quota_errors = 0
+        self.failures = 0  # in a row
+        self.unhealthy_until = 0.0
+        self.last_error = None
+        self.window = deque()  # (time, characters) of requests in the last minute
+
+    def recent(self, now):
+        while self.window and self.window[0][0] <= now - QUOTA_WINDOW_SECONDS:
+            self.window.popleft()
+        return len(self.window), sum(characters for _, characters in self.window)
+
+class ClientPool:
+    """
+    Routes synthesize_speech calls across one client per credential file.
+
+    requests_per_minute and characters_per_minute are the quota of each
+    credential, if known: a client at its quota gets no more requests until
+    its minute window frees up, instead of waiting for the API to refuse.
+    The pool can be passed anywhere a TextToSpeechClient is used.
+    """
+
+    def __init__(self, credential_files, time_pointing: bool = False, requests_per_minute: int = None,
+                 characters_per_minute: int = None, cooldown_seconds: float = DEFAULT_COOLDOWN_SECONDS,
+                 clients=None, max_wait_seconds: float = MAX_WAIT_SECONDS):
+        if clients is None:
+            if time_pointing:
+                from google.cloud import texttospeech_v1beta1 as texttospeech
+            else:
+                from google.cloud import texttospeech
+            clients = [texttospeech.TextToSpeechClient.from_service_account_file(path) for path in credential_files]
+        if not clients:
+            raise ValueError("A client pool needs at least one credential")
+        self.slots = [_Slot(os.path.basename(path), client) for path, client in zip(credential_files, clients)]
+        self.requests_per_minute = requests_per_minute
+        self.characters_per_minute = characters_per_minute
+        self.cooldown_seconds = cooldown_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _available(self, slot, now, characters):
+        if slot.unhealthy_until > now:
+            return False
+        requests, used = slot.recent(now)
+        if self.requests_per_minute and requests >= self.requests_per_minute:
+            return False
+        # A request bigger than the whole quota still goes to an idle client
+        if self.characters_per_minute and used and used + characters > self.characters_per_minute:
+            return False
+        return True
+
+    def _next_free(self, now):
+        """Seconds until some client could take a request again"""
+        waits = []
+        for slot in self.slots:
+            if slot.unhealthy_until > now:
+                waits.append(slot.unhealthy_until - now)
+            elif slot.window:
+                waits.append(slot.window[0][0] + QUOTA_WINDOW_SECONDS - now)
+            else:
+                waits.append(0.0)
+        return max(0.05, min(waits))
+
+    def _acquire(self, characters, exclude=(), deadline=None):
+        """The slot to send a request to, or None if none is free by the deadline"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                candidates = [slot for slot in self.slots
+                              if slot not in exclude and self._available(slot, now, characters)]
+                if not candidates and exclude:
+                    # Every other client is busy: the ones already tried may go again
+                    candidates = [slot for slot in exclude if self._available(slot, now, characters)]
+                if candidates:
+                    slot = min(candidates, key=lambda s: (s.in_flight, s.recent(now)[0]))
+                    slot.in_flight += 1
+                    slot.requests += 1
+                    slot.characters += characters
+                    slot.window.append((now, characters))
+                    return slot
+                if deadline is not None and now >= deadline:
+                    return None
+                wait = self._next_free(now)
+                self._condition.wait(wait if deadline is None else min(wait, max(0.0, deadline - now)))
+
+    def _release(self, slot, error=None):
+        with self._condition:
+            slot.in_flight -= 1
+            if error is None:
+                slot.failures = 0
+            else:
+                slot.failures += 1
+                slot.last_error = str(error).splitlines()[0] if str(error) else type(error).__name__
+                if _is_quota_error(error):
+                    slot.quota_errors += 1
+                    cooldown = self.cooldown_seconds * 2 ** (slot.failures - 1)
+                else:
+                    cooldown = MAX_COOLDOWN_SECONDS
+                slot.unhealthy_until = time.monotonic() + min(cooldown, MAX_COOLDOWN_SECONDS)
+            self._condition.notify_all()
+
+    def synthesize_speech(self, **kwargs):
+        """
+        Sends the request to the least-loaded healthy client, moving on from
+        exhausted ones. Raises the last quota or credential error once every
+        client has failed MAX_QUOTA_ROUNDS times or max_wait_seconds passed.
+        """
+        characters = _request_characters(kwargs)
+        deadline = time.monotonic() + self.max_wait_seconds
+        tried = []
+        last_error = None
+        while True:
+            slot = self._acquire(characters, tried, deadline if last_error is not None else None)
+            if slot is None:
+                raise last_error
+            try:
+                response = slot.client.synthesize_speech(**kwargs)
+            except Exception as e:
+                if not (_is_quota_error(e) or _is_credential_error(e)):
+                    self._release(slot)
+                    raise
+                self._release(slot, e)
+                tried.append(slot)
+                last_error = e
+                if _is_credential_error(e) and len(tried) >= len(self.slots):
+                    raise
+                if len(tried) >= MAX_QUOTA_ROUNDS * len(self.slots) or time.monotonic() >= deadline:
+                    raise
+                continue
+            self._release(slot)
+            return response
+
+    def check(self):
+        """
+        Health check: lists voices with every credential, and takes the ones
+        that fail out of rotation. Returns {name: error or None}.
+        """
+        results = {}
+        for slot in self.slots:
+            try:
+                slot.client.list_voices(language_code="en-US")
+                error = None
+            except Exception as e:
+                error = e
+            with self._condition:
+                if error is None:
+                    slot.failures = 0
+                    slot.unhealthy_until = 0.0
+                else:
+                    slot.last_error = str(error).splitlines()[0] if str(error) else type(error).__name__
+                    slot.unhealthy_until = time.monotonic() + MAX_COOLDOWN_SECONDS
+                self._condition.notify_all()
+            results[slot.name] = slot.last_error if error else None
+        return results
+
+    def stats(self):
+        """Per-credential requests, characters, quota errors and health"""
+        now = time.monotonic()
+        with self._condition:
+            return [{
+                "credential": slot.name,
+                "requests": slot.requests,
+                "characters": slot.characters,
+                "quota_errors": slot.quota_errors,
+                "healthy": slot.unhealthy_until <= now,
+                "last_error": slot.last_error,
+            } for slot in self.slots]
+
+def print_stats(stats):
+    """Prints how the requests were spread over the credentials"""
+    print(f"🔑 Credential pool ({len(stats)} credentials):")
+    for entry in stats:
+        state = "ok" if entry["healthy"] else f"out of rotation ({entry['last_error']})"
+        print(f"   {entry['credential']}: {entry['requests']} requests, {entry['characters']} characters, "
+              f"{entry['quota_errors']} quota errors, {state}")
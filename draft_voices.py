@@ -0,0 +1,114 @@
+"""
+Draft voices: Standard voices standing in for every voice of a book
+
+Drafts are for hearing the text while it is written and edited, not for
+publishing. Each voice is replaced by a Standard voice of the same locale and
+gender, which costs a fraction of WaveNet, News, Studio and Chirp and comes
+back faster. Different characters get different Standard voices where the
+locale has enough of them, so dialogue can still be followed.
+"""
+
+import re
+from collections import Counter
+
+# Requested instead of SAMPLE_RATE in draft renders
+DRAFT_SAMPLE_RATE = 16000
+
+# Parallel requests (or chapters) in a draft render, at least
+DRAFT_WORKERS = 16
+
+# Standard voices by (locale, gender), in the order they are handed out
+STANDARD_VOICES = {
+    ("en-US", "MALE"): ["en-US-Standard-D", "en-US-Standard-J", "en-US-Standard-B", "en-US-Standard-I",
+                        "en-US-Standard-A"],
+    ("en-US", "FEMALE"): ["en-US-Standard-F", "en-US-Standard-C", "en-US-Standard-H", "en-US-Standard-E",
+                          "en-US-Standard-G"],
+    ("en-GB", "MALE"): ["en-GB-Standard-B", "en-GB-Standard-D", "en-GB-Standard-O"],
+    ("en-GB", "FEMALE"): ["en-GB-Standard-A", "en-GB-Standard-C", "en-GB-Standard-F", "en-GB-Standard-N"],
+}
+
+# Genders of the voices used in our books (see generate_voice_samples.py)
+VOICE_GENDERS = {
+    "en-US-News-K": "FEMALE",
+    "en-US-News-L": "FEMALE",
+    "en-US-News-N": "MALE",
+    "en-US-Wavenet-A": "MALE",
+    "en-US-Wavenet-B": "MALE",
+    "en-US-Wavenet-C": "FEMALE",
+    "en-US-Wavenet-D": "MALE",
+    "en-US-Wavenet-E": "FEMALE",
+    "en-US-Wavenet-F": "FEMALE",
+    "en-US-Wavenet-G": "FEMALE",
+    "en-US-Wavenet-H": "FEMALE",
+    "en-US-Wavenet-I": "MALE",
+    "en-US-Wavenet-J": "MALE",
+    "en-US-Studio-O": "FEMALE",
+    "en-US-Studio-Q": "MALE",
+    "en-US-Chirp-HD-D": "MALE",
+    "en-US-Chirp-HD-F": "FEMALE",
+    "en-US-Chirp-HD-O": "FEMALE",
+    "en-US-Chirp3-HD-Aoede": "FEMALE",
+    "en-US-Chirp3-HD-Callirrhoe": "FEMALE",
+    "en-US-Chirp3-HD-Charon": "MALE",
+    "en-US-Chirp3-HD-Enceladus": "MALE",
+    "en-GB-News-G": "FEMALE",
+    "en-GB-News-H": "FEMALE",
+    "en-GB-News-I": "FEMALE",
+    "en-GB-News-J": "MALE",
+    "en-GB-News-K": "MALE",
+    "en-GB-News-L": "MALE",
+    "en-GB-News-M": "MALE",
+    "en-GB-Wavenet-A": "FEMALE",
+    "en-GB-Wavenet-B": "MALE",
+    "en-GB-Wavenet-C": "FEMALE",
+    "en-GB-Wavenet-D": "MALE",
+    "en-GB-Wavenet-F": "FEMALE",
+    "en-GB-Wavenet-N": "FEMALE",
+    "en-GB-Wavenet-O": "MALE",
+}
+
+VOICE_NAME = re.compile(r'(<voice\b[^>]*?\bname=")([^"]+)(")')
+
+def voice_locale(voice_name: str):
+    """en-GB-Wavenet-B -> en-GB"""
+    return "-".join(voice_name.split("-")[:2])
+
+def draft_voice_mapping(ssml_content: str):
+    """
+    Voice name -> Standard voice for every <voice name="..."> in the SSML.
+    Voices are handed out in order of use, so the busiest voice (usually
+    the narrator) gets the first Standard voice of its locale and gender.
+    Voices that are already Standard are kept.
+    """
+    counts = Counter(match.group(2) for match in VOICE_NAME.finditer(ssml_content))
+    mapping = {}
+    handed_out = Counter()
+    for name, _ in counts.most_common():
+        if "-Standard-" in name:
+            mapping[name] = name
+            continue
+        locale = voice_locale(name)
+        key = (locale, VOICE_GENDERS.get(name, "FEMALE"))
+        if key not in STANDARD_VOICES:
+            # A locale without a table: every locale has a Standard-A voice
+            mapping[name] = f"{locale}-Standard-A"
+            continue
+        voices = STANDARD_VOICES[key]
+        mapping[name] = voices[handed_out[key] % len(voices)]
+        handed_out[key] += 1
+    return mapping
+
+def apply_voice_mapping(ssml_content: str, mapping):
+    """The SSML with each <voice name="..."> replaced by its mapped voice"""
+    return VOICE_NAME.sub(lambda match: match.group(1) + mapping.get(match.group(2), match.group(2)) + match.group(3),
+                          ssml_content)
+
+def draft_ssml(ssml_content: str):
+    """The SSML with draft voices, and the mapping used"""
+    mapping = draft_voice_mapping(ssml_content)
+    return apply_voice_mapping(ssml_content, mapping), mapping
+
+def print_mapping(mapping):
+    for old_voice, new_voice in mapping.items():
+        gender = VOICE_GENDERS.get(old_voice, "unknown gender").lower()
+        print(f"   {old_voice} → {new_voice}" + ("" if old_voice == new_voice else f" ({gender})"))
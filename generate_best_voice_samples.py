@@ -4,7 +4,6 @@ Generate sample audio files for the best voices in each category
 """
 
 import os
-from google.cloud import texttospeech
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -33,9 +32,12 @@ BEST_VOICES = [
     ("en-GB-Wavenet-D", "MALE", "Natural British Male"),
 ]
 
-def generate_voice_sample(voice_name, gender, description):
+def generate_voice_sample(voice_name, gender, description, client=None):
     """Generate a sample audio file for a specific voice"""
-    client = texttospeech.TextToSpeechClient()
+    from google.cloud import texttospeech
+
+    if client is None:
+        client = texttospeech.TextToSpeechClient()
     
     # Simple text input (no SSML for broader compatibility)
     synthesis_input = texttospeech.SynthesisInput(
@@ -72,13 +74,17 @@ def generate_voice_sample(voice_name, gender, description):
         return False
 
 def main():
+    from google.cloud import texttospeech
+
     print("🎤 Generating voice samples for the best voices...")
     print("=" * 60)
     
+    # One client for every voice - creating a client per request is slow
+    client = texttospeech.TextToSpeechClient()
     total_generated = 0
     
     for voice_name, gender, description in BEST_VOICES:
-        if generate_voice_sample(voice_name, gender, description):
+        if generate_voice_sample(voice_name, gender, description, client):
             total_generated += 1
     
     print("=" * 60)
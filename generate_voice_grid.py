@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Generate a grid of voice samples: voices × sample texts × prosody settings
+
+All samples are rendered over one shared client by a pool of workers.
+Samples that already exist and still match their content hash are skipped,
+so regenerating a grid only pays for what actually changed.
+"""
+
+import os
+import csv
+import html
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from generate_voice_samples import SSML_VOICES
+from generate_best_voice_samples import BEST_VOICES
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_CREDENTIALS = "experiemental-456622-bae3adc875eb.json"
+DEFAULT_OUTPUT_DIR = "voice_grid"
+DEFAULT_WORKERS = 8
+
+# Manifest of what was rendered, used to skip up-to-date samples
+MANIFEST_FILE = "grid_manifest.json"
+
+# Sample texts (SSML fragments, without <speak>)
+SAMPLE_TEXTS = {
+    "intro": '<s>Hello, this is a sample of the <emphasis level="strong">{voice_name}</emphasis> voice.</s>',
+    "story": ('<s>"Once upon a time," said the narrator with enthusiasm, '
+              '"there lived a brave young hero."</s><break time="500ms"/>'
+              '<s>This voice can handle dialogue, narration, and different emotions.</s>'),
+    "question": "<s>Are you sure you want to walk the path of darkness alone?</s>",
+}
+
+# Prosody settings applied around each sample text
+PROSODY_SETTINGS = {
+    "normal": {},
+    "slow": {"rate": "slow"},
+    "fast": {"rate": "fast"},
+    "low": {"pitch": "-2st"},
+    "high": {"pitch": "+2st"},
+}
+
+# Voice sets that can be rendered
+VOICE_SETS = {
+    "ssml": [(name, gender) for voices in SSML_VOICES.values() for name, gender in voices],
+    "best": [(name, gender) for name, gender, _ in BEST_VOICES],
+}
+
+def build_sample_ssml(voice_name, text_key, prosody_key):
+    """Build the SSML request body for one grid cell"""
+    body = SAMPLE_TEXTS[text_key].replace('{voice_name}', voice_name)
+    prosody = PROSODY_SETTINGS[prosody_key]
+    if prosody:
+        attributes = " ".join(f'{name}="{value}"' for name, value in sorted(prosody.items()))
+        body = f"<prosody {attributes}>{body}</prosody>"
+    return f'<speak><voice name="{voice_name}">{body}</voice></speak>'
+
+def content_hash(ssml, voice_name):
+    """Hash everything that determines the audio of a sample"""
+    key = json.dumps({"ssml": ssml, "voice": voice_name, "encoding": "MP3"}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def file_hash(path):
+    """SHA-256 of a file on disk"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(output_dir):
+    """Load the manifest of previously rendered samples"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest of rendered samples, atomically so an interrupted run never leaves half a file"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, path)
+
+def is_up_to_date(output_dir, filename, request_hash, manifest):
+    """True if the sample exists on disk and matches its recorded hashes"""
+    entry = manifest.get(filename)
+    path = os.path.join(output_dir, filename)
+    if not entry or not os.path.exists(path):
+        return False
+    return entry.get("request_hash") == request_hash and entry.get("audio_hash") == file_hash(path)
+
+def render_sample(client, cell, output_dir):
+    """Synthesize one grid cell and write it to disk"""
+    from google.cloud import texttospeech
+
+    synthesis_input = texttospeech.SynthesisInput(ssml=cell["ssml"])
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=cell["voice"][:5],  # Extract language code (en-US or en-GB)
+        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+    )
+    audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
+
+    response = client.synthesize_speech(
+        input=synthesis_input,
+        voice=voice,
+        audio_config=audio_config
+    )
+    path = os.path.join(output_dir, cell["file"])
+    with open(path, "wb") as out:
+        out.write(response.audio_content)
+    return file_hash(path)
+
+def build_grid(voices, text_keys, prosody_keys):
+    """Expand voices × texts × prosody settings into grid cells"""
+    cells = []
+    for voice_name, gender in voices:
+        for text_key in text_keys:
+            for prosody_key in prosody_keys:
+                ssml = build_sample_ssml(voice_name, text_key, prosody_key)
+                cells.append({
+                    "voice": voice_name,
+                    "gender": gender,
+                    "text": text_key,
+                    "prosody": prosody_key,
+                    "ssml": ssml,
+                    "hash": content_hash(ssml, voice_name),
+                    "file": f"{voice_name}_{text_key}_{prosody_key}.mp3",
+                })
+    return cells
+
+def write_index(output_dir, cells):
+    """Write CSV and HTML indexes of the grid"""
+    csv_path = os.path.join(output_dir, "index.csv")
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["voice", "gender", "text", "prosody", "file", "status", "hash"])
+        for cell in cells:
+            writer.writerow([cell["voice"], cell["gender"], cell["text"], cell["prosody"],
+                             cell["file"], cell["status"], cell["hash"]])
+
+    html_path = os.path.join(output_dir, "index.html")
+    rows = []
+    for cell in cells:
+        audio = (f'<audio controls preload="none" src="{html.escape(cell["file"])}"></audio>'
+                 if cell["status"] != "failed" else "❌ failed")
+        rows.append(
+            f"<tr><td>{html.escape(cell['voice'])}</td><td>{cell['gender']}</td>"
+            f"<td>{cell['text']}</td><td>{cell['prosody']}</td><td>{audio}</td></tr>"
+        )
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Voice sample grid</title></head>\n")
+        f.write("<body><h1>Voice sample grid</h1>\n<table border=\"1\" cellpadding=\"4\">\n")
+        f.write("<tr><th>Voice</th><th>Gender</th><th>Text</th><th>Prosody</th><th>Sample</th></tr>\n")
+        f.write("\n".join(rows))
+        f.write("\n</table></body></html>\n")
+    return csv_path, html_path
+
+def generate_grid(cells, output_dir, workers=DEFAULT_WORKERS, force=False):
+    """
+    Render all stale grid cells in parallel over one shared client. The
+    manifest is saved after every sample, so an interrupted run resumes
+    where it stopped.
+    """
+    from google.cloud import texttospeech
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    pending = []
+    for cell in cells:
+        if not force and is_up_to_date(output_dir, cell["file"], cell["hash"], manifest):
+            cell["status"] = "cached"
+        else:
+            pending.append(cell)
+
+    print(f"⏭️  {len(cells) - len(pending)} samples up to date, {len(pending)} to render")
+
+    if pending:
+        # One client shared by all workers - gRPC channels are thread-safe
+        client = texttospeech.TextToSpeechClient()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(render_sample, client, cell, output_dir): cell for cell in pending}
+            for future in as_completed(futures):
+                cell = futures[future]
+                try:
+                    audio_hash = future.result()
+                    manifest[cell["file"]] = {"request_hash": cell["hash"], "audio_hash": audio_hash}
+                    cell["status"] = "rendered"
+                    print(f"✅ Generated: {cell['file']}")
+                except Exception as e:
+                    manifest.pop(cell["file"], None)
+                    cell["status"] = "failed"
+                    print(f"❌ Failed for {cell['file']}: {e}")
+                save_manifest(output_dir, manifest)
+
+    save_manifest(output_dir, manifest)
+    return write_index(output_dir, cells)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a grid of voice samples (voices × texts × prosody settings)",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Render every SSML voice with every sample text and prosody setting
+  python generate_voice_grid.py
+
+  # Only the best voices, one text, two prosody settings
+  python generate_voice_grid.py --voices best --texts story --prosody normal slow
+
+  # Re-render everything, ignoring cached samples
+  python generate_voice_grid.py --force
+        """
+    )
+    parser.add_argument("--voices", choices=sorted(VOICE_SETS), default="ssml",
+                        help="Voice set to render (default: ssml)")
+    parser.add_argument("--texts", nargs="+", choices=sorted(SAMPLE_TEXTS), default=sorted(SAMPLE_TEXTS),
+                        help="Sample texts to render (default: all)")
+    parser.add_argument("--prosody", nargs="+", choices=sorted(PROSODY_SETTINGS), default=sorted(PROSODY_SETTINGS),
+                        help="Prosody settings to render (default: all)")
+    parser.add_argument("-o", "--output-dir", default=DEFAULT_OUTPUT_DIR,
+                        help=f"Output directory (default: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Number of parallel requests (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--force", action="store_true", help="Re-render samples even if they are up to date")
+    parser.add_argument("--credentials", default=DEFAULT_CREDENTIALS,
+                        help=f"Google Cloud credentials JSON file (default: {DEFAULT_CREDENTIALS})")
+    args = parser.parse_args()
+
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.credentials
+
+    cells = build_grid(VOICE_SETS[args.voices], args.texts, args.prosody)
+
+    print("🎤 Generating voice sample grid...")
+    print(f"📁 Output directory: {args.output_dir}/")
+    print(f"🔢 {len(VOICE_SETS[args.voices])} voices × {len(args.texts)} texts × {len(args.prosody)} prosody settings = {len(cells)} samples")
+    print("-" * 60)
+
+    csv_path, html_path = generate_grid(cells, args.output_dir, args.workers, args.force)
+
+    failed = sum(1 for cell in cells if cell["status"] == "failed")
+    print("\n" + "=" * 60)
+    print(f"🎉 Grid complete: {len(cells) - failed} samples ready, {failed} failed")
+    print(f"📋 Index: {csv_path}")
+    print(f"🌐 Browse: {html_path}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -4,7 +4,6 @@ Generate sample audio files for all voices that support SSML
 """
 
 import os
-from google.cloud import texttospeech
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -58,9 +57,12 @@ SSML_VOICES = {
     ],
 }
 
-def generate_voice_sample(voice_name, gender, output_dir):
+def generate_voice_sample(voice_name, gender, output_dir, client=None):
     """Generate a sample audio file for a specific voice"""
-    client = texttospeech.TextToSpeechClient()
+    from google.cloud import texttospeech
+
+    if client is None:
+        client = texttospeech.TextToSpeechClient()
     
     # Create SSML with voice tag
     ssml_with_voice = f"""<speak>
@@ -101,6 +103,8 @@ def generate_voice_sample(voice_name, gender, output_dir):
         return False
 
 def main():
+    from google.cloud import texttospeech
+
     # Create output directory
     output_dir = "voice_samples"
     os.makedirs(output_dir, exist_ok=True)
@@ -109,12 +113,14 @@ def main():
     print(f"📁 Output directory: {output_dir}/")
     print("-" * 60)
     
+    # One client for every voice - creating a client per request is slow
+    client = texttospeech.TextToSpeechClient()
     total_generated = 0
     
     for category, voices in SSML_VOICES.items():
         print(f"\n📢 {category.replace('_', ' ')} Voices:")
         for voice_name, gender in voices:
-            if generate_voice_sample(voice_name, gender, output_dir):
+            if generate_voice_sample(voice_name, gender, output_dir, client):
                 total_generated += 1
     
     print("\n" + "=" * 60)
@@ -0,0 +1,174 @@
+"""
+Hedged synthesis requests
+
+When a request runs past the observed p95 latency for its size and voice
+tier, a duplicate is sent and whichever finishes first is used. The number
+of duplicates is capped as a fraction of all requests.
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import render_history
+
+DEFAULT_PERCENTILE = 95.0
+
+# At most this many hedges per request made (0.1 = 10% extra volume)
+DEFAULT_MAX_EXTRA = 0.1
+
+# Hedging stays off until there are this many latency observations
+MIN_OBSERVATIONS = 20
+
+# Never hedge sooner than this, however fast requests usually are
+MIN_DELAY_SECONDS = 0.25
+
+def _percentile(values, percentile):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percentile / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+class HedgePolicy:
+    """
+    Runs requests with a hedge after the p95 delay, and keeps the metrics.
+
+    The delay is the size-based latency prediction scaled by the p95 of
+    observed/predicted ratios, so long chunks are not hedged for being long.
+    Losers cannot be aborted once they are on the wire; their results are
+    discarded and their latency still goes into the history, and tells how
+    long the request would have taken without its hedge.
+    """
+
+    def __init__(self, percentile=DEFAULT_PERCENTILE, max_extra=DEFAULT_MAX_EXTRA, records=None, max_workers=8):
+        records = records if records is not None else render_history.load_history()
+        self.models, _ = render_history.latency_models(records)
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.ratios = [
+            self._ratio(r["seconds"], r.get("tier"), r["characters"], r.get("voice"))
+            for r in records if r.get("ok", True)
+        ]
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self._completions = []  # (started, finished, primary future if a hedge fired)
+
+    def _ratio(self, seconds, tier, characters, voice):
+        """Observed latency relative to the model's prediction"""
+        return seconds / max(render_history.predict_seconds(self.models, tier, characters, voice), 1e-6)
+
+    def delay(self, tier, characters, voice=None):
+        """Seconds to wait before hedging, or None while there is too little history"""
+        with self._lock:
+            if len(self.ratios) < MIN_OBSERVATIONS:
+                return None
+            ratio = _percentile(self.ratios, self.percentile)
+        return max(MIN_DELAY_SECONDS, render_history.predict_seconds(self.models, tier, characters, voice) * ratio)
+
+    def _attempt(self, function, tier, characters, voice):
+        started = time.perf_counter()
+        try:
+            result = function()
+        except Exception:
+            render_history.record_request(tier, characters, time.perf_counter() - started, ok=False, voice=voice)
+            raise
+        seconds = time.perf_counter() - started
+        render_history.record_request(tier, characters, seconds, voice=voice)
+        with self._lock:
+            self.ratios.append(self._ratio(seconds, tier, characters, voice))
+        return result, time.perf_counter()
+
+    def _unhedged(self, started, primary):
+        result, finished = primary.result()
+        with self._lock:
+            self._completions.append((started, finished, None))
+        return result
+
+    def call(self, function, tier, characters, voice=None):
+        """Calls function(), hedging it with a second call if it runs slow"""
+        started = time.perf_counter()
+        with self._lock:
+            self.requests += 1
+        primary = self._executor.submit(self._attempt, function, tier, characters, voice)
+        delay = self.delay(tier, characters, voice)
+        if delay is None:
+            return self._unhedged(started, primary)
+
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return self._unhedged(started, primary)
+
+        with self._lock:
+            allowed = self.fired + 1 <= self.max_extra * self.requests
+            if allowed:
+                self.fired += 1
+        if not allowed:
+            return self._unhedged(started, primary)
+
+        hedge = self._executor.submit(self._attempt, function, tier, characters, voice)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                result, finished = future.result()
+                for loser in pending:
+                    loser.cancel()
+                with self._lock:
+                    self._completions.append((started, finished, primary))
+                    if future is hedge:
+                        self.won += 1
+                return result
+        raise error
+
+    def metrics(self):
+        """
+        Hedges fired and won, and the makespan of the requests - first start
+        to last finish - with hedging and as it would have been without:
+        each hedged request then finishes when its primary did. A primary
+        that failed or is still running counts as finishing with its hedge.
+        """
+        with self._lock:
+            completions = list(self._completions)
+        still_running = 0
+        hedged_end = unhedged_end = 0.0
+        for started, finished, primary in completions:
+            hedged_end = max(hedged_end, finished)
+            if primary is not None and primary.done() and primary.exception() is None:
+                finished = max(finished, primary.result()[1])
+            elif primary is not None and not primary.done():
+                still_running += 1
+            unhedged_end = max(unhedged_end, finished)
+        first_start = min((started for started, _, _ in completions), default=0.0)
+        makespan = max(0.0, hedged_end - first_start)
+        unhedged_makespan = max(0.0, unhedged_end - first_start)
+        return {
+            "requests": self.requests,
+            "hedges_fired": self.fired,
+            "hedges_won": self.won,
+            "extra_request_ratio": round(self.fired / self.requests, 3) if self.requests else 0.0,
+            "makespan_seconds": round(makespan, 2),
+            "unhedged_makespan_seconds": round(unhedged_makespan, 2),
+            "makespan_saved_seconds": round(unhedged_makespan - makespan, 2),
+            "losers_still_running": still_running,
+        }
+
+    def close(self):
+        """Stop accepting work; losers still on the wire finish in the background"""
+        self._executor.shutdown(wait=False)
+
+def print_metrics(metrics, wall_seconds):
+    """Prints hedging metrics and the change in the requests' makespan"""
+    print(f"🏁 Hedging: {metrics['hedges_fired']} fired, {metrics['hedges_won']} won "
+          f"({metrics['extra_request_ratio']:.0%} extra requests) in {wall_seconds:.1f}s")
+    if metrics["hedges_fired"]:
+        print(f"   Requests makespan: {metrics['unhedged_makespan_seconds']:.1f}s without hedging → "
+              f"{metrics['makespan_seconds']:.1f}s (saved {metrics['makespan_saved_seconds']:.1f}s)")
+    if metrics["losers_still_running"]:
+        print(f"   {metrics['losers_still_running']} slower primaries were still running and count as "
+              f"finishing with their hedge")
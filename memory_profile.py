@@ -0,0 +1,164 @@
+"""
+Per-stage memory profiling
+
+Wraps each pipeline stage (parsing, chunking, synthesis, stitching,
+encoding) and records the Python heap peak (tracemalloc), the process RSS
+peak (sampled in a background thread) and the top allocation sites of the
+stage. The report is JSON so runs can be compared across inputs and sizes.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# How often RSS is sampled while a stage runs
+SAMPLE_INTERVAL = 0.02
+
+# Allocation sites reported per stage
+TOP_SITES = 10
+
+# Frames kept per allocation; more is slower but groups call sites better
+TRACEBACK_FRAMES = 1
+
+MB = 1024 * 1024
+
+# Keep the profiler's own snapshots out of the allocation sites
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+)
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unavailable"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _max_rss_mb(children=False):
+    """Peak RSS in MB from getrusage (KiB on Linux, bytes on macOS), or None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return round((peak if sys.platform == "darwin" else peak * 1024) / MB, 2)
+
+class NullProfiler:
+    """Stands in for MemoryProfiler when profiling is off"""
+
+    def stage(self, name):
+        return nullcontext()
+
+class MemoryProfiler:
+    """Records memory use per named stage; stages may not overlap"""
+
+    def __init__(self, top=TOP_SITES, interval=SAMPLE_INTERVAL):
+        self.top = top
+        self.interval = interval
+        self.stages = []
+        self._peak_rss = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started = None
+
+    def start(self):
+        tracemalloc.start(TRACEBACK_FRAMES)
+        self._started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None:
+                with self._lock:
+                    self._peak_rss = max(self._peak_rss, rss)
+
+    @contextmanager
+    def stage(self, name):
+        """Profiles the enclosed block as one stage"""
+        rss_before = current_rss()
+        with self._lock:
+            self._peak_rss = rss_before or 0
+        heap_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            heap_after, heap_peak = tracemalloc.get_traced_memory()
+            snapshot_after = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+            rss_after = current_rss()
+            with self._lock:
+                peak_rss = max(self._peak_rss, rss_after or 0)
+
+            sites = snapshot_after.compare_to(snapshot_before, "lineno")
+            sites.sort(key=lambda stat: stat.size_diff, reverse=True)
+            self.stages.append({
+                "stage": name,
+                "seconds": round(seconds, 3),
+                "heap_peak_mb": round(heap_peak / MB, 3),
+                "heap_peak_over_start_mb": round((heap_peak - heap_before) / MB, 3),
+                "heap_retained_mb": round((heap_after - heap_before) / MB, 3),
+                "rss_start_mb": round((rss_before or 0) / MB, 2),
+                "rss_peak_mb": round(peak_rss / MB, 2),
+                "rss_end_mb": round((rss_after or 0) / MB, 2),
+                "top_allocations": [
+                    {
+                        "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        "size_diff_mb": round(stat.size_diff / MB, 4),
+                        "count_diff": stat.count_diff,
+                    }
+                    for stat in sites[:self.top] if stat.size_diff > 0
+                ],
+            })
+
+    def report(self, **context):
+        """The profile as a dict; context (input size, options, ...) is included as-is"""
+        return {
+            "python": platform.python_version(),
+            "platform": sys.platform,
+            "total_seconds": round(time.perf_counter() - self._started, 3) if self._started else None,
+            "max_rss_mb": _max_rss_mb(),
+            # ffmpeg and other subprocesses, which the stage samples don't see
+            "children_max_rss_mb": _max_rss_mb(children=True),
+            "context": context,
+            "stages": self.stages,
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        tracemalloc.stop()
+
+    def write(self, json_path, **context):
+        """Stops profiling and writes the report as JSON"""
+        report = self.report(**context)
+        self.stop()
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+def print_summary(report):
+    """Prints peak memory per stage"""
+    print(f"\n🧠 Memory by stage (max RSS {report['max_rss_mb']} MB, "
+          f"subprocesses {report['children_max_rss_mb']} MB)")
+    for stage in report["stages"]:
+        top = stage["top_allocations"][0]["site"] if stage["top_allocations"] else "-"
+        print(f"  {stage['stage']:12} heap peak {stage['heap_peak_over_start_mb']:8.2f} MB  "
+              f"RSS peak {stage['rss_peak_mb']:8.1f} MB  {stage['seconds']:7.2f}s  top: {os.path.basename(top)}")
@@ -0,0 +1,106 @@
+"""
+Disk-backed PCM buffer for stitching long audio in constant memory
+
+Chunks are requested as LINEAR16, their samples are appended to a raw PCM
+file on disk, and the final file is encoded from it by streaming ffmpeg
+processes (see audio_export). Peak memory stays at roughly one chunk,
+however long the book.
+"""
+
+import io
+import os
+import wave
+import shutil
+import tempfile
+
+# Every chunk is requested at this rate so they can be appended as-is
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2  # 16-bit signed little-endian (LINEAR16)
+CHANNELS = 1
+
+def decode_linear16(audio_content, sample_rate=SAMPLE_RATE):
+    """
+    Returns (pcm_bytes, sample_rate) from a LINEAR16 API response.
+
+    The API wraps LINEAR16 audio in a WAV header; raw PCM is passed through,
+    at the sample_rate it was requested at.
+    """
+    if audio_content[:4] != b"RIFF":
+        return audio_content, sample_rate
+    with wave.open(io.BytesIO(audio_content), "rb") as wav:
+        if wav.getsampwidth() != SAMPLE_WIDTH or wav.getnchannels() != CHANNELS:
+            raise ValueError(
+                f"Unexpected audio format: {wav.getsampwidth() * 8}-bit, {wav.getnchannels()} channel(s)"
+            )
+        return wav.readframes(wav.getnframes()), wav.getframerate()
+
+def decode_response(audio_content, sample_rate=SAMPLE_RATE):
+    """Decode a LINEAR16 response, checking it is at sample_rate"""
+    pcm, response_rate = decode_linear16(audio_content, sample_rate)
+    if response_rate != sample_rate:
+        raise ValueError(f"Chunk sample rate {response_rate} Hz does not match buffer rate {sample_rate} Hz")
+    return pcm
+
+def find_ffmpeg():
+    """Locate the ffmpeg binary (also required by pydub)"""
+    ffmpeg = shutil.which("ffmpeg") or shutil.which("avconv")
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg not found - install it to encode audio (see README)")
+    return ffmpeg
+
+class PcmBuffer:
+    """Append-only 16-bit mono PCM stored in a file on disk"""
+
+    def __init__(self, path=None, sample_rate=SAMPLE_RATE, directory=None):
+        self.sample_rate = sample_rate
+        self._owns_file = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".pcm", dir=directory)
+            os.close(fd)
+        self.path = path
+        self._file = open(path, "wb+")
+        self.num_samples = 0
+
+    def append(self, pcm_bytes):
+        """Append raw PCM samples to the end of the buffer"""
+        self._file.write(pcm_bytes)
+        self.num_samples += len(pcm_bytes) // SAMPLE_WIDTH
+
+    def append_silence(self, milliseconds):
+        """Append exactly timed digital silence"""
+        samples = int(round(self.sample_rate * milliseconds / 1000))
+        block = b"\x00" * (SAMPLE_WIDTH * min(samples, self.sample_rate))
+        while samples > 0:
+            count = min(samples, self.sample_rate)
+            self._file.write(block[:count * SAMPLE_WIDTH])
+            samples -= count
+            self.num_samples += count
+
+    @property
+    def duration_seconds(self):
+        return self.num_samples / self.sample_rate
+
+    def flush(self):
+        self._file.flush()
+
+    def memmap(self, mode="r"):
+        """Memory-map the samples as a NumPy int16 array (no copy into RAM)"""
+        import numpy as np
+
+        self.flush()
+        if self.num_samples == 0:
+            return np.zeros(0, dtype=np.int16)
+        return np.memmap(self.path, dtype="<i2", mode=mode, shape=(self.num_samples,))
+
+    def close(self):
+        """Close the buffer, deleting its file if it was a temporary one"""
+        if not self._file.closed:
+            self._file.close()
+        if self._owns_file and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,176 @@
+"""
+Intra-document phrase deduplication
+
+Finds sentences that occur more than once with the same voice and prosody
+context and cuts them out of the surrounding SSML, so each one can be
+synthesized once and its audio spliced in at every occurrence. Every cut
+ends the request before it, so with a chunk size only the occurrences where
+a chunk would end anyway are cut; the others stay inline and the content
+around them is chunked together.
+"""
+
+import copy
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+# Elements that can be deduplicated
+PHRASE_TAGS = ('s',)
+
+# Ignore fragments shorter than this (spoken text characters) - splitting a
+# chunk around a tiny phrase costs more than it saves
+DEFAULT_MIN_CHARS = 20
+
+def _shell(element):
+    """Copy of an element without children, text or tail"""
+    return ET.Element(element.tag, element.attrib)
+
+def _text_length(element):
+    return len(" ".join("".join(element.itertext()).split()))
+
+def _phrase_key(ancestors, element):
+    """Serialized phrase wrapped in its ancestors - identical keys sound identical"""
+    phrase = copy.deepcopy(element)
+    phrase.tail = None
+    for ancestor in reversed(ancestors):
+        wrapper = _shell(ancestor)
+        wrapper.append(phrase)
+        phrase = wrapper
+    return ET.tostring(phrase, encoding='unicode')
+
+def _find_phrases(root, min_chars):
+    """Map id(element) -> key for every candidate phrase element"""
+    candidates = {}
+
+    def walk(element, ancestors):
+        for child in element:
+            if child.tag in PHRASE_TAGS and _text_length(child) >= min_chars:
+                candidates[id(child)] = _phrase_key(ancestors, child)
+            else:
+                walk(child, ancestors + [child])
+
+    for top in root:
+        if top.tag in PHRASE_TAGS and _text_length(top) >= min_chars:
+            candidates[id(top)] = _phrase_key([], top)
+        else:
+            walk(top, [top])
+    return candidates
+
+def _append_text(parent, text):
+    """Append text after the last child of parent (or to its text)"""
+    if len(parent):
+        parent[-1].tail = (parent[-1].tail or "") + text
+    else:
+        parent.text = (parent.text or "") + text
+
+def _split(element, targets):
+    """Split element into ("content", element) and ("phrase", element) pieces, in order"""
+    if id(element) in targets:
+        element.tail = None
+        return [("phrase", element)]
+    if not any(id(descendant) in targets for descendant in element.iter()):
+        return [("content", element)]
+
+    pieces = []
+    current = _shell(element)
+    current.text = element.text
+
+    for child in list(element):
+        tail = child.tail
+        split = any(id(descendant) in targets for descendant in child.iter())
+        for kind, piece in _split(child, targets):
+            if kind == "content":
+                current.append(piece)
+            else:
+                if len(current) or (current.text and current.text.strip()):
+                    pieces.append(("content", current))
+                current = _shell(element)
+                wrapper = _shell(element)
+                wrapper.append(piece)
+                pieces.append(("phrase", wrapper))
+        if split and tail and tail.strip():
+            _append_text(current, tail)
+
+    if len(current) or (current.text and current.text.strip()):
+        pieces.append(("content", current))
+    return pieces
+
+def _repeated(root, min_chars, min_count):
+    """Repeated phrase elements in document order"""
+    candidates = _find_phrases(root, min_chars)
+    counts = Counter(candidates.values())
+    return [element for element in root.iter()
+            if id(element) in candidates and counts[candidates[id(element)]] >= min_count]
+
+def _pieces(root, targets):
+    """
+    Content and phrase pieces of a document split around the target element
+    ids. Content pieces are lists of serialized top-level elements.
+    """
+    pieces = []
+    content = []
+    for top in root:
+        for kind, piece in _split(top, targets):
+            if kind == "content":
+                content.append(ET.tostring(piece, encoding='unicode'))
+            else:
+                if content:
+                    pieces.append(("content", content))
+                    content = []
+                pieces.append(("phrase", ET.tostring(piece, encoding='unicode')))
+    if content:
+        pieces.append(("content", content))
+    return pieces
+
+def _free_cuts(pieces, chunk_size, min_count):
+    """
+    Indices of the phrase occurrences that can be cut without starting an
+    extra chunk: where plain chunking (simulated on top-level elements)
+    would start or end a chunk at the phrase anyway. Phrases with fewer such
+    occurrences than min_count are left inline.
+    """
+    used = 0
+    cuts = []
+    occurrence = 0
+    for index, (kind, piece) in enumerate(pieces):
+        if kind == "content":
+            for element in piece:
+                if used and used + len(element) > chunk_size:
+                    used = 0
+                used += len(element)
+            continue
+        following = pieces[index + 1] if index + 1 < len(pieces) else None
+        next_size = len(following[1][0] if following[0] == "content" else following[1]) if following else chunk_size
+        if not used or used + len(piece) > chunk_size or used + len(piece) + next_size > chunk_size:
+            cuts.append((occurrence, piece))
+            used = 0
+        else:
+            used += len(piece)
+        occurrence += 1
+    counts = Counter(ssml for _, ssml in cuts)
+    return {occurrence for occurrence, ssml in cuts if counts[ssml] >= min_count}
+
+def split_repeated_phrases(ssml_content: str, min_chars: int = DEFAULT_MIN_CHARS, min_count: int = 2,
+                           chunk_size: int = None):
+    """
+    Splits SSML content around phrases that repeat in the same voice context.
+    With chunk_size, only occurrences that don't start an extra chunk of
+    that size are cut (see _free_cuts).
+
+    Returns (pieces, phrases): pieces is an ordered list of ("content", ssml)
+    and ("phrase", ssml) tuples, where consecutive content is merged into one
+    string; phrases maps each repeated phrase's ssml to its occurrence count.
+    """
+    root = ET.fromstring(f"<root>{ssml_content}</root>")
+    targets = _repeated(root, min_chars, min_count)
+    if targets and chunk_size:
+        # Splitting takes the tree apart, so the chosen cuts are applied to a fresh parse
+        cuts = _free_cuts(_pieces(root, {id(element) for element in targets}), chunk_size, min_count)
+        root = ET.fromstring(f"<root>{ssml_content}</root>")
+        targets = [element for index, element in enumerate(_repeated(root, min_chars, min_count)) if index in cuts]
+    if not targets:
+        return [("content", ssml_content)], {}
+
+    pieces = [(kind, "".join(piece) if kind == "content" else piece)
+              for kind, piece in _pieces(root, {id(element) for element in targets})]
+    phrases = Counter(ssml for kind, ssml in pieces if kind == "phrase")
+    return pieces, dict(phrases)
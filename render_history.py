@@ -0,0 +1,109 @@
+"""
+History of synthesis requests, used to predict render times
+
+Every request made by the converters appends one JSON line with its voice
+tier, size and latency. The planner fits latency against request size per
+voice tier from these records.
+"""
+
+import os
+import json
+import time
+import threading
+
+# One JSON object per line; override with TTS_HISTORY_FILE
+DEFAULT_HISTORY_FILE = ".tts_history.jsonl"
+
+# Only the most recent records are used, so the model follows API changes
+MAX_RECORDS = 5000
+
+# Used until there is enough history: seconds per request + seconds per character
+DEFAULT_LATENCY = (0.5, 0.0008)
+
+# Fewer records than this for a tier falls back to all tiers, then to the default
+MIN_RECORDS = 5
+
+_lock = threading.Lock()
+
+def history_path():
+    return os.environ.get("TTS_HISTORY_FILE", DEFAULT_HISTORY_FILE)
+
+def record_request(tier, characters, seconds, ok=True, voice=None):
+    """Append one request's latency to the history file"""
+    entry = {
+        "time": round(time.time(), 3),
+        "tier": tier,
+        "voice": voice,
+        "characters": characters,
+        "seconds": round(seconds, 4),
+        "ok": ok,
+    }
+    with _lock:
+        try:
+            with open(history_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError:
+            pass  # History is best-effort - never fail a render over it
+
+def load_history(path=None):
+    """Load the most recent history records"""
+    path = path or history_path()
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return records[-MAX_RECORDS:]
+
+def fit_latency(records):
+    """Least-squares fit of seconds = intercept + slope * characters"""
+    points = [(r["characters"], r["seconds"]) for r in records if r.get("ok", True)]
+    if len(points) < MIN_RECORDS:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return (mean_y, 0.0)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    slope = max(slope, 0.0)
+    intercept = max(mean_y - slope * mean_x, 0.0)
+    return (intercept, slope)
+
+# Requests within this fraction of a size count as "that size" for rejection rates
+SIZE_WINDOW = 0.2
+
+def latency_models(records):
+    """
+    Latency model per voice and per voice tier, plus an "all" model, and
+    where they came from. Voice names and tier names never collide.
+    """
+    models = {}
+    overall = fit_latency(records)
+    models["all"] = overall or DEFAULT_LATENCY
+    for key in ("tier", "voice"):
+        for value in {r.get(key) for r in records if r.get(key)}:
+            fitted = fit_latency([r for r in records if r.get(key) == value])
+            if fitted:
+                models[value] = fitted
+    return models, ("history" if overall else "default")
+
+def predict_seconds(models, tier, characters, voice=None):
+    """Predicted latency of one request, from the most specific model available"""
+    intercept, slope = models.get(voice) or models.get(tier) or models["all"]
+    return intercept + slope * characters
+
+def rejection_rate(records, tier, characters):
+    """Share of failed requests of about this size for a voice tier (0 without enough history)"""
+    nearby = [
+        r for r in records
+        if r.get("tier") == tier and abs(r["characters"] - characters) <= characters * SIZE_WINDOW
+    ]
+    if len(nearby) < MIN_RECORDS:
+        return 0.0
+    return sum(1 for r in nearby if not r.get("ok", True)) / len(nearby)
@@ -0,0 +1,213 @@
+"""
+Offline render planner
+
+Estimates how many requests a render takes, how many characters are billed
+per voice and voice tier, what that costs and how long it will run, from
+the real chunking output and the recorded request history. Nothing here
+touches the network.
+"""
+
+import re
+import json
+import heapq
+import xml.etree.ElementTree as ET
+
+import render_history
+
+# List prices in USD per 1 million characters - check current Google Cloud
+# pricing and adjust for your contract; the free tier is not deducted
+PRICE_PER_MILLION = {
+    "Standard": 4.0,
+    "WaveNet": 16.0,
+    "Neural2": 16.0,
+    "News": 16.0,
+    "Polyglot": 16.0,
+    "Casual": 16.0,
+    "Chirp": 30.0,
+    "Studio": 160.0,
+}
+
+VOICE_TIERS = [
+    (re.compile(r'-Standard-', re.IGNORECASE), "Standard"),
+    (re.compile(r'-Wavenet-', re.IGNORECASE), "WaveNet"),
+    (re.compile(r'-Neural2-', re.IGNORECASE), "Neural2"),
+    (re.compile(r'-News-', re.IGNORECASE), "News"),
+    (re.compile(r'-Polyglot-', re.IGNORECASE), "Polyglot"),
+    (re.compile(r'-Casual-', re.IGNORECASE), "Casual"),
+    (re.compile(r'-(Chirp3?-HD|Chirp|Journey)-', re.IGNORECASE), "Chirp"),
+    (re.compile(r'-Studio-', re.IGNORECASE), "Studio"),
+]
+
+# Content outside any <voice> is read by the request's fallback voice
+DEFAULT_VOICE = "default"
+
+# Rough narration speed, used to estimate audio length
+SPOKEN_CHARACTERS_PER_SECOND = 15.0
+
+# The API rejects requests over 5000 bytes
+API_LIMIT = 5000
+
+# Chunk sizes tried by --chunk-size auto; the largest leaves room for the
+# <speak>/<voice> wrapper added around each chunk
+AUTO_CHUNK_SIZES = list(range(1000, 4751, 250))
+
+def voice_tier(voice_name):
+    """Pricing tier of a voice name, e.g. en-US-Wavenet-D -> WaveNet"""
+    if voice_name and voice_name != DEFAULT_VOICE:
+        for pattern, tier in VOICE_TIERS:
+            if pattern.search(voice_name):
+                return tier
+    return "Standard"
+
+def describe_ssml_request(ssml):
+    """Billed characters of one SSML request, attributed to the voices in it"""
+    root = ET.fromstring(ssml)
+    voices = {}
+    for element in root:
+        name = element.get('name') if element.tag == 'voice' else DEFAULT_VOICE
+        size = len(ET.tostring(element, encoding='unicode'))
+        voices[name or DEFAULT_VOICE] = voices.get(name or DEFAULT_VOICE, 0) + size
+    spoken = len(" ".join("".join(root.itertext()).split()))
+    return {"characters": len(ssml), "bytes": len(ssml.encode("utf-8")), "voices": voices,
+            "spoken_characters": spoken}
+
+def describe_text_request(text, voice_name):
+    """Billed characters of one plain-text request"""
+    return {"characters": len(text), "bytes": len(text.encode("utf-8")), "voices": {voice_name: len(text)},
+            "spoken_characters": len(text)}
+
+def request_voice(request):
+    """Voice that reads most of a request"""
+    return max(request["voices"].items(), key=lambda item: item[1])[0] if request["voices"] else None
+
+def request_tier(request):
+    """Tier of the voice that reads most of a request"""
+    return voice_tier(request_voice(request))
+
+def request_seconds(models, request, records=None):
+    """
+    Expected seconds for a request, including retries at the rejection rate
+    seen for requests of this size and tier.
+    """
+    tier = request_tier(request)
+    seconds = render_history.predict_seconds(models, tier, request["characters"], request_voice(request))
+    if records:
+        seconds /= max(1.0 - render_history.rejection_rate(records, tier, request["characters"]), 0.1)
+    return seconds
+
+def _makespan(lane_seconds, concurrency):
+    """Wall time of running lanes (each sequential) on a pool of workers, in order"""
+    workers = [0.0] * max(1, min(concurrency, len(lane_seconds) or 1))
+    heapq.heapify(workers)
+    for seconds in lane_seconds:
+        start = heapq.heappop(workers)
+        heapq.heappush(workers, start + seconds)
+    return max(workers)
+
+def estimate_render(lanes, chunk_size, concurrency=1, silence_ms=0, history=None):
+    """
+    Estimates a render offline.
+
+    lanes is a list of independent pipelines (e.g. chapters), each a list of
+    request descriptions; requests within a lane run one after another and
+    up to `concurrency` lanes run at the same time.
+    """
+    records = history if history is not None else render_history.load_history()
+    models, model_source = render_history.latency_models(records)
+
+    requests = [request for lane in lanes for request in lane]
+    voices = {}
+    tiers = {}
+    for request in requests:
+        for voice, characters in request["voices"].items():
+            entry = voices.setdefault(voice, {"tier": voice_tier(voice), "characters": 0})
+            entry["characters"] += characters
+    for voice, entry in voices.items():
+        entry["cost_usd"] = round(entry["characters"] / 1e6 * PRICE_PER_MILLION[entry["tier"]], 4)
+        tier = tiers.setdefault(entry["tier"], {"characters": 0, "cost_usd": 0.0})
+        tier["characters"] += entry["characters"]
+        tier["cost_usd"] = round(tier["cost_usd"] + entry["cost_usd"], 4)
+
+    lane_seconds = [sum(request_seconds(models, request) for request in lane) for lane in lanes]
+    fills = [request["characters"] / chunk_size for request in requests]
+    spoken = sum(request["spoken_characters"] for request in requests)
+
+    return {
+        "requests": len(requests),
+        "pipelines": len(lanes),
+        "billed_characters": sum(request["characters"] for request in requests),
+        "chunk_size": chunk_size,
+        "fill_ratio": {
+            "min": round(min(fills), 3) if fills else 0.0,
+            "mean": round(sum(fills) / len(fills), 3) if fills else 0.0,
+            "max": round(max(fills), 3) if fills else 0.0,
+        },
+        "voices": voices,
+        "tiers": tiers,
+        "estimated_cost_usd": round(sum(tier["cost_usd"] for tier in tiers.values()), 4),
+        "concurrency": concurrency,
+        "latency_model": model_source,
+        "latency_records": len(records),
+        "predicted_wall_seconds": round(_makespan(lane_seconds, concurrency), 1),
+        "sequential_seconds": round(sum(lane_seconds), 1),
+        "estimated_audio_seconds": round(spoken / SPOKEN_CHARACTERS_PER_SECOND + silence_ms / 1000, 1),
+    }
+
+def choose_chunk_size(lanes_for_size, concurrency=1, history=None, sizes=AUTO_CHUNK_SIZES):
+    """
+    Picks the chunk size with the lowest predicted end-to-end time.
+
+    lanes_for_size(size) returns the lanes (see estimate_render) the real
+    chunker produces at that size. Each request is predicted with the
+    per-voice latency model and inflated by the rejection rate observed for
+    its size; sizes whose largest request would exceed the API limit are
+    skipped. Returns (chunk_size, candidates).
+    """
+    records = history if history is not None else render_history.load_history()
+    models, _ = render_history.latency_models(records)
+
+    candidates = []
+    for size in sizes:
+        lanes = lanes_for_size(size)
+        requests = [request for lane in lanes for request in lane]
+        largest = max((request["bytes"] for request in requests), default=0)
+        if largest > API_LIMIT:
+            continue
+        lane_seconds = [sum(request_seconds(models, request, records) for request in lane) for lane in lanes]
+        candidates.append({
+            "chunk_size": size,
+            "requests": len(requests),
+            "largest_request_bytes": largest,
+            "predicted_wall_seconds": round(_makespan(lane_seconds, concurrency), 2),
+        })
+
+    if not candidates:
+        raise ValueError(f"No chunk size keeps every request under {API_LIMIT} bytes")
+    best = min(candidates, key=lambda candidate: (candidate["predicted_wall_seconds"], -candidate["chunk_size"]))
+    return best["chunk_size"], candidates
+
+def print_estimate(report):
+    """Prints a dry-run report"""
+    print("🧮 Dry run - no requests sent")
+    print(f"{'=' * 50}")
+    print(f"Requests:          {report['requests']} in {report['pipelines']} pipeline(s)")
+    print(f"Billed characters: {report['billed_characters']}")
+    fill = report["fill_ratio"]
+    print(f"Chunk fill:        min {fill['min']:.0%}, mean {fill['mean']:.0%}, max {fill['max']:.0%} "
+          f"of {report['chunk_size']}")
+    print("\nPer voice:")
+    for voice, entry in sorted(report["voices"].items(), key=lambda item: -item[1]["characters"]):
+        print(f"  {voice:28} {entry['tier']:9} {entry['characters']:>9} chars  ${entry['cost_usd']:.4f}")
+    print("\nPer tier:")
+    for tier, entry in sorted(report["tiers"].items()):
+        print(f"  {tier:38} {entry['characters']:>9} chars  ${entry['cost_usd']:.4f}")
+    print(f"\n💰 Estimated cost: ${report['estimated_cost_usd']:.4f}")
+    print(f"⏱️  Predicted wall time: {report['predicted_wall_seconds']:.0f}s at concurrency "
+          f"{report['concurrency']} ({report['sequential_seconds']:.0f}s sequential, "
+          f"{report['latency_model']} latency model, {report['latency_records']} records)")
+    print(f"🎧 Estimated audio length: {report['estimated_audio_seconds'] / 60:.1f} minutes")
+
+def write_estimate(report, json_path):
+    """Writes a dry-run report as JSON"""
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
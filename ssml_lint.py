@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Offline SSML preflight linter
+
+Finds problems the API would otherwise report partway through a paid
+render: malformed XML, unsupported tags and attribute values, unknown
+voices, and chunks over the request limit. Every problem is reported with
+its line and column. Nothing here touches the network unless the voice
+list cache is refreshed.
+
+Usage:
+    python ssml_lint.py lantern_path.ssml
+    python ssml_lint.py lantern_path.ssml --strict
+    python ssml_lint.py lantern_path.ssml --refresh-voices
+"""
+
+import os
+import re
+import json
+import argparse
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+# Tags supported by Google Cloud Text-to-Speech, with the attributes each accepts
+SUPPORTED_TAGS = {
+    'speak': {'xml:lang', 'xmlns', 'version'},
+    'break': {'time', 'strength'},
+    'say-as': {'interpret-as', 'format', 'detail', 'language', 'google:style'},
+    'audio': {'src', 'clipBegin', 'clipEnd', 'speed', 'repeatCount', 'repeatDur', 'soundLevel'},
+    'p': set(),
+    's': set(),
+    'sub': {'alias'},
+    'mark': {'name'},
+    'prosody': {'rate', 'pitch', 'volume'},
+    'emphasis': {'level'},
+    'par': set(),
+    'seq': set(),
+    'media': {'xml:id', 'begin', 'end', 'repeatCount', 'repeatDur', 'soundLevel', 'fadeInDur', 'fadeOutDur'},
+    'phoneme': {'alphabet', 'ph'},
+    'voice': {'name', 'gender', 'language', 'variant', 'ordering'},
+    'lang': {'xml:lang'},
+    'desc': set(),
+}
+
+REQUIRED_ATTRIBUTES = {
+    'say-as': ('interpret-as',),
+    'sub': ('alias',),
+    'phoneme': ('ph',),
+    'audio': ('src',),
+    'mark': ('name',),
+}
+
+KEYWORDS = {
+    ('break', 'strength'): {'none', 'x-weak', 'weak', 'medium', 'strong', 'x-strong'},
+    ('emphasis', 'level'): {'strong', 'moderate', 'none', 'reduced'},
+    ('phoneme', 'alphabet'): {'ipa', 'x-sampa'},
+    ('voice', 'gender'): {'male', 'female', 'neutral'},
+}
+
+PATTERNS = {
+    ('break', 'time'): re.compile(r'\d+(\.\d+)?(ms|s)'),
+    ('prosody', 'rate'): re.compile(r'x-slow|slow|medium|fast|x-fast|default|\d+(\.\d+)?%?'),
+    ('prosody', 'pitch'): re.compile(r'x-low|low|medium|high|x-high|default|[+-]?\d+(\.\d+)?(st|%|Hz)'),
+    ('prosody', 'volume'): re.compile(r'silent|x-soft|soft|medium|loud|x-loud|default|[+-]?\d+(\.\d+)?dB'),
+}
+
+VOICE_NAME = re.compile(r'[a-z]{2,3}-[A-Z]{2}-[A-Za-z0-9]+(-[A-Za-z0-9]+)*')
+
+# The API rejects requests over 5000 bytes
+API_LIMIT = 5000
+
+VOICE_CACHE_FILE = ".tts_voices.json"
+
+def load_voice_cache(path=VOICE_CACHE_FILE):
+    """Voice name -> language codes from the cache, or None if there is no cache"""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["voices"]
+
+def refresh_voice_cache(path=VOICE_CACHE_FILE):
+    """Fetch the voice list from the API and cache it"""
+    from google.cloud import texttospeech
+
+    client = texttospeech.TextToSpeechClient()
+    voices = {voice.name: list(voice.language_codes) for voice in client.list_voices().voices}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"voices": voices}, f, indent=2, sort_keys=True)
+    return voices
+
+def _issue(severity, line, column, message):
+    return {"severity": severity, "line": line, "column": column, "message": message}
+
+def lint_document(ssml, voices=None, voice_segments=False):
+    """
+    Checks an SSML document in one pass. voices maps known voice names to
+    their language codes (see load_voice_cache); without it, voice names
+    are only checked for their shape. A <voice> tag may select a voice of
+    any locale, so a voice is only checked against the locale its own name
+    starts with. With voice_segments, Chirp voices in <voice> tags are
+    fine. Returns a list of issues.
+    """
+    issues = []
+    stack = []
+    parser = expat.ParserCreate()
+
+    def position():
+        # expat columns are 0-based
+        return parser.CurrentLineNumber, parser.CurrentColumnNumber + 1
+
+    def check_voice(name, line, column):
+        if not name:
+            return
+        if not VOICE_NAME.fullmatch(name):
+            issues.append(_issue("error", line, column, f"Malformed voice name '{name}'"))
+            return
+        if voices is not None and name not in voices:
+            issues.append(_issue("error", line, column, f"Unknown voice '{name}'"))
+            return
+        # The locale a voice name starts with (en-GB-Wavenet-B -> en-GB)
+        locale = "-".join(name.split("-")[:2])
+        if voices is not None and locale not in voices[name]:
+            issues.append(_issue("warning", line, column, f"Voice '{name}' is not listed for its locale {locale}"))
+        if not voice_segments and re.search(r'-(Chirp3?-HD|Chirp)-', name):
+            issues.append(_issue("error", line, column,
+                                 f"Chirp voice '{name}' cannot be selected with <voice> - use --voice-segments"))
+
+    def start(tag, attributes):
+        line, column = position()
+        if tag not in SUPPORTED_TAGS:
+            issues.append(_issue("error", line, column, f"Unsupported tag <{tag}>"))
+        else:
+            for name in attributes:
+                if name not in SUPPORTED_TAGS[tag] and not name.startswith("xmlns"):
+                    issues.append(_issue("warning", line, column, f"Unknown attribute '{name}' on <{tag}>"))
+            for name in REQUIRED_ATTRIBUTES.get(tag, ()):
+                if name not in attributes:
+                    issues.append(_issue("error", line, column, f"<{tag}> is missing required attribute '{name}'"))
+            for name, value in attributes.items():
+                allowed = KEYWORDS.get((tag, name))
+                if allowed is not None and value not in allowed:
+                    issues.append(_issue("error", line, column, f"Invalid {name}=\"{value}\" on <{tag}>"))
+                pattern = PATTERNS.get((tag, name))
+                if pattern is not None and not pattern.fullmatch(value.strip()):
+                    issues.append(_issue("error", line, column, f"Invalid {name}=\"{value}\" on <{tag}>"))
+
+        if tag == 'speak' and stack:
+            issues.append(_issue("error", line, column, "Nested <speak>"))
+        if tag == 'voice':
+            check_voice(attributes.get('name'), line, column)
+            if 'voice' in stack:
+                issues.append(_issue("warning", line, column, "<voice> nested inside another <voice>"))
+        stack.append(tag)
+
+    def end(tag):
+        stack.pop()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    try:
+        parser.Parse(ssml, True)
+    except expat.ExpatError as e:
+        issues.append(_issue("error", e.lineno, e.offset + 1, f"Malformed XML: {expat.ErrorString(e.code)}"))
+    return issues
+
+def lint_file(path, voices=None, voice_segments=False):
+    """lint_document for a file"""
+    with open(path, "r", encoding="utf-8") as f:
+        return lint_document(f.read(), voices, voice_segments)
+
+def is_malformed(issues):
+    """True if the document could not be parsed at all"""
+    return any(issue["message"].startswith("Malformed XML") for issue in issues)
+
+def lint_chunks(chunks):
+    """Checks the requests a render would send for size and well-formedness"""
+    issues = []
+    for number, chunk in enumerate(chunks, 1):
+        size = len(chunk.encode("utf-8"))
+        if size > API_LIMIT:
+            issues.append(_issue("error", None, None, f"Chunk {number} is {size} bytes (limit {API_LIMIT})"))
+        try:
+            ET.fromstring(chunk)
+        except ET.ParseError as e:
+            issues.append(_issue("error", None, None, f"Chunk {number} is not well-formed: {e}"))
+    return issues
+
+def fails(issues, strict=False):
+    """True if the issues fail a check: any error, or with strict any issue at all"""
+    return any(strict or issue["severity"] == "error" for issue in issues)
+
+def print_issues(issues, path):
+    """Prints issues in file:line:column form"""
+    for issue in issues:
+        icon = "❌" if issue["severity"] == "error" else "⚠️ "
+        where = f"{path}:{issue['line']}:{issue['column']}" if issue["line"] else path
+        print(f"{icon} {where}: {issue['message']}")
+    errors = sum(1 for issue in issues if issue["severity"] == "error")
+    if issues:
+        print(f"🔎 {errors} errors, {len(issues) - errors} warnings")
+    else:
+        print(f"✅ {path}: no problems found")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check an SSML file for problems before sending it to the API"
+    )
+    parser.add_argument("input", help="Input SSML file path")
+    parser.add_argument(
+        "-c", "--chunk-size",
+        type=int,
+        default=4500,
+        help="Chunk size used to check the requests that would be sent (default: 4500)"
+    )
+    parser.add_argument(
+        "--voices-cache",
+        default=VOICE_CACHE_FILE,
+        help=f"Cached voice list used to check voice names (default: {VOICE_CACHE_FILE})"
+    )
+    parser.add_argument(
+        "--refresh-voices",
+        action="store_true",
+        help="Fetch the voice list from the API and update the cache first"
+    )
+    parser.add_argument(
+        "--credentials",
+        default="experiemental-456622-bae3adc875eb.json",
+        help="Google Cloud credentials JSON file, for --refresh-voices"
+    )
+    parser.add_argument("--strict", action="store_true", help="Exit with an error on warnings too")
+    args = parser.parse_args()
+
+    if args.refresh_voices:
+        os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.credentials
+        voices = refresh_voice_cache(args.voices_cache)
+        print(f"📋 Cached {len(voices)} voices in {args.voices_cache}")
+    else:
+        voices = load_voice_cache(args.voices_cache)
+        if voices is None:
+            print(f"ℹ️  No voice cache ({args.voices_cache}) - checking voice name format only. "
+                  f"Run with --refresh-voices to create it.")
+
+    # Chunks come from the converters' own chunking
+    from chunking import build_plan, plan_requests, read_ssml_content
+
+    issues = lint_file(args.input, voices)
+    if not is_malformed(issues):
+        plan, _ = build_plan(read_ssml_content(args.input), args.chunk_size)
+        issues += lint_chunks([item["ssml"] for item in plan_requests(plan)])
+
+    print_issues(issues, args.input)
+    raise SystemExit(1 if fails(issues, args.strict) else 0)
+
+if __name__ == "__main__":
+    main()
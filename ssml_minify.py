@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+SSML minifier
+
+Removes whitespace that does not change how SSML is spoken and merges
+adjacent <voice> blocks with the same voice, so fewer characters count
+towards the API's request limit and the billed total.
+
+Usage:
+    python ssml_minify.py lantern_path.ssml
+    python ssml_minify.py lantern_path.ssml -o lantern_path.min.ssml
+"""
+
+import re
+import argparse
+import xml.etree.ElementTree as ET
+
+# Elements that start and end on a boundary of speech - whitespace next to
+# them is never spoken. Inline elements (emphasis, prosody, say-as, ...) keep
+# the single space that separates them from neighbouring words.
+BLOCK_TAGS = {'speak', 'voice', 'p', 'paragraph', 's', 'sentence', 'break', 'par', 'seq', 'audio', 'root'}
+
+WHITESPACE = re.compile(r'\s+')
+
+def _collapse(text):
+    return WHITESPACE.sub(' ', text) if text else text
+
+def _is_block(element):
+    return element is not None and element.tag in BLOCK_TAGS
+
+def strip_whitespace(element):
+    """Collapses whitespace runs and drops whitespace at block boundaries, in place"""
+    children = list(element)
+    element.text = _collapse(element.text)
+    if element.text and _is_block(element):
+        # Start of a block, or between the block start and a block child
+        if not children or _is_block(children[0]):
+            element.text = element.text.lstrip()
+        if not children:
+            element.text = element.text.rstrip()
+        if children and _is_block(children[0]) and not element.text.strip():
+            element.text = None
+
+    for index, child in enumerate(children):
+        strip_whitespace(child)
+        following = children[index + 1] if index + 1 < len(children) else None
+        child.tail = _collapse(child.tail)
+        if not child.tail:
+            continue
+        if _is_block(child):
+            child.tail = child.tail.lstrip()
+        if following is None and _is_block(element):
+            child.tail = child.tail.rstrip()
+        elif _is_block(following):
+            child.tail = child.tail.rstrip()
+        if not child.tail:
+            child.tail = None
+
+def coalesce_voices(root, max_chars=None, across_breaks=False):
+    """
+    Merges consecutive top-level <voice> blocks with identical attributes,
+    separated only by whitespace, into one block. With max_chars, a merged
+    block never grows past that size, so it still fits in one chunk.
+
+    With across_breaks, blocks separated by <break>s are merged too and the
+    breaks move inside the merged block. The chunker does that within a
+    chunk, once it has taken the breaks at chunk edges out as local silence
+    (see chunking.plan_ssml_chunks); before chunking, a break inside a
+    <voice> could no longer become silence.
+
+    Returns the number of <voice> blocks removed.
+    """
+    merged = 0
+    children = list(root)
+    result = []
+    index = 0
+    while index < len(children):
+        element = children[index]
+        result.append(element)
+        index += 1
+        if element.tag != 'voice' or (element.tail and element.tail.strip()):
+            continue
+        size = len(ET.tostring(element, encoding='unicode'))
+
+        while True:
+            # Look past breaks (and nothing else) for the next block, if allowed
+            lookahead = index
+            while (across_breaks and lookahead < len(children) and children[lookahead].tag == 'break'
+                   and not (children[lookahead].tail and children[lookahead].tail.strip())):
+                lookahead += 1
+            if lookahead >= len(children):
+                break
+            candidate = children[lookahead]
+            if candidate.tag != 'voice' or candidate.attrib != element.attrib:
+                break
+            between = children[index:lookahead]
+            extra = sum(len(ET.tostring(e, encoding='unicode')) for e in between)
+            extra += len(ET.tostring(candidate, encoding='unicode')) - len(_open_tag(candidate)) - len('</voice>')
+            if max_chars and size + extra > max_chars:
+                break
+
+            for moved in between:
+                element.append(moved)
+            if candidate.text:
+                if len(element):
+                    element[-1].tail = (element[-1].tail or "") + candidate.text
+                else:
+                    element.text = (element.text or "") + candidate.text
+            for child in list(candidate):
+                element.append(child)
+            element.tail = candidate.tail
+            size += extra
+            merged += 1
+            index = lookahead + 1
+            if element.tail and element.tail.strip():
+                break
+
+    for child in list(root):
+        root.remove(child)
+    root.extend(result)
+    return merged
+
+def _open_tag(element):
+    attributes = "".join(f' {name}="{value}"' for name, value in element.attrib.items())
+    return f"<{element.tag}{attributes}>"
+
+def minify_ssml(ssml_content: str, max_chars: int = None):
+    """
+    Minifies SSML content (the inside of <speak>, or a whole document).
+
+    Returns (minified, stats) where stats counts characters before and after
+    and the number of <voice> blocks merged, and tells whether the content
+    was a whole document (minified then keeps its <speak>).
+    """
+    root = ET.fromstring(f"<root>{ssml_content}</root>")
+    document = len(root) == 1 and root[0].tag == 'speak' and not (root.text or "").strip()
+    target = root[0] if document else root
+
+    strip_whitespace(target)
+    merged = coalesce_voices(target, max_chars)
+    strip_whitespace(target)
+
+    if document:
+        minified = ET.tostring(target, encoding='unicode')
+    else:
+        minified = (target.text or "") + "".join(ET.tostring(child, encoding='unicode') for child in target)
+    stats = {
+        "characters_before": len(ssml_content),
+        "characters_after": len(minified),
+        "bytes_before": len(ssml_content.encode("utf-8")),
+        "bytes_after": len(minified.encode("utf-8")),
+        "voice_blocks_merged": merged,
+        "document": document,
+    }
+    return minified, stats
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Minify SSML and report the bytes and chunks saved"
+    )
+    parser.add_argument("input", help="Input SSML file path")
+    parser.add_argument("-o", "--output", help="Write the minified SSML here")
+    parser.add_argument(
+        "-c", "--chunk-size",
+        type=int,
+        default=4500,
+        help="Chunk size used to count chunks and cap merged <voice> blocks (default: 4500)"
+    )
+    args = parser.parse_args()
+
+    # Chunk counts come from the converters' own chunking
+    from chunking import build_plan, plan_requests, read_ssml_content
+
+    content = read_ssml_content(args.input)
+    minified, stats = minify_ssml(content, args.chunk_size)
+    chunks_before = len(plan_requests(build_plan(content, args.chunk_size)[0]))
+    chunks_after = len(plan_requests(build_plan(content, args.chunk_size, minify=True)[0]))
+
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    print(f"🗜️  {args.input}")
+    print(f"   Bytes:  {stats['bytes_before']} → {stats['bytes_after']} "
+          f"(saved {saved}, {saved / max(stats['bytes_before'], 1):.0%})")
+    print(f"   Chunks: {chunks_before} → {chunks_after} at {args.chunk_size} characters")
+    print(f"   Merged {stats['voice_blocks_merged']} <voice> blocks")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(f"{minified}\n" if stats["document"] else f"<speak>{minified}</speak>\n")
+        print(f"✅ Minified SSML saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Range selection for partial renders
+
+A range picks part of a document with a selector:
+
+    chapter:3                       chapter 3 (indices as in --chapters)
+    chapter:2-4                     chapters 2 to 4
+    p:12                            the 12th <p> in the document, from 1
+    p:10-14                         paragraphs 10 to 14
+    /voice[5]                       the 5th top-level <voice> block
+    //voice[@name='en-GB-Wavenet-D']
+                                    an ElementTree XPath expression
+
+A range is rendered as the requests of the full render that contain it,
+exactly as the full render would send them. The preview keeps the voice
+context of the selection, and its chunks can be reused from the chunk cache
+by the next full render.
+"""
+
+import re
+import xml.etree.ElementTree as ET
+
+import chapters
+
+RANGE = re.compile(r'(chapter|p):(\d+)(?:-(\d+))?')
+
+def _bounds(first, last):
+    first = int(first)
+    last = int(last) if last else first
+    if last < first:
+        raise ValueError(f"Range {first}-{last} is backwards")
+    return first, last
+
+def select_elements(root, selector: str):
+    """Elements of a parsed document (wrapped in <root>) selected by selector"""
+    match = RANGE.fullmatch(selector.strip())
+    if match:
+        kind, first, last = match.group(1), *_bounds(match.group(2), match.group(3))
+        if kind == "chapter":
+            groups = chapters.group_chapters(root)
+            if first >= len(groups):
+                raise ValueError(f"No chapter {first} - the document has chapters 0 to {len(groups) - 1}")
+            return [element for group in groups[first:last + 1] for element in group["elements"]]
+        paragraphs = list(root.iter('p'))
+        if first < 1 or first > len(paragraphs):
+            raise ValueError(f"No paragraph {first} - the document has {len(paragraphs)} paragraphs")
+        return paragraphs[first - 1:last]
+
+    path = selector.strip()
+    # Paths are relative to the document; a leading /speak is the document itself
+    path = re.sub(r'^/speak(?=/|$)', '', path)
+    if path.startswith('/'):
+        path = '.' + path
+    try:
+        selected = root.findall(path)
+    except (SyntaxError, TypeError):
+        raise ValueError(f"Invalid selector '{selector}' - expected chapter:N, p:N or an ElementTree XPath")
+    if not selected:
+        raise ValueError(f"Selector '{selector}' matches nothing")
+    return selected
+
+def _word_spans(root):
+    """
+    Word offsets [start, end) of every element in document order. Loose
+    top-level text is counted too, as both chunkers send it.
+    """
+    spans = {}
+    position = len((root.text or "").split())
+
+    def walk(element):
+        nonlocal position
+        start = position
+        position += len((element.text or "").split())
+        for child in element:
+            walk(child)
+            position += len((child.tail or "").split())
+        spans[element] = (start, position)
+
+    for child in root:
+        walk(child)
+        position += len((child.tail or "").split())
+    return spans
+
+def _request_words(item):
+    root = ET.fromstring(item["ssml"])
+    return len(" ".join(root.itertext()).split())
+
+def range_plan(ssml_content: str, plan, selector: str):
+    """
+    The part of a full render plan that covers the selected range: every
+    request that contains selected words, and the silence between them.
+
+    Returns (plan, info) where info counts the selected elements and the
+    requests kept out of all requests.
+    """
+    root = ET.fromstring(f"<root>{ssml_content}</root>")
+    selected = select_elements(root, selector)
+    spans = _word_spans(root)
+    wanted = []
+    for element in selected:
+        start, end = spans[element]
+        wanted.append((start, max(end, start + 1)))  # Elements with no words still pick their request
+
+    keep = set()
+    position = 0
+    for index, item in enumerate(plan):
+        if "silence_ms" in item:
+            continue
+        words = _request_words(item)
+        start, end = position, position + words
+        position += words
+        if any(start < wanted_end and wanted_start < end for wanted_start, wanted_end in wanted):
+            keep.add(index)
+
+    # Silence between two kept requests stays, so the preview sounds as it will in the book
+    result = []
+    silence = []
+    previous_kept = False
+    for index, item in enumerate(plan):
+        if "silence_ms" in item:
+            if previous_kept:
+                silence.append(item)
+            continue
+        if index in keep:
+            if previous_kept:
+                result += silence
+            result.append(item)
+        previous_kept = index in keep
+        silence = []
+
+    info = {"elements": len(selected), "requests": len(keep),
+            "total_requests": sum(1 for item in plan if "silence_ms" not in item)}
+    return result, info
@@ -0,0 +1,427 @@
+"""
+Synthesis engine
+
+A Synthesizer holds one Text-to-Speech client together with its voice and
+audio settings. It turns SSML or plain text into a render plan, and renders
+plans to an encoded file or streams them as PCM. Long-lived services create
+one Synthesizer and reuse its gRPC channel for every document. The
+command-line converters create one per run.
+
+    from synthesizer import Synthesizer
+
+    engine = Synthesizer()
+    engine.synthesize_ssml(open("lantern_path.ssml").read(), "lantern_path.mp3")
+    for pcm in engine.stream_text("Hello there."):
+        ...
+"""
+
+import os
+import time
+from functools import lru_cache
+from collections import Counter, deque
+
+import audio_export
+import time_stretch
+from chunking import DEFAULT_CHUNK_SIZE, build_plan, plan_requests, text_plan, text_to_chunks
+from memory_profile import NullProfiler
+from pcm_buffer import PcmBuffer, SAMPLE_RATE, SAMPLE_WIDTH, decode_response
+from render_history import record_request
+from render_planner import (DEFAULT_VOICE, describe_ssml_request, describe_text_request, request_tier,
+                            request_voice)
+
+def item_input(item):
+    """The SSML or text a plan item sends"""
+    return item["ssml"] if "ssml" in item else item["text"]
+
+def texttospeech_api(time_pointing: bool = False):
+    """The texttospeech module; timepoints are only available in v1beta1"""
+    if time_pointing:
+        from google.cloud import texttospeech_v1beta1 as texttospeech
+    else:
+        from google.cloud import texttospeech
+    return texttospeech
+
+def synthesis_settings(voice_name=None, time_pointing: bool = False, sample_rate: int = SAMPLE_RATE):
+    """
+    Returns the (voice, audio_config) pair used for every request.
+    """
+    texttospeech = texttospeech_api(time_pointing)
+
+    # Request raw PCM at a fixed rate so chunks can be appended to disk as-is
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+        sample_rate_hertz=sample_rate
+    )
+
+    if voice_name:
+        return voice_selection(voice_name, time_pointing), audio_config
+
+    # Voice configuration - required by API even when SSML has voice tags
+    voice = texttospeech.VoiceSelectionParams(
+        language_code="en-US",
+        ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+    )
+    return voice, audio_config
+
+@lru_cache(maxsize=None)
+def voice_selection(voice_name, time_pointing: bool = False):
+    """VoiceSelectionParams that pick a voice by name, e.g. en-US-Chirp-HD-F"""
+    return texttospeech_api(time_pointing).VoiceSelectionParams(
+        language_code="-".join(voice_name.split("-")[:2]),
+        name=voice_name
+    )
+
+def describe_plan_item(item):
+    """Request description of a plan item, crediting its segment voice if it has one"""
+    if "text" in item:
+        return describe_text_request(item["text"], item.get("voice") or DEFAULT_VOICE)
+    request = describe_ssml_request(item["ssml"])
+    if item.get("voice"):
+        request["voices"] = {item["voice"]: request["characters"]}
+    return request
+
+def synthesize_chunk(client, chunk: str, voice, audio_config, request=None, hedge=None, text: bool = False,
+                     time_pointing: bool = False):
+    """
+    Synthesizes one SSML chunk (or plain text, with text) and records its
+    latency, hedging the request when a HedgePolicy is given. With
+    time_pointing (a v1beta1 client), the response carries the time of
+    every <mark> in the chunk.
+    """
+    texttospeech = texttospeech_api(time_pointing)
+
+    if request is None:
+        request = describe_text_request(chunk, DEFAULT_VOICE) if text else describe_ssml_request(chunk)
+    tier = request_tier(request)
+    voice_name = request_voice(request)
+    synthesis_input = texttospeech.SynthesisInput(text=chunk) if text else texttospeech.SynthesisInput(ssml=chunk)
+
+    def call():
+        if time_pointing:
+            return client.synthesize_speech(request=texttospeech.SynthesizeSpeechRequest(
+                input=synthesis_input,
+                voice=voice,
+                audio_config=audio_config,
+                enable_time_pointing=[texttospeech.SynthesizeSpeechRequest.TimepointType.SSML_MARK]
+            ))
+        # Always provide voice parameter - it acts as a fallback
+        return client.synthesize_speech(
+            input=synthesis_input,
+            voice=voice,
+            audio_config=audio_config
+        )
+
+    if hedge:
+        return hedge.call(call, tier, len(chunk), voice_name)
+
+    started = time.perf_counter()
+    try:
+        response = call()
+    except Exception:
+        record_request(tier, len(chunk), time.perf_counter() - started, ok=False, voice=voice_name)
+        raise
+    record_request(tier, len(chunk), time.perf_counter() - started, voice=voice_name)
+    return response
+
+def iter_plan_audio(client, plan, voice, audio_config, log=print, hedge=None, concurrency: int = 1, cache=None,
+                    time_pointing: bool = False, rejections=None, checks=None):
+    """
+    Synthesizes a render plan and yields (item, pcm_bytes, request, marks)
+    in plan order; silence items yield (item, None, None, None). With
+    time_pointing, marks lists (mark name, seconds into the chunk).
+
+    Up to `concurrency` requests are in flight ahead of the one being
+    yielded. The plan may be a lazy iterator; it is read only that far
+    ahead. Identical requests (repeated phrases) are synthesized once and
+    their audio is kept only until its last occurrence has been yielded
+    (for a lazy plan, the last one read ahead).
+    With a ChunkCache, cached chunks are not requested again and new ones
+    are stored. With a RejectionPolicy (see chunk_bisect), a chunk the API
+    rejects is split and retried instead of failing the render. With a
+    ChunkCheck (see chunk_check), silent or truncated audio is requested
+    again; chunks that stay suspect are not cached.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def plan_key(item):
+        return item.get("voice"), item_input(item)
+
+    # A list plan is counted up front, so repeated phrases are reused across the whole plan
+    sized = isinstance(plan, list)
+    total = len(plan_requests(plan)) if sized else None
+    remaining = Counter(plan_key(item) for item in plan_requests(plan)) if sized else Counter()
+    pending = {}
+
+    def synthesize(item, request, number):
+        item_voice = voice_selection(item["voice"], time_pointing) if item.get("voice") else voice
+        if cache:
+            key = cache.key(item, item_voice, audio_config)
+            samples = cache.get(key)
+            marks = cache.get_marks(key) if time_pointing and samples is not None else None
+            if samples is not None and (marks is not None or not time_pointing):
+                return samples, marks
+
+        suspect = []
+
+        def request_audio(fragment):
+            fragment_request = request if fragment is item else describe_plan_item(fragment)
+
+            def attempt():
+                response = synthesize_chunk(client, item_input(fragment), item_voice, audio_config, fragment_request,
+                                            hedge, text="text" in fragment, time_pointing=time_pointing)
+                samples = decode_response(response.audio_content, audio_config.sample_rate_hertz)
+                if not time_pointing:
+                    return samples, None
+                return samples, [(point.mark_name, point.time_seconds) for point in response.timepoints]
+
+            if not checks:
+                return attempt()
+            samples, marks, ok = checks.synthesize(attempt, fragment_request, number, audio_config.sample_rate_hertz)
+            if not ok:
+                suspect.append(fragment)
+            return samples, marks
+
+        if rejections:
+            samples, marks, complete = rejections.synthesize(item, request_audio, number,
+                                                             audio_config.sample_rate_hertz)
+        else:
+            (samples, marks), complete = request_audio(item), True
+        # Chunks with fragments left out or suspect audio are not cached, so
+        # the next render requests them again
+        if cache and complete and not suspect:
+            cache.put(key, samples, marks)
+        return samples, marks
+
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        items = iter(plan)
+        window = deque()  # Items read ahead: (item, key, number), key None for silence
+        ahead = 0         # Requests in the window
+        submitted = 0
+        exhausted = False
+        while True:
+            # Keep up to `concurrency` requests in flight ahead of the one being yielded
+            while not exhausted and ahead < max(1, concurrency):
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                elif "silence_ms" in item:
+                    window.append((item, None, None))
+                else:
+                    submitted += 1
+                    key = plan_key(item)
+                    if not sized:
+                        remaining[key] += 1
+                    if key not in pending:
+                        request = describe_plan_item(item)
+                        pending[key] = (executor.submit(synthesize, item, request, submitted), request, submitted)
+                    window.append((item, key, submitted))
+                    ahead += 1
+            if not window:
+                return
+
+            item, key, number = window.popleft()
+            if key is None:
+                yield item, None, None, None
+                continue
+            ahead -= 1
+
+            future, request, first_number = pending[key]
+            of_total = f" of {total}" if total is not None else ""
+            if first_number != number:
+                log(f"  - Reusing audio for chunk {number}{of_total} (repeated phrase)...")
+            else:
+                log(f"  - Processing chunk {number}{of_total}...")
+            samples, marks = future.result()
+            remaining[key] -= 1
+            if not remaining[key]:
+                del pending[key]
+            yield item, samples, request, marks
+    finally:
+        # Don't send the requests still queued behind a failure or an abandoned stream
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def render_plan(client, plan, output_path: str, voice, audio_config, log=print, postprocess=None,
+                hedge=None, concurrency: int = 1, profiler=None, cache=None, marks=None, exports=(),
+                encode_workers: int = None, rejections=None, rate_variants=(), checks=None):
+    """
+    Synthesizes a render plan (a list, or an iterator read as the render
+    goes) and encodes it into output_path.
+
+    Up to `concurrency` requests are in flight at once and their audio is
+    appended in plan order. Samples go straight to a PCM file on disk, so
+    memory use does not grow with the length of the book. With postprocess
+    settings, chunk edges are trimmed and crossfaded as they are appended and
+    loudness is normalized in one pass over the buffer before encoding.
+    A MemoryProfiler records the synthesize/postprocess/encode stages, and
+    a ChunkCache supplies and keeps chunk audio. If marks is a list, the
+    client must be a v1beta1 client; the <mark> timepoints of every chunk
+    are shifted to the chunk's place in the output and appended to it as
+    (name, seconds). The buffer is encoded once into output_path and every
+    path in exports (format by extension, see audio_export) by up to
+    encode_workers ffmpeg processes. A RejectionPolicy bisects rejected
+    chunks, and a ChunkCheck requests silent or truncated ones again.
+    Each rate in rate_variants is stretched locally from the same buffer
+    and encoded to every output path with a _1.25x style suffix (see
+    time_stretch). Returns the duration in seconds.
+    """
+    profiler = profiler or NullProfiler()
+
+    with PcmBuffer(sample_rate=audio_config.sample_rate_hertz,
+                   directory=os.path.dirname(os.path.abspath(output_path))) as pcm:
+        joins = None
+        if postprocess:
+            import audio_postprocess
+            joins = audio_postprocess.JoinProcessor(pcm)
+        requests = 0
+
+        with profiler.stage("synthesize"):
+            for item, samples, request, chunk_marks in iter_plan_audio(client, plan, voice, audio_config, log,
+                                                                       hedge, concurrency, cache, marks is not None,
+                                                                       rejections, checks):
+                if samples is None:
+                    if joins:
+                        joins.add_silence(item["silence_ms"])
+                    else:
+                        pcm.append_silence(item["silence_ms"])
+                    continue
+                requests += 1
+                if joins:
+                    # A chunk is one loudness group per set of voices: audio is not split by voice within a chunk
+                    offset = joins.add_chunk(samples, " + ".join(sorted(request["voices"])) or None)
+                else:
+                    offset = pcm.num_samples
+                    pcm.append(samples)
+                for name, seconds in chunk_marks or ():
+                    marks.append((name, max(0.0, (offset + seconds * pcm.sample_rate) / pcm.sample_rate)))
+
+        if not requests:
+            return 0.0
+
+        if joins:
+            with profiler.stage("postprocess"):
+                joins.finish()
+                gains, measured = audio_postprocess.loudness_gains(
+                    joins.segments, postprocess["lufs"], postprocess["per_voice"]
+                )
+                audio_postprocess.apply_gains(pcm, joins.segments, gains)
+            log(f"  - Trimmed {joins.trimmed_samples / pcm.sample_rate:.1f}s of edge silence, "
+                f"crossfaded {max(len(joins.segments) - 1, 0)} joins")
+            for group, (loudness, reached) in measured.items():
+                capped = " (capped at peak headroom)" if reached < postprocess["lufs"] - 0.05 else ""
+                log(f"  - Loudness ({group}): {loudness:.1f} → {reached:.1f} LUFS{capped}")
+
+        with profiler.stage("encode"):
+            audio_export.export(pcm, [output_path, *exports], encode_workers)
+
+        for rate in rate_variants:
+            paths = [time_stretch.variant_path(path, rate) for path in [output_path, *exports]]
+            with profiler.stage("stretch"):
+                stretched = time_stretch.stretch_pcm(pcm, rate, os.path.dirname(os.path.abspath(output_path)))
+            with stretched:
+                with profiler.stage("encode variants"):
+                    audio_export.export(stretched, paths, encode_workers)
+                log(f"  - {rate:g}x variant ({stretched.duration_seconds:.0f}s): {', '.join(paths)}")
+        return pcm.duration_seconds
+
+def _quiet(message):
+    pass
+
+class Synthesizer:
+    """
+    A reusable synthesis engine: one client and one set of voice and audio
+    settings, shared by every document it renders. It can be used from
+    several threads at once.
+
+    voice_name is the fallback voice (the API's neutral en-US voice if not
+    given); SSML <voice> tags still choose the voice of what they wrap. A
+    ChunkCache (see chunk_cache) is shared by every render. time_pointing
+    uses the v1beta1 API, so renders can collect <mark> timepoints.
+    encode_workers caps the ffmpeg processes of each encode (default: one
+    per core). A RejectionPolicy (see chunk_bisect) splits and retries
+    chunks the API rejects, and collects the fragments that still fail. A
+    ChunkCheck (see chunk_check) requests silent or truncated chunks again.
+    sample_rate is the rate requested from the API and rendered at.
+    """
+
+    def __init__(self, voice_name: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE, concurrency: int = 1,
+                 postprocess=None, hedge=None, client=None, cache=None, time_pointing: bool = False,
+                 encode_workers: int = None, rejections=None, sample_rate: int = SAMPLE_RATE, checks=None):
+        texttospeech = texttospeech_api(time_pointing)
+
+        self.voice_name = voice_name
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.postprocess = postprocess
+        self.hedge = hedge
+        self.cache = cache
+        self.time_pointing = time_pointing
+        self.encode_workers = encode_workers
+        self.rejections = rejections
+        self.checks = checks
+        self.client = client or texttospeech.TextToSpeechClient()
+        self.sample_rate = sample_rate
+        self.voice, self.audio_config = synthesis_settings(voice_name, time_pointing, sample_rate)
+
+    def plan_ssml(self, ssml_content: str, dedupe_phrases: bool = False, voice_segments: bool = False,
+                  minify: bool = False):
+        """Render plan for SSML content (the inside of <speak>, see chunking)"""
+        plan, _ = build_plan(ssml_content, self.chunk_size, dedupe_phrases, voice_segments, minify)
+        return plan
+
+    def plan_text(self, text: str):
+        """Render plan for plain text, split at paragraph and sentence boundaries"""
+        return text_plan(text_to_chunks(text, self.chunk_size), self.voice_name)
+
+    def render(self, plan, output_path: str, log=print, profiler=None, concurrency: int = None, marks=None,
+               exports=(), rate_variants=()):
+        """
+        Synthesizes a plan into output_path, and into every path in exports
+        in the format of its extension, plus locally stretched rate_variants
+        (see render_plan). Returns the duration in seconds. With
+        time_pointing, timepoints go into marks.
+        """
+        if marks is not None and not self.time_pointing:
+            raise ValueError("Timepoints need a Synthesizer created with time_pointing=True")
+        return render_plan(self.client, plan, output_path, self.voice, self.audio_config, log,
+                           self.postprocess, self.hedge, concurrency or self.concurrency, profiler, self.cache, marks,
+                           exports, self.encode_workers, self.rejections, rate_variants, self.checks)
+
+    def synthesize_ssml(self, ssml_content: str, output_path: str, dedupe_phrases: bool = False,
+                        voice_segments: bool = False, minify: bool = False, log=print, profiler=None):
+        """Synthesizes SSML content into output_path and returns its duration in seconds"""
+        plan = self.plan_ssml(ssml_content, dedupe_phrases, voice_segments, minify)
+        return self.render(plan, output_path, log, profiler)
+
+    def synthesize_text(self, text: str, output_path: str, log=print, profiler=None):
+        """Synthesizes plain text into output_path and returns its duration in seconds"""
+        return self.render(self.plan_text(text), output_path, log, profiler)
+
+    def synthesize_chunk(self, item, voice=None):
+        """Synthesizes one plan item (or SSML string) and returns its PCM, with an optional voice override"""
+        if isinstance(item, str):
+            item = {"ssml": item}
+        if voice is None:
+            voice = voice_selection(item["voice"], self.time_pointing) if item.get("voice") else self.voice
+        response = synthesize_chunk(self.client, item_input(item), voice, self.audio_config,
+                                    describe_plan_item(item), self.hedge, text="text" in item,
+                                    time_pointing=self.time_pointing)
+        return decode_response(response.audio_content, self.sample_rate)
+
+    def stream(self, plan, log=_quiet, concurrency: int = None):
+        """
+        Yields the plan's audio in order, one request (or silence) at a time,
+        as raw mono LINEAR16 PCM at the engine's sample_rate. Post-processing
+        needs the whole render, so streams are never post-processed.
+        """
+        for item, samples, _, _ in iter_plan_audio(self.client, plan, self.voice, self.audio_config, log,
+                                                   self.hedge, concurrency or self.concurrency, self.cache,
+                                                   self.time_pointing, self.rejections, self.checks):
+            if samples is None:
+                yield b"\x00" * (SAMPLE_WIDTH * int(round(self.sample_rate * item["silence_ms"] / 1000)))
+            else:
+                yield samples
+
+    def stream_text(self, text: str, log=_quiet):
+        """Streams plain text as PCM (see stream)"""
+        return self.stream(self.plan_text(text), log)
@@ -0,0 +1,60 @@
+"""
+Segmented export keeps the timing of the PCM
+
+Run with pytest. Needs ffmpeg and NumPy; no API calls.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import audio_export
+from pcm_buffer import PcmBuffer, find_ffmpeg
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+def _speech_like(pcm, seconds):
+    """Tones with short pauses, so seams have quiet windows to land in"""
+    rng = np.random.default_rng(0)
+    for index in range(seconds // 2):
+        t = np.arange(pcm.sample_rate * 19 // 10) / pcm.sample_rate
+        tone = np.sin(2 * np.pi * (160 + 7 * index) * t) * 6000 + rng.standard_normal(len(t)) * 500
+        pcm.append(tone.astype("<i2").tobytes())
+        pcm.append_silence(100)
+
+def _decoded_samples(path, sample_rate):
+    command = [find_ffmpeg(), "-loglevel", "error", "-i", path, "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-"]
+    return len(subprocess.run(command, capture_output=True, check=True).stdout) // 2
+
+@pytest.mark.parametrize("sample_rate", [24000, 16000])
+def test_segmented_export_keeps_pcm_duration(tmp_path, sample_rate):
+    paths = [str(tmp_path / "book.mp3"), str(tmp_path / "book.opus"), str(tmp_path / "book.m4b")]
+    with PcmBuffer(sample_rate=sample_rate, directory=tmp_path) as pcm:
+        _speech_like(pcm, 4 * audio_export.MIN_SEGMENT_SECONDS + 10)
+        assert audio_export.export(pcm, paths, workers=4) == 4
+        for path in paths:
+            # Seams add nothing; MP3 may keep the padding of its last frame
+            frame = audio_export.frame_samples(audio_export.output_format(path), sample_rate)
+            drift = _decoded_samples(path, sample_rate) - pcm.num_samples
+            assert 0 <= drift < frame, f"{os.path.basename(path)} is {drift} samples off"
+
+def test_segment_frames_line_up_across_seams():
+    outputs = [("book.mp3", "mp3"), ("book.opus", "opus"), ("book.m4b", "m4b")]
+    sample_rate = 24000
+    seams = [0, 1_440_123, 2_880_777, 4_000_000]
+    jobs = audio_export.segment_jobs(seams, outputs, sample_rate, seams[-1])
+    for number, (_, name) in enumerate(outputs):
+        frame = audio_export.frame_samples(name, sample_rate)
+        kept_end = 0
+        for start, _, parts in jobs:
+            _, skip, first, stop = parts[number]
+            encoder_start = start + skip
+            assert encoder_start % frame == 0
+            # The segment's first kept frame starts where the previous one's kept frames end
+            assert encoder_start + first * frame == kept_end
+            if stop is not None:
+                kept_end = encoder_start + stop * frame
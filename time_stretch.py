@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Pitch-preserving time-stretch (WSOLA) for speaking-rate variants
+
+A 1.25x or 0.85x edition can be derived from the stitched PCM of a normal
+render instead of being synthesized again with a different speaking_rate.
+WSOLA (waveform-similarity overlap-add) cuts the input into overlapping
+Hann-windowed frames, takes them at `rate` times the output hop, and nudges
+each one by up to a few ms so its waveform lines up with the natural
+continuation of the previous frame. Pitch and timbre are kept, and only the
+timing changes.
+
+Frames are processed in blocks: each block reads one slice of the
+memory-mapped input, searches the frame offsets on a decimated copy (refined
+at full resolution), then windows and overlap-adds all of its frames at
+once with NumPy. Memory use stays at one block, however long the book.
+
+    python time_stretch.py book.wav --rate 1.25 -o book_1.25x.mp3
+    python time_stretch.py compare sample.ssml --rate 1.25 --range p:1-3
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from pcm_buffer import PcmBuffer, SAMPLE_RATE
+
+# Analysis frame and search tolerance
+FRAME_MS = 30
+TOLERANCE_MS = 8
+
+# The coarse search compares every DECIMATE-th sample
+DECIMATE = 4
+
+# Output frames per block
+BLOCK_FRAMES = 2048
+
+# Speaking rates the API accepts, which local variants are held to as well
+MIN_RATE = 0.25
+MAX_RATE = 4.0
+
+def _normalized_correlation(region, natural, length):
+    """Correlation of natural with every window of region, divided by the window's energy"""
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    dots = sliding_window_view(region, length) @ natural
+    squares = np.concatenate(([0.0], np.cumsum(region.astype(np.float64) ** 2)))
+    energies = squares[length:] - squares[:-length]
+    return dots / np.sqrt(np.maximum(energies, 1e-9))
+
+def _frame_offset(segment, natural, ideal, tolerance, frame):
+    """
+    Offset in [-tolerance, tolerance] that best lines the frame at `ideal`
+    (an index into segment) up with the natural continuation. Ties (as in
+    perfectly periodic sound) go to the offset closest to zero.
+    """
+    import numpy as np
+
+    if not natural.any():
+        return 0
+    region = segment[ideal - tolerance:ideal + tolerance + frame]
+    coarse = _normalized_correlation(region[::DECIMATE], natural[::DECIMATE], frame // DECIMATE)
+    lags = np.arange(len(coarse)) * DECIMATE - tolerance
+    best = int(np.argmax(coarse - 1e-6 * np.abs(coarse).max() * np.abs(lags))) * DECIMATE
+    low, high = max(0, best - DECIMATE + 1), min(2 * tolerance, best + DECIMATE - 1)
+    fine = _normalized_correlation(region[low:high + frame], natural, frame)
+    lags = np.arange(low, high + 1) - tolerance
+    return int(lags[np.argmax(fine - 1e-6 * np.abs(fine).max() * np.abs(lags))])
+
+def stretch_samples(samples, rate: float, sample_rate: int = SAMPLE_RATE, write=None):
+    """
+    Time-stretches int16 samples (an array or memmap) by rate (1.25 = 25%
+    faster) and passes the output to write(int16 array) block by block.
+    Returns the number of output samples.
+    """
+    import numpy as np
+
+    if not MIN_RATE <= rate <= MAX_RATE:
+        raise ValueError(f"Rate {rate} is outside {MIN_RATE}-{MAX_RATE}")
+    frame = (sample_rate * FRAME_MS // 1000) // (2 * DECIMATE) * 2 * DECIMATE
+    hop = frame // 2
+    tolerance = sample_rate * TOLERANCE_MS // 1000
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+
+    total = int(round(len(samples) / rate))
+    # Frame k starts at output (k - 1) * hop; the first hop of output (half
+    # of frame 0, which starts before the input) is dropped
+    frames = total // hop + 3
+    skip = hop
+    # Input is read with this much zero padding on each side
+    pad = tolerance + frame + hop
+
+    def read(start, end):
+        """Samples [start, end) of the input as float32, zero outside it"""
+        out = np.zeros(end - start, dtype=np.float32)
+        lo, hi = max(start, 0), min(end, len(samples))
+        if hi > lo:
+            out[lo - start:hi - start] = samples[lo:hi]
+        return out
+
+    previous = -hop  # Input position of the last frame
+    tail = np.zeros(hop, dtype=np.float32)  # Second half of the last frame, still to be added to
+    written = 0
+    for first in range(0, frames, BLOCK_FRAMES):
+        count = min(BLOCK_FRAMES, frames - first)
+        ideals = np.round(np.arange(first, first + count) * hop * rate).astype(np.int64) - hop
+        base = min(int(ideals[0]), previous + hop) - pad
+        segment = read(base, int(ideals[-1]) + pad)
+
+        positions = np.empty(count, dtype=np.int64)
+        for index, ideal in enumerate(ideals):
+            if first + index == 0:
+                positions[index] = -hop
+            else:
+                natural_start = previous + hop - base
+                natural = segment[natural_start:natural_start + frame]
+                positions[index] = ideal + _frame_offset(segment, natural, int(ideal) - base, tolerance, frame)
+            previous = int(positions[index])
+
+        # Window every frame of the block at once and overlap-add the halves
+        frames_out = segment[(positions - base)[:, None] + np.arange(frame)] * window
+        block = frames_out[:, :hop].copy()
+        block[0] += tail
+        block[1:] += frames_out[:-1, hop:]
+        tail = frames_out[-1, hop:]
+
+        block = block.reshape(-1)
+        if skip:
+            block, skip = block[skip:], 0
+        block = block[:max(0, total - written)]
+        if len(block):
+            write(np.clip(np.round(block), -32768, 32767).astype("<i2"))
+            written += len(block)
+    return written
+
+def stretch_pcm(pcm, rate: float, directory=None):
+    """A new PcmBuffer with the samples of pcm stretched by rate"""
+    output = PcmBuffer(sample_rate=pcm.sample_rate, directory=directory)
+    try:
+        stretch_samples(pcm.memmap(), rate, pcm.sample_rate, lambda block: output.append(block.tobytes()))
+    except Exception:
+        output.close()
+        raise
+    return output
+
+def variant_path(output_path: str, rate: float):
+    """book.mp3 -> book_1.25x.mp3"""
+    base, extension = os.path.splitext(output_path)
+    return f"{base}_{rate:g}x{extension}"
+
+def rate_list(value):
+    """argparse type for comma-separated speaking rates"""
+    try:
+        rates = [float(rate) for rate in value.split(",") if rate.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rates '{value}' - expected e.g. 1.25,0.85")
+    bad = [rate for rate in rates if not MIN_RATE <= rate <= MAX_RATE]
+    if not rates or bad:
+        raise argparse.ArgumentTypeError(f"rates must be between {MIN_RATE} and {MAX_RATE}")
+    return rates
+
+def decode_audio(path, sample_rate: int = SAMPLE_RATE, directory=None):
+    """Decodes any audio file to a mono PcmBuffer at sample_rate with ffmpeg"""
+    import subprocess
+    from pcm_buffer import find_ffmpeg
+
+    pcm = PcmBuffer(sample_rate=sample_rate, directory=directory)
+    result = subprocess.run(
+        [find_ffmpeg(), "-y", "-loglevel", "error", "-i", path,
+         "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), pcm.path],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    if result.returncode != 0:
+        pcm.close()
+        raise RuntimeError(f"ffmpeg failed to decode '{path}': {result.stderr.strip()}")
+    pcm.num_samples = os.path.getsize(pcm.path) // 2
+    return pcm
+
+def median_pitch(samples, sample_rate: int = SAMPLE_RATE):
+    """Median F0 (Hz) of the voiced 40 ms frames, from autocorrelation; None if nothing is voiced"""
+    import numpy as np
+
+    frame = sample_rate // 25
+    low, high = sample_rate // 400, sample_rate // 60  # 60-400 Hz
+    pitches = []
+    x = np.asarray(samples, dtype=np.float32)
+    for start in range(0, len(x) - frame, frame):
+        chunk = x[start:start + frame] - x[start:start + frame].mean()
+        energy = float(chunk @ chunk)
+        if energy < frame * 300.0 ** 2:
+            continue
+        correlation = np.correlate(chunk, chunk, mode="full")[frame - 1:]
+        lag = low + int(np.argmax(correlation[low:high]))
+        if correlation[lag] > 0.5 * energy:
+            pitches.append(sample_rate / lag)
+    return float(np.median(pitches)) if pitches else None
+
+def spectral_distance(a, b, sample_rate: int = SAMPLE_RATE):
+    """
+    Log-spectral distance (dB) between two renders of the same text, with
+    their frames matched in proportion to time (they differ in length).
+    """
+    import numpy as np
+
+    size = 512
+    window = np.hanning(size).astype(np.float32)
+
+    def spectra(x):
+        x = np.asarray(x, dtype=np.float32)
+        count = max(1, (len(x) - size) // (size // 2))
+        frames = x[(np.arange(count) * (size // 2))[:, None] + np.arange(size)] * window
+        return 10 * np.log10(np.abs(np.fft.rfft(frames, axis=1)) ** 2 + 1e-3)
+
+    sa, sb = spectra(a), spectra(b)
+    index = np.round(np.linspace(0, len(sb) - 1, len(sa))).astype(int)
+    # Only frames where both carry speech
+    loud = (sa.max(axis=1) > 40) & (sb[index].max(axis=1) > 40)
+    if not loud.any():
+        return None
+    return float(np.sqrt(((sa[loud] - sb[index][loud]) ** 2).mean(axis=1)).mean())
+
+def compare(ssml_file_path: str, rates, selector: str = None, output_dir: str = "rate_comparison",
+            chunk_size: int = 4500):
+    """
+    Renders a sample at 1.0x and, through the API, at each rate, stretches
+    the 1.0x render locally to each rate, and reports time, billed
+    characters, duration, pitch and spectral distance for both. The audio
+    is saved as WAV files to listen to side by side.
+    """
+    import wave
+    from chunking import plan_requests, read_ssml_content
+    from synthesizer import Synthesizer
+    from ssml_range import range_plan
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        content = read_ssml_content(ssml_file_path)
+        engine = Synthesizer(chunk_size=chunk_size)
+        plan = engine.plan_ssml(content)
+        if selector:
+            plan, _ = range_plan(content, plan, selector)
+        characters = sum(len(item["ssml"]) for item in plan_requests(plan))
+
+        def save(name, data):
+            path = os.path.join(output_dir, f"{name}.wav")
+            with wave.open(path, "wb") as f:
+                f.setnchannels(1)
+                f.setsampwidth(2)
+                f.setframerate(SAMPLE_RATE)
+                f.writeframes(data)
+            return path
+
+        def render(speaking_rate=None):
+            if speaking_rate:
+                engine.audio_config.speaking_rate = speaking_rate
+            started = time.perf_counter()
+            data = b"".join(engine.stream(plan))
+            engine.audio_config.speaking_rate = 1.0
+            return data, time.perf_counter() - started
+
+        import numpy as np
+        print(f"🎙️  Rendering the 1.0x reference ({characters} characters)...")
+        reference, reference_seconds = render()
+        save("1x", reference)
+        original = np.frombuffer(reference, dtype="<i2")
+        reference_pitch = median_pitch(original)
+
+        results = []
+        for rate in rates:
+            print(f"⏩ {rate:g}x: API render and local stretch...")
+            api, api_seconds = render(rate)
+            local_blocks = []
+            started = time.perf_counter()
+            stretch_samples(original, rate, SAMPLE_RATE, local_blocks.append)
+            local_seconds = time.perf_counter() - started
+            local = np.concatenate(local_blocks) if local_blocks else np.zeros(0, dtype="<i2")
+            api_samples = np.frombuffer(api, dtype="<i2")
+            results.append({
+                "rate": rate,
+                "api": {
+                    "seconds": round(api_seconds, 2),
+                    "billed_characters": characters,
+                    "duration": round(len(api_samples) / SAMPLE_RATE, 2),
+                    "median_pitch_hz": median_pitch(api_samples),
+                    "file": save(f"{rate:g}x_api", api),
+                },
+                "local": {
+                    "seconds": round(local_seconds, 3),
+                    "billed_characters": 0,
+                    "duration": round(len(local) / SAMPLE_RATE, 2),
+                    "median_pitch_hz": median_pitch(local),
+                    "realtime_factor": round(len(original) / SAMPLE_RATE / max(local_seconds, 1e-9)),
+                    "file": save(f"{rate:g}x_local", local.tobytes()),
+                },
+                "spectral_distance_db": spectral_distance(local, api_samples),
+            })
+
+        report = {"input": ssml_file_path, "range": selector, "reference_duration": len(original) / SAMPLE_RATE,
+                  "reference_pitch_hz": reference_pitch, "reference_seconds": round(reference_seconds, 2),
+                  "variants": results}
+        report_path = os.path.join(output_dir, "comparison.json")
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print_comparison(report)
+        print(f"\n📝 Report and WAV files saved to '{output_dir}'")
+        return report
+
+    except FileNotFoundError:
+        print(f"❌ Error: The file '{ssml_file_path}' was not found.")
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
+
+def print_comparison(report):
+    def pitch(value):
+        return f"{value:.0f} Hz" if value else "n/a"
+
+    print(f"\n📊 Reference: {report['reference_duration']:.1f}s, pitch {pitch(report['reference_pitch_hz'])}")
+    for variant in report["variants"]:
+        api, local = variant["api"], variant["local"]
+        distance = variant["spectral_distance_db"]
+        print(f"\n   {variant['rate']:g}x")
+        print(f"   API:   {api['seconds']:.1f}s, {api['billed_characters']} billed characters, "
+              f"{api['duration']:.1f}s of audio, pitch {pitch(api['median_pitch_hz'])}")
+        print(f"   Local: {local['seconds']:.2f}s ({local['realtime_factor']}x real time), no API cost, "
+              f"{local['duration']:.1f}s of audio, pitch {pitch(local['median_pitch_hz'])}")
+        if distance is not None:
+            print(f"   Log-spectral distance local vs API: {distance:.1f} dB")
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(
+            prog="time_stretch.py compare",
+            description="Compare local time-stretch with API speaking_rate renders of the same SSML"
+        )
+        parser.add_argument("input", help="SSML file to render a sample of")
+        parser.add_argument("--rate", type=rate_list, default=[1.25, 0.85],
+                            help="Comma-separated rates to compare (default: 1.25,0.85)")
+        parser.add_argument("--range", help="Only render this range (see tts_converter --range), e.g. p:1-3")
+        parser.add_argument("-o", "--output-dir", default="rate_comparison",
+                            help="Directory for the WAV files and comparison.json (default: rate_comparison)")
+        args = parser.parse_args(argv[1:])
+        compare(args.input, args.rate, args.range, args.output_dir)
+        return
+
+    parser = argparse.ArgumentParser(
+        description="Time-stretch an audio file without changing its pitch "
+                    "('time_stretch.py compare -h' compares with API renders)"
+    )
+    parser.add_argument("input", help="Audio file (any format ffmpeg reads)")
+    parser.add_argument("--rate", type=rate_list, required=True, help="Rates, e.g. 1.25 or 1.25,0.85")
+    parser.add_argument("-o", "--output",
+                        help="Output file for a single rate (default: <input>_<rate>x.mp3 for each rate)")
+    args = parser.parse_args(argv)
+
+    import audio_export
+
+    try:
+        with decode_audio(args.input, directory=os.path.dirname(os.path.abspath(args.input))) as pcm:
+            for rate in args.rate:
+                output_path = args.output if args.output and len(args.rate) == 1 else \
+                    variant_path(os.path.splitext(args.input)[0] + ".mp3", rate)
+                started = time.perf_counter()
+                with stretch_pcm(pcm, rate) as stretched:
+                    stretch_seconds = time.perf_counter() - started
+                    audio_export.export(stretched, [output_path])
+                    print(f"⏩ {rate:g}x: {pcm.duration_seconds:.0f}s → {stretched.duration_seconds:.0f}s "
+                          f"(stretched in {stretch_seconds:.1f}s), saved to '{output_path}'")
+    except FileNotFoundError:
+        print(f"❌ Error: The file '{args.input}' was not found.")
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Sentence timepoints, captions and seek index
+
+A <mark> is inserted before every sentence and the API is asked for
+timepoints in the same requests that synthesize the audio. The timepoints
+are shifted to the position of each chunk in the stitched audio, then
+written out as WebVTT and SRT captions and as a seek index that maps each
+sentence (and chapter) to a time and a byte offset in the MP3.
+"""
+
+import os
+import re
+import json
+import xml.etree.ElementTree as ET
+
+import chapters
+
+# Mark names are the prefix and the sentence number, e.g. s12
+SENTENCE_PREFIX = "s"
+
+# A sentence always starts at the start of these
+BLOCK_TAGS = {'speak', 'voice', 'p', 'paragraph', 's', 'sentence'}
+
+# Elements that cannot hold a <mark>; a sentence that starts with one is marked before it
+NO_MARK_TAGS = {'say-as', 'sub', 'phoneme', 'audio', 'mark', 'break', 'desc'}
+
+# Sentence-ending punctuation, with closing quotes and brackets
+SENTENCE_END = re.compile(r'[.!?…]+["\'’”)\]]*(?:\s+|$)')
+
+def insert_sentence_marks(ssml_content: str):
+    """
+    Inserts <mark name="s1"/>, <mark name="s2"/>, ... before each sentence
+    of SSML content (the inside of <speak>). Returns (content, sentences)
+    where sentences maps each mark name to the sentence's text.
+    """
+    root = ET.fromstring(f"<root>{ssml_content}</root>")
+    sentences = {}
+    texts = []
+    at_start = True
+
+    def new_mark():
+        nonlocal at_start
+        name = f"{SENTENCE_PREFIX}{len(texts) + 1}"
+        texts.append([])
+        at_start = False
+        return ET.Element('mark', name=name)
+
+    def add_words(text):
+        if texts and text.strip():
+            texts[-1].append(text)
+
+    def split_text(text):
+        """(text before the first mark, [marks with the rest as their tails])"""
+        nonlocal at_start
+        if not text:
+            return text, []
+        head = ""
+        marks = []
+        position = 0
+        sentence_ends = {match.end() for match in SENTENCE_END.finditer(text)}
+        for end in sorted(sentence_ends | {len(text)}):
+            piece = text[position:end]
+            position = end
+            if not piece:
+                continue
+            if at_start and piece.strip():
+                lead = piece[:len(piece) - len(piece.lstrip())]
+                if marks:
+                    marks[-1].tail += lead
+                else:
+                    head += lead
+                marks.append(new_mark())
+                marks[-1].tail = piece[len(lead):]
+            elif marks:
+                marks[-1].tail += piece
+            else:
+                head += piece
+            add_words(piece)
+            if end in sentence_ends:
+                at_start = True
+        return head, marks
+
+    def walk_children(element):
+        children = []
+        for child in list(element):
+            if child.tag in NO_MARK_TAGS:
+                if at_start and "".join(child.itertext()).strip():
+                    children.append(new_mark())
+                add_words(" ".join(child.itertext()))
+            else:
+                walk(child)
+            children.append(child)
+            child.tail, marks = split_text(child.tail)
+            children.extend(marks)
+        element[:] = children
+
+    def walk(element):
+        nonlocal at_start
+        if element.tag in BLOCK_TAGS:
+            at_start = True
+        element.text, marks = split_text(element.text)
+        walk_children(element)
+        element[0:0] = marks
+        if element.tag in BLOCK_TAGS:
+            at_start = True
+
+    # Top-level text outside any element is skipped, as the chunker skips it
+    walk_children(root)
+
+    for number, words in enumerate(texts, 1):
+        sentences[f"{SENTENCE_PREFIX}{number}"] = " ".join(" ".join(words).split())
+    content = (root.text or "") + "".join(ET.tostring(child, encoding='unicode') for child in root)
+    return content, sentences
+
+def chapter_sentences(marked_content: str):
+    """[(chapter title, first sentence mark)] of content with sentence marks"""
+    root = ET.fromstring(f"<root>{marked_content}</root>")
+    result = []
+    for group in chapters.group_chapters(root):
+        for element in group["elements"]:
+            marks = [element] if element.tag == 'mark' else element.iter('mark')
+            first = next((mark.get('name') for mark in marks
+                          if re.fullmatch(rf'{SENTENCE_PREFIX}\d+', mark.get('name', ''))), None)
+            if first:
+                result.append((group["title"], first))
+                break
+    return result
+
+def sentence_cues(marks, sentences, duration_seconds):
+    """
+    Captions cues [(id, start, end, text)] from the timepoints of a render:
+    each sentence lasts until the next one starts.
+    """
+    timed = sorted((seconds, name) for name, seconds in marks if name in sentences)
+    cues = []
+    for index, (start, name) in enumerate(timed):
+        end = timed[index + 1][0] if index + 1 < len(timed) else duration_seconds
+        cues.append((name, start, max(end, start), sentences[name]))
+    return cues
+
+def _timestamp(seconds, separator="."):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+def write_webvtt(path, cues):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n")
+        for name, start, end, text in cues:
+            f.write(f"\n{name}\n{_timestamp(start)} --> {_timestamp(end)}\n{text}\n")
+
+def write_srt(path, cues):
+    with open(path, "w", encoding="utf-8") as f:
+        for number, (_, start, end, text) in enumerate(cues, 1):
+            f.write(f"{number}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{text}\n\n")
+
+# Layer III bitrates (kbit/s) and sample rates by MPEG version (1, 2, 2.5)
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+def _mp3_frame(header):
+    """(frame length, samples per frame, sample rate) of an MPEG Layer III frame header, or None"""
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}.get((header[1] >> 3) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version is None or (header[1] >> 1) & 3 != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = MP3_BITRATES[1 if version == 1 else 2][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    if version == 1:
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+    return 72 * bitrate // sample_rate + padding, 576, sample_rate
+
+def mp3_byte_offsets(path, seconds):
+    """
+    Byte offsets in an MP3 file of the frames that contain each of the
+    given times, found in one pass over the frame headers. Returns None for
+    files that are not MP3.
+    """
+    with open(path, "rb") as f:
+        data_start = 0
+        header = f.read(10)
+        if header[:3] == b"ID3":
+            size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+            data_start = 10 + size + (10 if header[5] & 0x10 else 0)
+
+        targets = sorted(range(len(seconds)), key=lambda index: seconds[index])
+        offsets = [None] * len(seconds)
+        position = data_start
+        elapsed = 0.0
+        first = True
+        pending = 0
+        while pending < len(targets):
+            f.seek(position)
+            header = f.read(40)
+            frame = _mp3_frame(header) if len(header) >= 4 else None
+            if frame is None:
+                break
+            length, samples, sample_rate = frame
+            # The Xing/Info frame at the start carries no audio
+            if first and (b"Xing" in header or b"Info" in header):
+                first = False
+                position += length
+                continue
+            first = False
+            duration = samples / sample_rate
+            while pending < len(targets) and seconds[targets[pending]] < elapsed + duration:
+                offsets[targets[pending]] = position
+                pending += 1
+            elapsed += duration
+            position += length
+        if position == data_start:
+            return None
+        # Times past the end point at the end of the file
+        for index in targets[pending:]:
+            offsets[index] = position
+        return offsets
+
+def seek_index(audio_path, cues, chapter_starts=()):
+    """
+    Sentence and chapter seek points: {"sentences": [[id, ms, byte], ...],
+    "chapters": [[title, id, ms, byte], ...]}. Byte offsets are None if the
+    audio is not an MP3.
+    """
+    starts = {name: start for name, start, _, _ in cues}
+    chapter_starts = [(title, name) for title, name in chapter_starts if name in starts]
+    times = [start for _, start, _, _ in cues] + [starts[name] for _, name in chapter_starts]
+    offsets = mp3_byte_offsets(audio_path, times) if os.path.exists(audio_path) else None
+    offsets = offsets or [None] * len(times)
+
+    sentences = [[name, int(round(start * 1000)), offset]
+                 for (name, start, _, _), offset in zip(cues, offsets)]
+    chapter_points = [[title, name, int(round(starts[name] * 1000)), offset]
+                      for (title, name), offset in zip(chapter_starts, offsets[len(cues):])]
+    return {"audio": os.path.basename(audio_path), "sentences": sentences, "chapters": chapter_points}
+
+def write_captions(audio_path, marks, sentences, duration_seconds, chapter_starts=()):
+    """
+    Writes <audio>.vtt, <audio>.srt and <audio>.seek.json for a render.
+    Returns the paths written.
+    """
+    base = os.path.splitext(audio_path)[0]
+    cues = sentence_cues(marks, sentences, duration_seconds)
+    paths = [f"{base}.vtt", f"{base}.srt", f"{base}.seek.json"]
+    write_webvtt(paths[0], cues)
+    write_srt(paths[1], cues)
+    with open(paths[2], "w", encoding="utf-8") as f:
+        json.dump(seek_index(audio_path, cues, chapter_starts), f, ensure_ascii=False, separators=(",", ":"))
+    return paths
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Thin client for tts_daemon.py
+
+Sends a tts_converter command line to the warm daemon and streams its
+output back. Only the standard library's socket and json are imported, so
+the command starts in about the time of a bare interpreter. If no daemon is
+running, the job runs here as a normal tts_converter invocation.
+
+    python tts_client.py lantern_path.ssml --range chapter:3
+    python tts_client.py --status
+    python tts_client.py --shutdown
+"""
+
+import os
+import sys
+import json
+import socket
+import tempfile
+
+DEFAULT_SOCKET = os.environ.get("TTS_DAEMON_SOCKET") or os.path.join(
+    tempfile.gettempdir(), f"tts-daemon-{os.getuid() if hasattr(os, 'getuid') else 0}.sock"
+)
+
+USAGE = """usage: tts_client.py [--socket PATH] (--status | --shutdown | <tts_converter arguments>)
+
+Runs tts_converter on the warm daemon started with tts_daemon.py.
+Run 'python tts_converter.py -h' for the converter's options."""
+
+def connect(socket_path=DEFAULT_SOCKET):
+    """A connection to the daemon; raises OSError if none is listening"""
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+def send(connection, request):
+    """Sends one request to the daemon and yields the messages it sends back"""
+    with connection, connection.makefile("rwb") as stream:
+        stream.write((json.dumps(request) + "\n").encode("utf-8"))
+        stream.flush()
+        for line in stream:
+            yield json.loads(line)
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    socket_path = DEFAULT_SOCKET
+    if argv[:1] == ["--socket"] and len(argv) > 1:
+        socket_path, argv = argv[1], argv[2:]
+    if not argv or argv[0] in ("-h", "--help"):
+        print(USAGE)
+        return 0
+
+    if argv[0] == "--status":
+        request = {"command": "status"}
+    elif argv[0] == "--shutdown":
+        request = {"command": "shutdown"}
+    else:
+        request = {"argv": argv, "cwd": os.getcwd()}
+
+    try:
+        connection = connect(socket_path)
+    except OSError:
+        if "command" in request:
+            print(f"❌ No daemon is listening on {socket_path}")
+            return 1
+        print(f"⚠️  No daemon on {socket_path} - running here (start one with: python tts_daemon.py)",
+              file=sys.stderr)
+        import tts_converter
+        tts_converter.main(argv)
+        return 0
+
+    code = 1
+    for message in send(connection, request):
+        if "stdout" in message:
+            sys.stdout.write(message["stdout"])
+            sys.stdout.flush()
+        if "stderr" in message:
+            sys.stderr.write(message["stderr"])
+        if "status" in message:
+            print(json.dumps(message["status"], indent=2))
+        if "exit" in message:
+            code = message["exit"]
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,167 +7,589 @@ with support for long texts that exceed the API's character limit.
 """
 
 import os
-import io
+import time
 import argparse
-import xml.etree.ElementTree as ET
-from google.cloud import texttospeech
 from dotenv import load_dotenv
-from pydub import AudioSegment
+from collections import Counter
+
+import chapters
+import ssml_lint
+from chunking import DEFAULT_CHUNK_SIZE, break_report, build_plan, plan_requests, read_ssml_content
+from client_pool import ClientPool, print_stats as print_pool_stats
+from audio_export import FORMATS, output_format
+from chunk_bisect import RejectionPolicy, print_report as print_rejections, write_report as write_rejections
+from draft_voices import DRAFT_SAMPLE_RATE, DRAFT_WORKERS, draft_ssml, print_mapping as print_draft_voices
+from chunk_check import ChunkCheck, print_report as print_chunk_checks, write_report as write_chunk_checks
+from chunk_cache import CACHE_DIR, open_cache, print_stats as print_cache_stats
+from hedging import DEFAULT_MAX_EXTRA, DEFAULT_PERCENTILE, HedgePolicy, print_metrics as print_hedge_metrics
+from memory_profile import MemoryProfiler, NullProfiler, print_summary as print_memory_summary
+from pcm_buffer import SAMPLE_RATE
+from ssml_minify import minify_ssml
+from ssml_range import range_plan
+from render_planner import API_LIMIT, choose_chunk_size, estimate_render, print_estimate, write_estimate
+from synthesizer import Synthesizer, describe_plan_item
+from time_stretch import rate_list
+from timepoints import chapter_sentences, insert_sentence_marks, write_captions
+
+# google.cloud.texttospeech (with grpc/protobuf) is imported lazily
+# inside the functions that need it, so --help and SSML-only work start fast.
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Default values
-DEFAULT_CHUNK_SIZE = 4500
 DEFAULT_CREDENTIALS = "experiemental-456622-bae3adc875eb.json"
-
-def programmatic_ssml_to_chunks(ssml_string: str, chunk_size: int):
+DEFAULT_WORKERS = 4
+DEFAULT_LUFS = -18.0
+
+def print_dedupe_report(report):
+    """Prints what phrase deduplication saved"""
+    print(f"♻️  Phrase deduplication: {report['repeated_phrases']} repeated phrases "
+          f"({report['phrase_occurrences']} occurrences)")
+    print(f"   Requests:   {report['baseline_requests']} → {report['requests']} "
+          f"(saved {report['requests_saved']})")
+    print(f"   Characters: {report['baseline_characters']} → {report['characters']} "
+          f"(saved {report['characters_saved']})")
+    if not report["applied"]:
+        print("   Not worthwhile for this document - using plain chunks.")
+
+def report_preflight(ssml_file_path: str, issues, strict: bool = False):
+    """
+    Prints preflight issues. Returns False if the render must stop: the
+    file is malformed, or strict is set and there are errors or warnings
+    (the same rule as ssml_lint.py --strict).
+    """
+    if issues:
+        ssml_lint.print_issues(issues, ssml_file_path)
+    if ssml_lint.is_malformed(issues):
+        print("❌ Preflight failed: the SSML is not well-formed - no requests were sent.")
+        return False
+    if strict and ssml_lint.fails(issues, strict):
+        print("❌ Preflight failed (--strict) - no requests were sent.")
+        return False
+    return True
+
+def lint_content(content: str, voice_segments: bool = False):
+    """
+    Preflight issues for the SSML as it is rendered, with pronunciations
+    applied and draft voices substituted, rather than as it is on disk
     """
-    Splits a large SSML string into smaller, valid SSML chunks programmatically
-    based on character count, without breaking tags.
+    return ssml_lint.lint_document(f"<speak>{content}</speak>", ssml_lint.load_voice_cache(), voice_segments)
+
+def synthesize_ssml(ssml_file_path: str, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, *,
+                    dedupe_phrases: bool = False, pronunciations: str = None, pronunciation_format: str = "ipa",
+                    postprocess=None, hedge=None, voice_segments: bool = False, workers: int = DEFAULT_WORKERS,
+                    minify: bool = False, strict: bool = False, profiler=None, cache=None,
+                    captions: bool = False, client=None, exports=(), encode_workers: int = None,
+                    rejections=None, rate_variants=(), draft: bool = False, checks=None):
+    """
+    Synthesizes speech from a long SSML file by chunking programmatically.
+
+    With voice_segments, each run of the same voice is sent with that voice
+    in VoiceSelectionParams, up to `workers` requests at a time. A
+    MemoryProfiler records memory use per stage; chunks found in a
+    ChunkCache are not requested again. With captions, every sentence gets
+    a <mark> and the render also writes WebVTT/SRT captions and a seek index.
+    A ClientPool as client spreads the requests over several credentials.
+    The audio is also encoded to every path in exports (MP3, Opus or M4B by
+    extension) from the same samples, by up to encode_workers processes.
+    A RejectionPolicy splits chunks the API rejects and retries the halves,
+    and a ChunkCheck requests silent or truncated chunks again.
+    Each rate in rate_variants (e.g. 1.25) adds a time-stretched copy of
+    every output, made locally instead of synthesizing the book again.
+    A draft uses Standard voices at DRAFT_SAMPLE_RATE with every chunk in
+    parallel; the caller leaves out post-processing.
     """
     try:
-        # Add a dummy root tag if the SSML string is just a fragment
-        # This helps the parser handle files without a single root <speak> tag
-        root = ET.fromstring(f"<root>{ssml_string}</root>")
-    except ET.ParseError:
-        # Fallback for when the file is already a single valid <speak> block
-        root = ET.fromstring(ssml_string)
-
-    final_chunks = []
-    current_chunk_elements = []
-    current_chunk_char_count = 0
-    current_voice = None  # Track the current voice context
-
-    for element in root:
-        # If this is a voice element, update our tracking
-        if element.tag == 'voice':
-            current_voice = element.get('name')
-
-        # Convert element to string to measure its length
-        element_string = ET.tostring(element, encoding='unicode')
-
-        # If the current chunk is not empty and adding the next element exceeds
-        # the chunk size, finalize the current chunk.
-        if current_chunk_elements and current_chunk_char_count + len(element_string) > chunk_size:
-            # Create a new <speak> root for the chunk
-            new_root = ET.Element('speak')
-
-            # If we have a current voice context and the chunk doesn't start with a voice tag,
-            # wrap the content in a voice tag
-            if current_voice and current_chunk_elements[0].tag != 'voice':
-                voice_wrapper = ET.Element('voice', name=current_voice)
-                voice_wrapper.extend(current_chunk_elements)
-                new_root.append(voice_wrapper)
-            else:
-                new_root.extend(current_chunk_elements)
+        print("📖 Google TTS SSML Converter")
+        print(f"{'=' * 50}")
+        print(f"Input:  {ssml_file_path}")
+        print(f"Output: {output_path}")
+        print(f"Chunk size: {chunk_size} characters")
+        if voice_segments:
+            print(f"Voice segments: on, {workers} parallel requests")
+        if draft:
+            print(f"Draft: Standard voices, {DRAFT_SAMPLE_RATE // 1000} kHz, {workers} parallel requests")
+        print(f"{'=' * 50}\n")
 
-            final_chunks.append(ET.tostring(new_root, encoding='unicode'))
+        profiler = profiler or NullProfiler()
 
-            # Reset for the next chunk
-            current_chunk_elements = []
-            current_chunk_char_count = 0
+        print(f"Step 1: Reading SSML from '{ssml_file_path}'...")
+        with profiler.stage("read"):
+            # Pronunciations and draft voices can only be applied to well-formed SSML
+            issues = ssml_lint.lint_file(ssml_file_path)
+            if ssml_lint.is_malformed(issues):
+                report_preflight(ssml_file_path, issues, strict)
+                return
+            long_ssml_content = read_ssml_content(ssml_file_path, pronunciations, pronunciation_format, draft)
+        with profiler.stage("preflight"):
+            issues = lint_content(long_ssml_content, voice_segments)
+
+        with profiler.stage("client"):
+            engine = Synthesizer(chunk_size=chunk_size, postprocess=postprocess, hedge=hedge,
+                                 concurrency=render_concurrency(False, workers, voice_segments, pool_size(client),
+                                                                draft),
+                                 cache=cache, time_pointing=captions, client=client,
+                                 encode_workers=encode_workers, rejections=rejections, checks=checks,
+                                 sample_rate=DRAFT_SAMPLE_RATE if draft else SAMPLE_RATE)
+
+        if minify:
+            with profiler.stage("minify"):
+                long_ssml_content, stats = minify_ssml(long_ssml_content, chunk_size)
+            print(f"🗜️  Minified SSML: {stats['bytes_before']} → {stats['bytes_after']} bytes, "
+                  f"{stats['voice_blocks_merged']} <voice> blocks merged")
+
+        marks = sentences = None
+        if captions:
+            long_ssml_content, sentences = insert_sentence_marks(long_ssml_content)
+            marks = []
+            print(f"🏷️  Marked {len(sentences)} sentences for captions")
 
-        # Add the current element to the new chunk
-        current_chunk_elements.append(element)
-        current_chunk_char_count += len(element_string)
+        print("Step 2: Splitting SSML into manageable chunks...")
+        with profiler.stage("chunk"):
+            # Minifying again is a no-op; it lets the chunker merge voices across inline breaks
+            plan, dedupe_report = build_plan(long_ssml_content, chunk_size, dedupe_phrases, voice_segments, minify)
+        issues += ssml_lint.lint_chunks([item["ssml"] for item in plan_requests(plan)])
+        if not report_preflight(ssml_file_path, issues, strict) or not check_client_pool(client):
+            return
 
-    # Add the last remaining chunk
-    if current_chunk_elements:
-        new_root = ET.Element('speak')
+        if not plan_requests(plan):
+            print("❌ No content found to process in the SSML file.")
+            return
 
-        # If we have a current voice context and the chunk doesn't start with a voice tag,
-        # wrap the content in a voice tag
-        if current_voice and current_chunk_elements[0].tag != 'voice':
-            voice_wrapper = ET.Element('voice', name=current_voice)
-            voice_wrapper.extend(current_chunk_elements)
-            new_root.append(voice_wrapper)
-        else:
-            new_root.extend(current_chunk_elements)
+        print(f"✅ SSML split into {len(plan_requests(plan))} chunks.")
+        if voice_segments:
+            voices = Counter(item.get("voice") or "fallback voice" for item in plan_requests(plan))
+            print(f"🗣️  {len(voices)} voices: " + ", ".join(f"{name} ({count})" for name, count in voices.items()))
+        breaks = break_report(long_ssml_content, plan, chunk_size)
+        if breaks["local_breaks"] and not voice_segments:
+            print(f"🔇 {breaks['local_breaks']} top-level breaks rendered as local silence "
+                  f"({breaks['local_silence_ms'] / 1000:.1f}s); billed characters "
+                  f"{breaks['inline_characters']} → {breaks['characters']}")
+        if dedupe_report:
+            print_dedupe_report(dedupe_report)
 
-        final_chunks.append(ET.tostring(new_root, encoding='unicode'))
+        print("\nStep 3: Synthesizing audio for each SSML chunk...")
+        print(f"Step 4: Stitching audio and saving to '{output_path}'...")
+        started = time.perf_counter()
+        duration_seconds = engine.render(plan, output_path, profiler=profiler, marks=marks, exports=exports,
+                                         rate_variants=rate_variants)
+        if hedge:
+            print_hedge_metrics(hedge.metrics(), time.perf_counter() - started)
+        if cache:
+            print_cache_stats(cache.stats())
+        if isinstance(client, ClientPool):
+            print_pool_stats(client.stats())
+        report_rejections(rejections, f"{os.path.splitext(output_path)[0]}.rejected.json")
+        report_chunk_checks(checks, f"{os.path.splitext(output_path)[0]}.suspect.json")
+
+        if not duration_seconds:
+            print("❌ No audio segments were generated. Exiting.")
+            return
 
-    return final_chunks
+        # Calculate duration
+        duration_minutes = duration_seconds / 60
+        print(f"\n⏱️  Duration: {duration_minutes:.1f} minutes ({duration_seconds:.0f} seconds)")
+        print(f"🎉 Success! Audio saved to '{output_path}'")
+        for path in exports:
+            print(f"📦 Also saved: '{path}'")
+        if captions:
+            paths = write_captions(output_path, marks, sentences, duration_seconds,
+                                   chapter_sentences(long_ssml_content))
+            print(f"💬 Captions ({len(marks)} of {len(sentences)} sentences timed): " + ", ".join(paths))
+
+    except FileNotFoundError:
+        print(f"❌ Error: The file '{ssml_file_path}' was not found.")
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
 
-def synthesize_ssml(ssml_file_path: str, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+def render_chapter(engine, chapter, output_dir: str, dedupe_phrases: bool = False, voice_segments: bool = False,
+                   minify: bool = False, sentences=None):
     """
-    Synthesizes speech from a long SSML file by chunking programmatically.
+    Runs one chapter through its own chunk/synthesize/encode pipeline.
+    Given the sentences of a document with sentence marks, the chapter's
+    captions and seek index are written next to its MP3.
+    """
+    plan = engine.plan_ssml(chapter["ssml"], dedupe_phrases, voice_segments, minify)
+    output_file = f"{chapter['slug']}.mp3"
+    label = f"[{chapter['index']:02d}]"
+    marks = [] if sentences is not None else None
+    duration_seconds = engine.render(plan, os.path.join(output_dir, output_file),
+                                     log=lambda message: print(f"{label} {message.strip()}"), marks=marks)
+    if sentences is not None:
+        first = next((name for name, _ in marks if name in sentences), None)
+        write_captions(os.path.join(output_dir, output_file), marks, sentences, duration_seconds,
+                       [(chapter["title"], first)] if first else ())
+    return {
+        "index": chapter["index"],
+        "title": chapter["title"],
+        "slug": chapter["slug"],
+        "file": output_file,
+        "chunks": len(plan_requests(plan)),
+        "characters": len(chapter["ssml"]),
+        "duration_seconds": round(duration_seconds, 3),
+    }
+
+def synthesize_chapters(ssml_file_path: str, output_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE, *,
+                        workers: int = DEFAULT_WORKERS, only=None, combined_path=None, force=False,
+                        dedupe_phrases: bool = False, pronunciations: str = None,
+                        pronunciation_format: str = "ipa", postprocess=None, hedge=None,
+                        voice_segments: bool = False, minify: bool = False, strict: bool = False, cache=None,
+                        captions: bool = False, client=None, rejections=None, draft: bool = False,
+                        checks=None):
+    """
+    Renders each chapter of an SSML file to its own MP3, in parallel.
+
+    Chapters whose SSML is unchanged since the last render are skipped, and
+    `only` restricts rendering to the given chapter indices, so re-rendering
+    one chapter never touches the files of the others. With captions, each
+    chapter also gets its own captions and seek index. A draft uses
+    Standard voices at DRAFT_SAMPLE_RATE, and workers left over when there
+    are fewer chapters than workers go to the chunks of each chapter.
     """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
     try:
-        print(f"📖 Google TTS SSML Converter")
+        print("📖 Google TTS SSML Converter (chapters)")
         print(f"{'=' * 50}")
         print(f"Input:  {ssml_file_path}")
-        print(f"Output: {output_path}")
-        print(f"Chunk size: {chunk_size} characters")
+        print(f"Output: {output_dir}/")
+        print(f"Chunk size: {chunk_size} characters, {workers} parallel chapters")
         print(f"{'=' * 50}\n")
 
         print(f"Step 1: Reading SSML from '{ssml_file_path}'...")
-        with open(ssml_file_path, "r", encoding="utf-8") as f:
-            # Read the content inside the <speak> tags
-            full_ssml = f.read()
-            if full_ssml.strip().startswith("<speak>"):
-                content_start = full_ssml.find('>') + 1
-                content_end = full_ssml.rfind('</speak>')
-                long_ssml_content = full_ssml[content_start:content_end].strip()
+        # Pronunciations and draft voices can only be applied to well-formed SSML
+        issues = ssml_lint.lint_file(ssml_file_path)
+        if ssml_lint.is_malformed(issues):
+            report_preflight(ssml_file_path, issues, strict)
+            return
+        content = read_ssml_content(ssml_file_path, pronunciations, pronunciation_format, draft)
+        issues = lint_content(content, voice_segments)
+        sentences = None
+        if captions:
+            # Marked before splitting, so sentence ids are unique across the book
+            content, sentences = insert_sentence_marks(content)
+        chapter_list = chapters.split_chapters(content)
+        print(f"✅ Found {len(chapter_list)} chapters.")
+
+        os.makedirs(output_dir, exist_ok=True)
+        previous = chapters.load_manifest(output_dir)
+        sample_rate = DRAFT_SAMPLE_RATE if draft else SAMPLE_RATE
+        settings = {"chunk_size": chunk_size, "sample_rate": sample_rate, "format": "mp3"}
+        if postprocess:
+            settings["postprocess"] = postprocess
+        if voice_segments:
+            settings["voice_segments"] = True
+        if minify:
+            settings["minify"] = True
+        if captions:
+            settings["captions"] = True
+        if draft:
+            settings["draft"] = True
+
+        entries = []
+        pending = []
+        for chapter in chapter_list:
+            chapter_hash = chapters.chapter_hash(chapter, settings)
+            old = previous.get(chapter["slug"])
+            up_to_date = (old and old.get("hash") == chapter_hash
+                          and os.path.exists(os.path.join(output_dir, old["file"])))
+            if only is not None:
+                selected = chapter["index"] in only
+            else:
+                selected = force or not up_to_date
+            if selected:
+                pending.append((chapter, chapter_hash))
+            elif old:
+                entries.append(old)
             else:
-                long_ssml_content = full_ssml.strip()
+                print(f"⚠️  Chapter {chapter['index']} ({chapter['title']}) has never been rendered.")
 
-        client = texttospeech.TextToSpeechClient()
-        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
+        print(f"⏭️  {len(chapter_list) - len(pending)} chapters kept, {len(pending)} to render\n")
 
-        # Voice configuration - required by API even when SSML has voice tags
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="en-US",
-            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-        )
+        issues += ssml_lint.lint_chunks([
+            item["ssml"]
+            for chapter, _ in pending
+            for item in plan_requests(build_plan(chapter["ssml"], chunk_size, dedupe_phrases, voice_segments, minify)[0])
+        ])
+        if not report_preflight(ssml_file_path, issues, strict) or not check_client_pool(client):
+            return
 
-        print("Step 2: Splitting SSML into manageable chunks...")
-        chunks = programmatic_ssml_to_chunks(long_ssml_content, chunk_size)
+        failed = 0
+        if pending:
+            # One client for every chapter
+            # Chapters already encode in parallel, one ffmpeg process each
+            chunk_workers = max(1, workers // len(pending)) if draft else 1
+            engine = Synthesizer(chunk_size=chunk_size, postprocess=postprocess, hedge=hedge, cache=cache,
+                                 time_pointing=captions, client=client,
+                                 concurrency=chunk_workers * pool_size(client), encode_workers=1,
+                                 rejections=rejections, sample_rate=sample_rate, checks=checks)
+
+            print("Step 2: Rendering chapters...")
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(render_chapter, engine, chapter, output_dir, dedupe_phrases, voice_segments,
+                                    minify, sentences):
+                        (chapter, chapter_hash)
+                    for chapter, chapter_hash in pending
+                }
+                for future in as_completed(futures):
+                    chapter, chapter_hash = futures[future]
+                    try:
+                        entry = future.result()
+                        entry["hash"] = chapter_hash
+                        entries.append(entry)
+                        print(f"✅ Chapter {chapter['index']}: {chapter['title']} ({entry['duration_seconds']:.0f}s)")
+                    except Exception as e:
+                        failed += 1
+                        print(f"❌ Chapter {chapter['index']} ({chapter['title']}) failed: {e}")
+                        # Keep the previous render of this chapter in the manifest
+                        if chapter["slug"] in previous:
+                            entries.append(previous[chapter["slug"]])
+            if hedge:
+                print_hedge_metrics(hedge.metrics(), time.perf_counter() - started)
+            if cache:
+                print_cache_stats(cache.stats())
+            if isinstance(client, ClientPool):
+                print_pool_stats(client.stats())
+            report_rejections(rejections, os.path.join(output_dir, "rejected.json"))
+            report_chunk_checks(checks, os.path.join(output_dir, "suspect.json"))
+
+        manifest_path, manifest = chapters.write_manifest(output_dir, ssml_file_path, entries)
+        print(f"\n📋 Chapter manifest: {manifest_path}")
+
+        if combined_path:
+            if len(manifest["chapters"]) < len(chapter_list):
+                print("⚠️  Skipping combined file - not every chapter has been rendered.")
+            else:
+                print(f"📚 Writing combined file with chapter markers to '{combined_path}'...")
+                chapters.write_combined(output_dir, manifest, combined_path)
 
-        if not chunks:
-            print("❌ No content found to process in the SSML file.")
-            return
+        total_seconds = manifest["total_seconds"]
+        print(f"\n⏱️  Duration: {total_seconds / 60:.1f} minutes ({total_seconds:.0f} seconds)")
+        if failed:
+            print(f"⚠️  {failed} chapters failed - re-run to retry them.")
+        else:
+            print(f"🎉 Success! Chapters saved to '{output_dir}'")
 
-        print(f"✅ SSML split into {len(chunks)} chunks.")
+    except FileNotFoundError:
+        print(f"❌ Error: The file '{ssml_file_path}' was not found.")
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
 
-        audio_segments = []
-        print("\nStep 3: Synthesizing audio for each SSML chunk...")
-        for i, chunk in enumerate(chunks):
-            print(f"  - Processing chunk {i + 1} of {len(chunks)}...")
-            synthesis_input = texttospeech.SynthesisInput(ssml=chunk)
-
-            # Always provide voice parameter - it acts as a fallback
-            response = client.synthesize_speech(
-                input=synthesis_input,
-                voice=voice,
-                audio_config=audio_config
-            )
-            segment = AudioSegment.from_file(io.BytesIO(response.audio_content))
-            audio_segments.append(segment)
-
-        print("\nStep 4: Stitching audio segments together...")
-        if not audio_segments:
-            print("❌ No audio segments were generated. Exiting.")
+def report_rejections(rejections, json_path: str):
+    """Prints the rejected fragments of a render and saves them to json_path, if there are any"""
+    if not rejections:
+        return
+    report = rejections.report()
+    print_rejections(report)
+    if report["failed_fragments"]:
+        write_rejections(report, json_path)
+        print(f"📝 Rejected fragments saved to: {json_path}")
+
+def report_chunk_checks(checks, json_path: str):
+    """Prints the silent or truncated chunks of a render and saves them to json_path, if there are any"""
+    if not checks:
+        return
+    report = checks.report()
+    print_chunk_checks(report)
+    if report["suspect_chunks"]:
+        write_chunk_checks(report, json_path)
+        print(f"📝 Suspect chunks saved to: {json_path}")
+
+def render_range(ssml_file_path: str, output_path: str, selector: str, chunk_size: int = DEFAULT_CHUNK_SIZE, *,
+                 split_chapters: bool = False, dedupe_phrases: bool = False, pronunciations: str = None,
+                 pronunciation_format: str = "ipa", postprocess=None, hedge=None, voice_segments: bool = False,
+                 workers: int = DEFAULT_WORKERS, minify: bool = False, cache=None, client=None,
+                 rejections=None, draft: bool = False, checks=None):
+    """
+    Renders only the requests of a full render that contain the selected
+    range (see ssml_range), for a quick preview. The requests are the ones
+    the full render sends, so with a cache the next full render reuses them.
+    """
+    try:
+        started = time.perf_counter()
+        if not check_client_pool(client):
+            return
+        content = read_ssml_content(ssml_file_path, pronunciations, pronunciation_format, draft)
+        engine = Synthesizer(chunk_size=chunk_size, postprocess=postprocess, hedge=hedge,
+                             concurrency=workers * pool_size(client), cache=cache, client=client,
+                             rejections=rejections, sample_rate=DRAFT_SAMPLE_RATE if draft else SAMPLE_RATE,
+                             checks=checks)
+
+        # Plan exactly as the full render would
+        if split_chapters:
+            plan = [item for chapter in chapters.split_chapters(content)
+                    for item in engine.plan_ssml(chapter["ssml"], dedupe_phrases, voice_segments, minify)]
+        else:
+            plan = engine.plan_ssml(content, dedupe_phrases, voice_segments, minify)
+        plan, info = range_plan(content, plan, selector)
+        print(f"🎯 Range '{selector}' is in {info['requests']} of {info['total_requests']} requests")
+        if not plan_requests(plan):
+            print("❌ The range has nothing to synthesize.")
             return
 
-        combined_audio = sum(audio_segments)
+        duration_seconds = engine.render(plan, output_path)
+        if cache:
+            print_cache_stats(cache.stats())
+        report_rejections(rejections, f"{os.path.splitext(output_path)[0]}.rejected.json")
+        report_chunk_checks(checks, f"{os.path.splitext(output_path)[0]}.suspect.json")
+        print(f"⚡ {duration_seconds:.1f}s of audio in {time.perf_counter() - started:.1f}s, saved to '{output_path}'")
+        return duration_seconds
 
-        print(f"\nStep 5: Saving final audio file to '{output_path}'...")
-        combined_audio.export(output_path, format="mp3")
+    except FileNotFoundError:
+        print(f"❌ Error: The file '{ssml_file_path}' was not found.")
+    except ValueError as e:
+        print(f"❌ {e}")
+    except Exception as e:
+        print(f"❌ An unexpected error occurred: {e}")
 
-        # Calculate duration
-        duration_seconds = len(combined_audio) / 1000
-        duration_minutes = duration_seconds / 60
-        print(f"\n⏱️  Duration: {duration_minutes:.1f} minutes ({duration_seconds:.0f} seconds)")
-        print(f"🎉 Success! Audio saved to '{output_path}'")
+def plan_lanes(content: str, chunk_size: int, split_chapters: bool = False, dedupe_phrases: bool = False,
+               voice_segments: bool = False, minify: bool = False):
+    """
+    Chunks content the way a render would and returns (lanes, silence_ms):
+    one list of request descriptions per independent pipeline.
+    """
+    if split_chapters:
+        sections = [chapter["ssml"] for chapter in chapters.split_chapters(content)]
+    else:
+        sections = [content]
+
+    lanes = []
+    silence_ms = 0
+    for section in sections:
+        plan, _ = build_plan(section, chunk_size, dedupe_phrases, voice_segments, minify)
+        # Repeated phrases are only requested once
+        unique_items = {(item.get("voice"), item["ssml"]): item for item in plan_requests(plan)}
+        requests = [describe_plan_item(item) for item in unique_items.values()]
+        if voice_segments and not split_chapters:
+            lanes.extend([request] for request in requests)  # Requests of one file run in parallel
+        else:
+            lanes.append(requests)
+        silence_ms += sum(item.get("silence_ms", 0) for item in plan)
+    return lanes, silence_ms
+
+def render_concurrency(split_chapters: bool, workers: int, voice_segments: bool = False, pool_size: int = 1,
+                       draft: bool = False):
+    """How many requests (or chapters, with split_chapters) a render runs at once"""
+    # Chunks of one file are synthesized in order unless voice segments are
+    # on or it is a draft; chapters run in parallel with their chunks in
+    # order. Each extra credential in a pool adds its own quota, so
+    # requests scale with it.
+    if split_chapters:
+        return workers
+    return (workers if voice_segments or draft else 1) * pool_size
+
+def pool_size(client):
+    """Number of credentials behind a client (1 unless it is a ClientPool)"""
+    return len(client) if isinstance(client, ClientPool) else 1
+
+def open_client_pool(credential_files, time_pointing: bool = False, requests_per_minute: int = None,
+                     characters_per_minute: int = None):
+    """
+    A ClientPool over several credential files, or None for a single file
+    (the default client reads GOOGLE_APPLICATION_CREDENTIALS). The pool is
+    health-checked by check_client_pool once the preflight has passed.
+    """
+    if len(credential_files) < 2:
+        return None
+    return ClientPool(credential_files, time_pointing, requests_per_minute, characters_per_minute)
+
+def check_client_pool(client):
+    """
+    Health-checks a ClientPool (one list_voices per credential). Returns
+    False if no credential passed; other clients are not checked.
+    """
+    if not isinstance(client, ClientPool):
+        return True
+    results = client.check()
+    for name, error in results.items():
+        print(f"🔑 {name}: {'ok' if error is None else f'failed health check ({error})'}")
+    if all(error is not None for error in results.values()):
+        print("❌ No credential in the pool passed the health check - no requests were sent.")
+        return False
+    return True
+
+def auto_chunk_size(ssml_file_path: str, workers: int = DEFAULT_WORKERS, split_chapters: bool = False,
+                    dedupe_phrases: bool = False, pronunciations: str = None, pronunciation_format: str = "ipa",
+                    voice_segments: bool = False, minify: bool = False, draft: bool = False):
+    """
+    Picks the chunk size with the lowest predicted render time for this
+    file, from the recorded per-voice latency and rejection history.
+    """
+    content = read_ssml_content(ssml_file_path, pronunciations, pronunciation_format, draft)
+    concurrency = render_concurrency(split_chapters, workers, voice_segments, draft=draft)
+    chunk_size, candidates = choose_chunk_size(
+        lambda size: plan_lanes(content, size, split_chapters, dedupe_phrases, voice_segments, minify)[0],
+        concurrency
+    )
+    best = next(candidate for candidate in candidates if candidate["chunk_size"] == chunk_size)
+    print(f"📐 Auto chunk size: {chunk_size} characters ({best['requests']} requests, "
+          f"~{best['predicted_wall_seconds']:.0f}s predicted at concurrency {concurrency}; "
+          f"{len(candidates)} sizes compared)")
+    return chunk_size
+
+def dry_run(ssml_file_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, *, workers: int = DEFAULT_WORKERS,
+            split_chapters: bool = False, dedupe_phrases: bool = False, pronunciations: str = None,
+            pronunciation_format: str = "ipa", json_path: str = None, voice_segments: bool = False,
+            minify: bool = False, draft: bool = False):
+    """
+    Runs the real pronunciation and chunking stages and estimates requests,
+    billed characters, cost and render time without touching the network.
+    """
+    try:
+        content = read_ssml_content(ssml_file_path, pronunciations, pronunciation_format, draft)
+        lanes, silence_ms = plan_lanes(content, chunk_size, split_chapters, dedupe_phrases, voice_segments, minify)
+        report = estimate_render(lanes, chunk_size,
+                                 render_concurrency(split_chapters, workers, voice_segments, draft=draft), silence_ms)
+        report["input"] = ssml_file_path
+        print_estimate(report)
+
+        if json_path:
+            write_estimate(report, json_path)
+            print(f"\n📝 Plan saved to: {json_path}")
+        return report
 
     except FileNotFoundError:
         print(f"❌ Error: The file '{ssml_file_path}' was not found.")
     except Exception as e:
         print(f"❌ An unexpected error occurred: {e}")
 
-def main():
+def export_paths(output_path: str, formats):
+    """Paths for the formats (e.g. ["opus", "m4b"]) other than output_path's own"""
+    base = os.path.splitext(output_path)[0]
+    own = output_format(output_path)
+    return [f"{base}.{name}" for name in dict.fromkeys(formats) if output_format(f"x.{name}") != own]
+
+def formats_arg(value):
+    """argparse type for --formats: comma-separated audio formats"""
+    formats = [name.strip().lower() for name in value.split(",") if name.strip()]
+    unknown = [name for name in formats if name not in FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown format {', '.join(unknown)} (choose from {', '.join(FORMATS)})")
+    return formats
+
+def chunk_size_arg(value):
+    """argparse type for --chunk-size: a number of characters or auto"""
+    if value == "auto":
+        return value
+    try:
+        size = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number of characters or 'auto', got '{value}'")
+    if not 0 < size <= API_LIMIT:
+        raise argparse.ArgumentTypeError(f"must be between 1 and {API_LIMIT} (the API's request limit), got {size}")
+    return size
+
+def main(argv=None, clients=None):
+    """
+    Runs the converter with command-line arguments (argv, or sys.argv).
+    clients(credential_files, time_pointing, requests_per_minute,
+    characters_per_minute) can supply ready-made clients, as tts_daemon does.
+    """
     parser = argparse.ArgumentParser(
+        prog="tts_converter.py",
         description="Convert SSML files to audio using Google Cloud Text-to-Speech",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
@@ -181,8 +603,35 @@ Examples:
   # Use smaller chunk size for testing
   python tts_converter.py input.ssml --chunk-size 2000
 
+  # Pick the chunk size with the lowest predicted render time
+  python tts_converter.py input.ssml --chunk-size auto
+
   # Set custom credentials file
   python tts_converter.py input.ssml --credentials my-creds.json
+
+  # Spread requests over the quotas of several projects
+  python tts_converter.py input.ssml --credentials project-a.json project-b.json project-c.json
+
+  # One MP3 per chapter plus a chapter manifest, four chapters at a time
+  python tts_converter.py input.ssml --split-chapters -o chapters/ --workers 4
+
+  # Chirp HD voices: one voice per request, selected by name, four requests at a time
+  python tts_converter.py lantern_path_chirp.ssml --voice-segments --workers 4
+
+  # Quick, cheap preview while editing: Standard voices, 16 kHz, everything in parallel
+  python tts_converter.py input.ssml --draft -o draft.mp3
+
+  # Estimate requests, cost and render time without calling the API
+  python tts_converter.py input.ssml --dry-run --json plan.json
+
+  # Cut tail latency by hedging slow requests (at most 10% extra requests)
+  python tts_converter.py input.ssml --hedge --hedge-budget 0.1
+
+  # Even out loudness between voices and smooth chunk joins
+  python tts_converter.py input.ssml --postprocess --lufs -18
+
+  # Re-render only chapter 3 and rebuild the single file with chapter markers
+  python tts_converter.py input.ssml --split-chapters -o chapters/ --chapters 3 --combined book.m4b
         """
     )
 
@@ -193,40 +642,353 @@ Examples:
 
     parser.add_argument(
         "-o", "--output",
-        help="Output MP3 file path (default: input_file.mp3)",
+        help="Output MP3 file path, or directory with --split-chapters (default: input_file.mp3)",
         default=None
     )
 
     parser.add_argument(
         "-c", "--chunk-size",
-        type=int,
+        type=chunk_size_arg,
         default=DEFAULT_CHUNK_SIZE,
-        help=f"Maximum characters per chunk (default: {DEFAULT_CHUNK_SIZE}, max: 5000)"
+        help=f"Maximum characters per chunk, or 'auto' to pick the fastest size from the request history "
+             f"(default: {DEFAULT_CHUNK_SIZE}, max: {API_LIMIT})"
+    )
+
+    parser.add_argument(
+        "--pronunciations",
+        metavar="CSV",
+        help="Apply this pronunciation dictionary before chunking (see apply_pronunciations.py)"
+    )
+
+    parser.add_argument(
+        "--pronunciation-format",
+        choices=["ipa", "alias"],
+        default="ipa",
+        help="Pronunciation format for --pronunciations (default: ipa)"
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Estimate requests, billed characters, cost and render time without calling the API"
+    )
+
+    parser.add_argument(
+        "--draft",
+        action="store_true",
+        help=f"Preview render: every voice replaced by a Standard voice of the same locale and gender, "
+             f"{DRAFT_SAMPLE_RATE // 1000} kHz audio, no post-processing, at least {DRAFT_WORKERS} parallel requests"
+    )
+
+    parser.add_argument(
+        "--json",
+        metavar="FILE",
+        help="With --dry-run, also write the estimate as JSON"
+    )
+
+    parser.add_argument(
+        "--dedupe-phrases",
+        action="store_true",
+        help="Synthesize sentences repeated in the same voice once and reuse their audio"
+    )
+
+    parser.add_argument(
+        "--postprocess",
+        action="store_true",
+        help="Trim silence and crossfade at chunk joins, then normalize loudness"
+    )
+
+    parser.add_argument(
+        "--lufs",
+        type=float,
+        default=DEFAULT_LUFS,
+        help=f"With --postprocess, integrated loudness target in LUFS (default: {DEFAULT_LUFS})"
+    )
+
+    parser.add_argument(
+        "--normalize",
+        choices=["voice", "global"],
+        default="voice",
+        help="With --postprocess, match loudness per voice or apply one gain to everything (default: voice). "
+             "Gain is set per chunk: a chunk with several voices gets one gain for its set of voices, "
+             "so use --voice-segments for exact per-voice gain"
+    )
+
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate of any request that runs past the usual p95 latency and keep the faster one"
+    )
+
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=DEFAULT_PERCENTILE,
+        help=f"With --hedge, latency percentile that triggers a duplicate (default: {DEFAULT_PERCENTILE:g})"
+    )
+
+    parser.add_argument(
+        "--hedge-budget",
+        type=float,
+        default=DEFAULT_MAX_EXTRA,
+        help=f"With --hedge, maximum extra requests as a fraction of all requests (default: {DEFAULT_MAX_EXTRA:g})"
+    )
+
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="Strip insignificant whitespace and merge adjacent blocks of the same voice before chunking"
+    )
+
+    parser.add_argument(
+        "--range",
+        metavar="SELECTOR",
+        help="Render only part of the document for a preview: chapter:N[-M], p:N[-M] (paragraphs, from 1) "
+             "or an XPath such as /voice[5] or //voice[@name='en-GB-Wavenet-D']"
+    )
+
+    parser.add_argument(
+        "--cache",
+        nargs="?",
+        const=CACHE_DIR,
+        metavar="DIR",
+        help=f"Keep synthesized chunks in DIR (default: {CACHE_DIR}) for later renders; "
+             f"--range always fills the cache, and renders reuse it whenever it exists"
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither reuse nor store cached chunks"
+    )
+
+    parser.add_argument(
+        "--profile-memory",
+        metavar="FILE",
+        help="Record peak memory and top allocation sites per stage and write them to FILE as JSON"
+    )
+
+    parser.add_argument(
+        "--formats",
+        type=formats_arg,
+        default=[],
+        metavar="LIST",
+        help="Also write these formats next to the output, from the same samples, e.g. mp3,opus,m4b"
+    )
+
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        help="ffmpeg processes for the final encode, each taking one segment of the book "
+             "(default: one per CPU core)"
+    )
+
+    parser.add_argument(
+        "--rate-variants",
+        type=rate_list,
+        default=[],
+        metavar="RATES",
+        help="Also write copies sped up or slowed down to these speaking rates, e.g. 1.25,0.85 "
+             "(book_1.25x.mp3, ...), time-stretched locally from the same audio"
+    )
+
+    parser.add_argument(
+        "--captions",
+        action="store_true",
+        help="Mark every sentence and also write .vtt/.srt captions and a .seek.json seek index "
+             "next to the audio (ignored with --range)"
+    )
+
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="Stop at the first chunk the API rejects, instead of splitting it to isolate the bad fragment"
+    )
+
+    parser.add_argument(
+        "--no-chunk-check",
+        action="store_true",
+        help="Don't check chunks for near-silence or audio cut short (checked chunks are requested again "
+             "and reported if they stay suspect)"
+    )
+
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Stop before the first request if the preflight check finds any errors or warnings "
+             "(as ssml_lint.py --strict does)"
+    )
+
+    parser.add_argument(
+        "--voice-segments",
+        action="store_true",
+        help="Send each run of the same voice with that voice selected by name and no <voice> tags "
+             "(needed for Chirp HD voices); runs are synthesized in parallel"
+    )
+
+    parser.add_argument(
+        "--split-chapters",
+        action="store_true",
+        help="Render each chapter to its own file in the output directory (default: input_file_chapters/)"
+    )
+
+    parser.add_argument(
+        "--chapters",
+        type=int,
+        nargs="+",
+        metavar="N",
+        help="With --split-chapters, render only these chapter numbers"
+    )
+
+    parser.add_argument(
+        "--combined",
+        metavar="FILE",
+        help="With --split-chapters, also join the chapters into one .mp3/.m4b file with chapter markers"
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --split-chapters, re-render chapters even if they are unchanged"
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of chapters rendered in parallel, or requests with --voice-segments "
+             f"(default: {DEFAULT_WORKERS})"
     )
 
     parser.add_argument(
         "--credentials",
-        default=DEFAULT_CREDENTIALS,
-        help=f"Google Cloud credentials JSON file (default: {DEFAULT_CREDENTIALS})"
+        nargs="+",
+        default=[DEFAULT_CREDENTIALS],
+        help=f"Google Cloud credentials JSON file (default: {DEFAULT_CREDENTIALS}). Give several, "
+             f"ideally from different projects, to spread requests over their quotas"
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--quota-rpm",
+        type=int,
+        help="Requests per minute allowed per credential; with several credentials, each one stops "
+             "getting requests at this rate instead of waiting for quota errors"
+    )
+
+    parser.add_argument(
+        "--quota-cpm",
+        type=int,
+        help="Characters per minute allowed per credential (see --quota-rpm)"
+    )
+
+    args = parser.parse_args(argv)
 
     # Set credentials
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.credentials
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = args.credentials[0]
 
     # Determine output filename if not specified
     if args.output is None:
         base_name = os.path.splitext(args.input)[0]
-        args.output = f"{base_name}.mp3"
-
-    # Validate chunk size
-    if args.chunk_size > 5000:
-        print("⚠️  Warning: Chunk size > 5000 may cause API errors. Using 4500.")
-        args.chunk_size = 4500
+        if args.range:
+            args.output = f"{base_name}_range.mp3"
+        else:
+            args.output = f"{base_name}_chapters" if args.split_chapters else f"{base_name}.mp3"
+
+    if args.draft:
+        args.postprocess = False
+        args.workers = max(args.workers, DRAFT_WORKERS)
+        print(f"📝 Draft mode: Standard voices at {DRAFT_SAMPLE_RATE // 1000} kHz, no post-processing, "
+              f"{args.workers} parallel requests")
+        try:
+            _, mapping = draft_ssml(read_ssml_content(args.input))
+            print_draft_voices(mapping)
+        except OSError:
+            pass  # Reported by the render
+
+    if args.chunk_size == "auto":
+        try:
+            args.chunk_size = auto_chunk_size(args.input, args.workers, args.split_chapters, args.dedupe_phrases,
+                                              args.pronunciations, args.pronunciation_format, args.voice_segments,
+                                              args.minify, args.draft)
+        except FileNotFoundError:
+            print(f"❌ Error: The file '{args.input}' was not found.")
+            return
+        except Exception as e:
+            print(f"⚠️  Could not pick a chunk size automatically ({e}). Using {DEFAULT_CHUNK_SIZE}.")
+            args.chunk_size = DEFAULT_CHUNK_SIZE
+
+    postprocess = None
+    if args.postprocess:
+        postprocess = {"lufs": args.lufs, "per_voice": args.normalize == "voice"}
+
+    hedge = None
+    if args.hedge and not args.dry_run:
+        hedge = HedgePolicy(args.hedge_percentile, args.hedge_budget,
+                            max_workers=2 * max(1, args.workers) * len(args.credentials))
+
+    cache = None
+    if not args.no_cache and not args.dry_run:
+        cache = open_cache(args.cache, write=bool(args.cache or args.range))
+
+    rejections = None if args.fail_fast else RejectionPolicy()
+    checks = None if args.no_chunk_check else ChunkCheck()
+
+    client = None
+    if not args.dry_run:
+        try:
+            client = (clients or open_client_pool)(args.credentials, args.captions and not args.range,
+                                                   args.quota_rpm, args.quota_cpm)
+        except Exception as e:
+            print(f"❌ Could not set up the credentials: {e}")
+            return
 
     # Run the conversion
-    synthesize_ssml(args.input, args.output, args.chunk_size)
+    if args.dry_run:
+        dry_run(args.input, args.chunk_size, workers=args.workers, split_chapters=args.split_chapters,
+                dedupe_phrases=args.dedupe_phrases, pronunciations=args.pronunciations,
+                pronunciation_format=args.pronunciation_format, json_path=args.json,
+                voice_segments=args.voice_segments, minify=args.minify, draft=args.draft)
+    elif args.range:
+        render_range(args.input, args.output, args.range, args.chunk_size,
+                     split_chapters=args.split_chapters, dedupe_phrases=args.dedupe_phrases,
+                     pronunciations=args.pronunciations, pronunciation_format=args.pronunciation_format,
+                     postprocess=postprocess, hedge=hedge, voice_segments=args.voice_segments,
+                     workers=args.workers, minify=args.minify, cache=cache, client=client,
+                     rejections=rejections, draft=args.draft, checks=checks)
+    elif args.split_chapters:
+        if args.profile_memory:
+            print("⚠️  --profile-memory profiles single-file renders; chapters overlap, so it is ignored here.")
+        if args.formats:
+            print("⚠️  --formats applies to single-file renders; chapters are saved as MP3 (use --combined for M4B).")
+        if args.rate_variants:
+            print("⚠️  --rate-variants applies to single-file renders; it is ignored with --split-chapters.")
+        only = set(args.chapters) if args.chapters else None
+        synthesize_chapters(args.input, args.output, args.chunk_size, workers=args.workers,
+                            only=only, combined_path=args.combined, force=args.force,
+                            dedupe_phrases=args.dedupe_phrases, pronunciations=args.pronunciations,
+                            pronunciation_format=args.pronunciation_format, postprocess=postprocess,
+                            hedge=hedge, voice_segments=args.voice_segments, minify=args.minify,
+                            strict=args.strict, cache=cache, captions=args.captions, client=client,
+                            rejections=rejections, draft=args.draft, checks=checks)
+    else:
+        profiler = MemoryProfiler().start() if args.profile_memory else None
+        synthesize_ssml(args.input, args.output, args.chunk_size, dedupe_phrases=args.dedupe_phrases,
+                        pronunciations=args.pronunciations, pronunciation_format=args.pronunciation_format,
+                        postprocess=postprocess, hedge=hedge, voice_segments=args.voice_segments,
+                        workers=args.workers, minify=args.minify, strict=args.strict, profiler=profiler,
+                        cache=cache, captions=args.captions, client=client,
+                        exports=export_paths(args.output, args.formats), encode_workers=args.encode_workers,
+                        rejections=rejections, rate_variants=args.rate_variants, draft=args.draft,
+                        checks=checks)
+        if profiler:
+            report = profiler.write(args.profile_memory, input=args.input,
+                                    input_bytes=os.path.getsize(args.input) if os.path.exists(args.input) else None,
+                                    chunk_size=args.chunk_size, postprocess=bool(postprocess),
+                                    voice_segments=args.voice_segments, workers=args.workers)
+            print_memory_summary(report)
+            print(f"📝 Memory profile saved to: {args.profile_memory}")
+    if hedge:
+        hedge.close()
 
 if __name__ == "__main__":
     main()
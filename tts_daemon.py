@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Warm render daemon
+
+Keeps the Text-to-Speech clients (gRPC channels and credentials), the
+google-cloud imports and the voice settings loaded, and runs tts_converter
+jobs sent over a local Unix socket. tts_client.py submits a job and streams
+its output back, so a small render starts its first request milliseconds
+after the command is run instead of seconds.
+
+Protocol: the client sends one JSON line, {"argv": [...], "cwd": "..."} for
+a job or {"command": "status" | "shutdown"}, and reads JSON lines back:
+{"stdout": text}, {"stderr": text} and finally {"exit": code}. Jobs run one
+at a time in the client's working directory; later jobs wait their turn.
+"""
+
+import os
+import json
+import importlib
+import time
+import argparse
+import threading
+import contextlib
+import socketserver
+
+from tts_client import DEFAULT_SOCKET
+
+class WarmClients:
+    """
+    Text-to-Speech clients kept open between jobs, one per set of
+    credentials, API version and quota settings.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, credential_files, time_pointing: bool = False, requests_per_minute: int = None,
+                 characters_per_minute: int = None):
+        from synthesizer import texttospeech_api
+        from tts_converter import open_client_pool
+
+        paths = tuple(os.path.abspath(path) for path in credential_files)
+        key = (paths, time_pointing, requests_per_minute, characters_per_minute)
+        with self._lock:
+            if key not in self._clients:
+                client = open_client_pool(list(paths), time_pointing, requests_per_minute, characters_per_minute)
+                if client is None:
+                    client = texttospeech_api(time_pointing).TextToSpeechClient.from_service_account_file(paths[0])
+                self._clients[key] = client
+            return self._clients[key]
+
+    def describe(self):
+        with self._lock:
+            return [{"credentials": [os.path.basename(path) for path in paths], "time_pointing": time_pointing}
+                    for paths, time_pointing, _, _ in self._clients]
+
+class _LineWriter:
+    """A text stream that sends everything written to it as JSON lines on a socket"""
+
+    def __init__(self, send, stream):
+        self._send = send
+        self._stream = stream
+        self._buffer = ""
+
+    def write(self, text):
+        self._buffer += text
+        if "\n" in self._buffer:
+            lines, self._buffer = self._buffer.rsplit("\n", 1)
+            self._send({self._stream: lines + "\n"})
+        return len(text)
+
+    def flush(self):
+        if self._buffer:
+            self._send({self._stream: self._buffer})
+            self._buffer = ""
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, credential_files):
+        super().__init__(socket_path, JobHandler)
+        os.chmod(socket_path, 0o600)
+        self.clients = WarmClients()
+        self.credential_files = credential_files
+        self.job_lock = threading.Lock()
+        self.started = time.time()
+        self.jobs = 0
+        self.waiting = 0
+
+    def warm_up(self):
+        """Loads the converter, the API modules and the default client before the first job"""
+        importlib.import_module("tts_converter")  # and everything a job imports
+        from synthesizer import synthesis_settings
+
+        synthesis_settings()
+        synthesis_settings(time_pointing=True)
+        self.clients(self.credential_files)
+
+class JobHandler(socketserver.StreamRequestHandler):
+    def send(self, message):
+        try:
+            self.wfile.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.wfile.flush()
+        except OSError:
+            pass  # The client went away; the job still finishes
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self.send({"stderr": "❌ Invalid request\n", "exit": 2})
+            return
+
+        server = self.server
+        command = request.get("command")
+        if command == "status":
+            self.send({"status": {
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - server.started, 1),
+                "jobs": server.jobs,
+                "waiting": server.waiting,
+                "clients": server.clients.describe(),
+            }, "exit": 0})
+            return
+        if command == "shutdown":
+            self.send({"stdout": "👋 Daemon stopping\n", "exit": 0})
+            threading.Thread(target=server.shutdown).start()
+            return
+
+        self.send({"exit": self.run_job(request.get("argv", []), request.get("cwd"))})
+
+    def run_job(self, argv, cwd):
+        """Runs tts_converter with argv in cwd, streaming its output; returns the exit code"""
+        import tts_converter
+
+        server = self.server
+        if not server.job_lock.acquire(blocking=False):
+            server.waiting += 1
+            self.send({"stdout": "⏳ Waiting for the running job to finish...\n"})
+            server.job_lock.acquire()
+            server.waiting -= 1
+        stdout, stderr = _LineWriter(self.send, "stdout"), _LineWriter(self.send, "stderr")
+        previous = os.getcwd()
+        code = 0
+        try:
+            server.jobs += 1
+            os.chdir(cwd or previous)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    tts_converter.main(argv, clients=server.clients)
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                except Exception as e:
+                    print(f"❌ An unexpected error occurred: {e}")
+                    code = 1
+        finally:
+            stdout.flush()
+            stderr.flush()
+            os.chdir(previous)
+            server.job_lock.release()
+        return code
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep tts_converter warm and run jobs sent by tts_client.py over a Unix socket"
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET,
+        help=f"Unix socket to listen on (default: $TTS_DAEMON_SOCKET or {DEFAULT_SOCKET})"
+    )
+    parser.add_argument(
+        "--credentials",
+        nargs="+",
+        help="Credentials to open a client for at start-up (default: tts_converter's default)"
+    )
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        # A socket file left by a daemon that did not shut down cleanly
+        import socket
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(args.socket)
+            print(f"❌ A daemon is already listening on {args.socket}")
+            return
+        except OSError:
+            os.remove(args.socket)
+        finally:
+            probe.close()
+
+    from tts_converter import DEFAULT_CREDENTIALS
+    credential_files = args.credentials or [DEFAULT_CREDENTIALS]
+    server = DaemonServer(args.socket, credential_files)
+    try:
+        started = time.perf_counter()
+        try:
+            server.warm_up()
+        except Exception as e:
+            print(f"⚠️  Could not open a client for {', '.join(credential_files)} yet ({e})")
+        print(f"🔥 Warm in {time.perf_counter() - started:.1f}s, listening on {args.socket}")
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        print("👋 Daemon stopped")
+
+if __name__ == "__main__":
+    main()
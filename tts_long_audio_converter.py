@@ -1,8 +1,11 @@
 import os
-import io
-from google.cloud import texttospeech
+import argparse
 from dotenv import load_dotenv
-from pydub import AudioSegment
+
+from chunking import iter_file_chunks, text_plan
+from memory_profile import MemoryProfiler, print_summary as print_memory_summary
+from render_planner import describe_text_request, estimate_render, print_estimate, write_estimate
+from synthesizer import Synthesizer
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,67 +19,37 @@ OUTPUT_AUDIO_FILE = "spoken_story_final.mp3"
 
 # Voice configuration
 VOICE_NAME = "en-US-Studio-O"
-LANGUAGE_CODE = "en-US"
 
-# The maximum number of characters to send in a single API request
+# The maximum number of bytes (UTF-8) to send in a single API request.
+# Google's limit is 5000 bytes, so 4500 is a safe number.
 CHUNK_SIZE = 4500
 
-def text_to_chunks(text, chunk_size):
-    """Splits text into chunks of a specified size without breaking words."""
-    while text:
-        if len(text) <= chunk_size:
-            yield text
-            break
-        # Find the last space within the chunk size
-        last_space = text.rfind(' ', 0, chunk_size)
-        if last_space == -1:  # No spaces found, forced to break a word
-            last_space = chunk_size
-        
-        yield text[:last_space]
-        text = text[last_space:].lstrip()
-
-
-def synthesize_locally(text_file_path: str, output_path: str):
+
+def synthesize_locally(text_file_path: str, output_path: str, profiler=None):
     """
     Synthesizes speech from a long text file locally by chunking.
 
     Args:
         text_file_path (str): Local path to the text file.
         output_path (str): The path to save the final output MP3 file.
+        profiler: Optional MemoryProfiler recording memory use per stage.
     """
     try:
-        print(f"Step 1: Reading text from '{text_file_path}'...")
-        with open(text_file_path, "r", encoding="utf-8") as f:
-            long_text = f.read()
-        
-        client = texttospeech.TextToSpeechClient()
-        
-        # Configure the voice and audio format
-        voice = texttospeech.VoiceSelectionParams(language_code=LANGUAGE_CODE, name=VOICE_NAME)
-        audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
-        
-        print("Step 2: Splitting text into manageable chunks...")
-        chunks = list(text_to_chunks(long_text, CHUNK_SIZE))
-        print(f"✅ Text split into {len(chunks)} chunks.")
-
-        audio_segments = []
+        print(f"Step 1: Streaming text from '{text_file_path}'...")
+        if not os.path.exists(text_file_path):
+            raise FileNotFoundError(text_file_path)
+
+        engine = Synthesizer(voice_name=VOICE_NAME, chunk_size=CHUNK_SIZE)
+
+        # Chunks are produced while the file is read, at sentence boundaries,
+        # and only as far ahead of the synthesis as the requests in flight
+        print("Step 2: Splitting text into chunks at sentence boundaries as it is read...")
+        plan = text_plan(iter_file_chunks(text_file_path, CHUNK_SIZE), VOICE_NAME)
+
         print("\nStep 3: Synthesizing audio for each chunk...")
-        for i, chunk in enumerate(chunks):
-            print(f"  - Processing chunk {i + 1} of {len(chunks)}...")
-            synthesis_input = texttospeech.SynthesisInput(text=chunk)
-            response = client.synthesize_speech(
-                input=synthesis_input, voice=voice, audio_config=audio_config
-            )
-            # Load the audio data from the in-memory bytes
-            segment = AudioSegment.from_file(io.BytesIO(response.audio_content))
-            audio_segments.append(segment)
-
-        print("\nStep 4: Stitching audio segments together...")
-        combined_audio = sum(audio_segments)
-
-        print(f"\nStep 5: Saving final audio file to '{output_path}'...")
-        combined_audio.export(output_path, format="mp3")
-        
+        print(f"Step 4: Stitching audio and saving to '{output_path}'...")
+        engine.render(plan, output_path, profiler=profiler)
+
         print(f"\n🎉 Success! Your story has been saved to '{output_path}'.")
 
     except FileNotFoundError:
@@ -84,7 +57,50 @@ def synthesize_locally(text_file_path: str, output_path: str):
     except Exception as e:
         print(f"❌ An unexpected error occurred: {e}")
 
+def dry_run(text_file_path: str, json_path: str = None):
+    """
+    Runs the real chunker and estimates requests, billed characters, cost
+    and render time without touching the network.
+    """
+    try:
+        requests = [describe_text_request(chunk, VOICE_NAME) for chunk in iter_file_chunks(text_file_path, CHUNK_SIZE)]
+        report = estimate_render([requests], CHUNK_SIZE, concurrency=1)
+        report["input"] = text_file_path
+        print_estimate(report)
+        if json_path:
+            write_estimate(report, json_path)
+            print(f"\n📝 Plan saved to: {json_path}")
+        return report
+    except FileNotFoundError:
+        print(f"❌ Error: The file '{text_file_path}' was not found.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a long text file to audio with a single voice")
+    parser.add_argument("input", nargs="?", default=LOCAL_TEXT_FILE,
+                        help=f"Input text file (default: {LOCAL_TEXT_FILE})")
+    parser.add_argument("-o", "--output", default=OUTPUT_AUDIO_FILE,
+                        help=f"Output MP3 file (default: {OUTPUT_AUDIO_FILE})")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Estimate requests, billed characters, cost and render time without calling the API")
+    parser.add_argument("--json", metavar="FILE", help="With --dry-run, also write the estimate as JSON")
+    parser.add_argument("--profile-memory", metavar="FILE",
+                        help="Record peak memory and top allocation sites per stage and write them to FILE as JSON")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        dry_run(args.input, args.json)
+    else:
+        profiler = MemoryProfiler().start() if args.profile_memory else None
+        synthesize_locally(args.input, args.output, profiler)
+        if profiler:
+            report = profiler.write(args.profile_memory, input=args.input,
+                                    input_bytes=os.path.getsize(args.input) if os.path.exists(args.input) else None,
+                                    chunk_size=CHUNK_SIZE)
+            print_memory_summary(report)
+            print(f"📝 Memory profile saved to: {args.profile_memory}")
+
 
 if __name__ == "__main__":
-    synthesize_locally(LOCAL_TEXT_FILE, OUTPUT_AUDIO_FILE)
+    main()
 